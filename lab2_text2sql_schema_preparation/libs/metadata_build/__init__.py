@@ -0,0 +1,16 @@
+from .checkpoint import Checkpoint
+from .pipeline import build, apply_delta, translate_queries, summarize_tables, embed_summaries, embed_examples
+
+# Imported on first use: bedrock needs boto3, which the offline query log miner does without, and
+# query_log runs as `python -m libs.metadata_build.query_log`, which must not find it already imported
+_LAZY = {
+    "BedrockRunner": "bedrock", "RateLimiter": "bedrock",
+    "QueryLogMiner": "query_log", "normalize": "query_log", "fingerprint": "query_log", "read_log": "query_log"
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        from importlib import import_module
+        return getattr(import_module(f".{_LAZY[name]}", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,52 @@
+import argparse
+import json
+import logging
+import sys
+
+import boto3
+
+from .bedrock import BedrockRunner
+from .pipeline import build
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m libs.metadata_build",
+        description="Build table summaries and embeddings for the schema and example-query indexes. "
+                    "Run from lab2_text2sql_schema_preparation; rerun with the same --checkpoint-dir to resume "
+                    "or to rebuild only what changed. Update an index already loaded from the full files with "
+                    "libs.metadata_build.apply_delta(client, <checkpoint-dir>, <index>)."
+    )
+    parser.add_argument("--schema", default="../db_metadata/chinook_schema.json")
+    parser.add_argument("--queries", default="../db_metadata/chinook_sample_queries.sql")
+    parser.add_argument("--examples", default="../db_metadata/example_queries_temp.jsonl")
+    parser.add_argument("--summary-output", default="../db_metadata/chinook_detailed_schema_temp.json")
+    parser.add_argument("--schema-output", default="../db_metadata/chinook_detailed_schema.json")
+    parser.add_argument("--examples-output", default="../db_metadata/example_queries.jsonl")
+    parser.add_argument("--checkpoint-dir", default="../db_metadata/build_checkpoints")
+    parser.add_argument("--index-name", default="example_queries")
+    parser.add_argument("--schema-index-name", default="schema_descriptions")
+    parser.add_argument("--stages", default="queries,summaries,examples",
+                        help="Comma-separated: queries (SQL to questions), summaries, examples. Without queries, --examples is read as is")
+    parser.add_argument("--region", default=boto3.Session().region_name)
+    parser.add_argument("--llm-model", default="anthropic.claude-3-5-haiku-20241022-v1:0", help="Table summaries")
+    parser.add_argument("--translation-model", default="anthropic.claude-3-5-sonnet-20241022-v2:0")
+    parser.add_argument("--embed-model", default="amazon.titan-embed-text-v2:0")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--llm-rpm", type=float, default=50)
+    parser.add_argument("--embed-rpm", type=float, default=1000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    runner = BedrockRunner(args.region, args.llm_model, args.embed_model, args.llm_rpm, args.embed_rpm,
+                           max_connections=max(args.workers, 10))
+    report = build(runner, args.schema, args.examples, args.summary_output, args.schema_output, args.examples_output,
+                   args.checkpoint_dir, args.queries, args.index_name, args.schema_index_name, args.workers,
+                   tuple(args.stages.split(',')), args.translation_model)
+    print(json.dumps(report, indent=2))
+    if any(stage.get("failed") for stage in report.values() if isinstance(stage, dict)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import json
+import random
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+THROTTLING_ERRORS = {"ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException", "ModelNotReadyException"}
+
+
+class RateLimiter:
+    """Spaces call starts evenly so that no more than `rpm` begin per minute across all threads."""
+    def __init__(self, rpm):
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class BedrockRunner:
+    """
+    Thread-safe Bedrock access for the build: one client with a connection pool sized for the
+    workers, a rate limiter per model, and exponential backoff with jitter on throttling.
+    """
+    def __init__(self, region_name, llm_model, embed_model, llm_rpm=50, embed_rpm=1000,
+                 max_retries=8, base_backoff=1.0, max_connections=64):
+        retry_config = Config(
+            region_name=region_name,
+            retries={"max_attempts": 1, "mode": "standard"},
+            max_pool_connections=max_connections
+        )
+        self.client = boto3.client("bedrock-runtime", region_name=region_name, config=retry_config)
+        self.llm_model = llm_model
+        self.embed_model = embed_model
+        self.llm_limiter = RateLimiter(llm_rpm)
+        self.embed_limiter = RateLimiter(embed_rpm)
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.throttled = 0
+
+    def call(self, limiter, function, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire()
+            try:
+                return function(**kwargs)
+            except ClientError as e:
+                if e.response['Error']['Code'] not in THROTTLING_ERRORS or attempt == self.max_retries:
+                    raise
+                self.throttled += 1
+                time.sleep(min(self.base_backoff * 2 ** attempt, 60.0) * (0.5 + random.random() / 2))
+
+    def converse(self, sys_prompt, usr_prompt, model_id=None):
+        response = self.call(
+            self.llm_limiter,
+            self.client.converse,
+            modelId=model_id or self.llm_model,
+            messages=usr_prompt,
+            system=sys_prompt,
+            inferenceConfig={"temperature": 0.0, "topP": 0.1}
+        )
+        return response['output']['message']['content'][0]['text']
+
+    def embed(self, text):
+        response = self.call(
+            self.embed_limiter,
+            self.client.invoke_model,
+            modelId=self.embed_model,
+            body=json.dumps({"inputText": text})
+        )
+        return json.loads(response['body'].read())['embedding']
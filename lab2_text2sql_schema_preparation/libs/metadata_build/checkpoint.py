@@ -0,0 +1,60 @@
+import json
+import os
+import threading
+
+
+class Checkpoint:
+    """
+    Append-only JSONL of finished items keyed by `key`; the last record of a key wins. Every record
+    is flushed to disk as soon as it is written, so a rerun after throttling or a crash skips
+    everything already done. Records carry the `input_hash` they were built from.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = self.load()
+
+    def load(self):
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by an interrupted run
+                    continue
+                entries[record['key']] = record
+        return entries
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def fresh(self, key, input_hash):
+        """The record for `key` if it was built from the same inputs, else None."""
+        record = self.entries.get(key)
+        return record if record is not None and record.get('input_hash') == input_hash else None
+
+    def compact(self, keys):
+        """Rewrites the file with only the latest record of each key in `keys`."""
+        with self.lock:
+            self.entries = {key: record for key, record in self.entries.items() if key in keys}
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                for record in self.entries.values():
+                    file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(temp_path, self.path)
+
+    def add(self, key, **values):
+        record = {"key": key, **values}
+        with self.lock:
+            self.entries[key] = record
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+        return record
@@ -0,0 +1,362 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .checkpoint import Checkpoint
+from .prompts import (
+    EXTRACTION_SYS_PROMPT, TRANSLATION_SYS_PROMPT, SUMMARIZATION_SYS_PROMPT,
+    get_extraction_prompt, get_translation_prompt, get_summarization_prompt
+)
+
+MANIFEST_FILE = "manifest.json"
+
+
+def content_hash(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def load_schema(file_path):
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def load_sql_queries(file_path):
+    with open(file_path, 'r', encoding='utf-8') as file:
+        data = file.read()
+    return [query.strip() for query in data.split(';') if query.strip()]
+
+
+def load_examples(file_path):
+    examples = []
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                examples.append(json.loads(line))
+    return examples
+
+
+def iter_tables(schema):
+    for table_info in schema:
+        for table_name, table_desc in table_info.items():
+            yield table_name, table_desc
+
+
+def extract_descriptions(schema, tables, columns):
+    tables_lower = {table.lower() for table in tables}
+    columns_lower = {column.lower() for column in columns}
+
+    description = {
+        "table": {},
+        "column": {}
+    }
+    for table_name, table_info in iter_tables(schema):
+        if table_name.lower() in tables_lower:
+            description["table"][table_name] = table_info["table_desc"]
+            for col in table_info["cols"]:
+                if col["col"].lower() in columns_lower:
+                    description["column"][col["col"]] = col["col_desc"]
+    return description
+
+
+def search_table_queries(examples, table_name):
+    table_name_lower = table_name.lower()
+    return [example for example in examples if table_name_lower in example['query'].lower()]
+
+
+def example_key(example):
+    return hashlib.sha1(example['input'].encode('utf-8')).hexdigest()
+
+
+def example_id(example):
+    return content_hash([example['input'], example['query']])
+
+
+def run_parallel(items, function, workers, stage):
+    """Runs `function(key, item)` for every (key, item) pair; returns the keys that failed."""
+    failed = []
+    if not items:
+        logging.info(f"{stage}: nothing to rebuild")
+        return failed
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=stage) as executor:
+        futures = {executor.submit(function, key, item): key for key, item in items}
+        for count, future in enumerate(as_completed(futures), 1):
+            key = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failed.append(key)
+                logging.error(f"{stage}: {key} failed: {type(e).__name__}: {str(e)}")
+            if count % 10 == 0 or count == len(futures):
+                logging.info(f"{stage}: {count}/{len(futures)} done, {len(failed)} failed")
+    return failed
+
+
+def stage_report(pending, failed):
+    return {"rebuilt": len(pending) - len(failed), "failed": failed}
+
+
+def translate_queries(runner, schema, queries, checkpoint, workers, model_id=None):
+    """
+    SQL-to-question translation keyed by the hash of the SQL. The tables and columns a query uses
+    are extracted once; the question is translated again only when their descriptions change.
+    """
+    def translate(key, sql):
+        record = checkpoint.get(key)
+        if record is None:
+            used = json.loads(runner.converse(EXTRACTION_SYS_PROMPT, get_extraction_prompt(sql), model_id))
+            tables, columns = used["table"], used["column"]
+        else:
+            tables, columns = record["tables"], record["columns"]
+        description = extract_descriptions(schema, tables, columns)
+        question = runner.converse(TRANSLATION_SYS_PROMPT, get_translation_prompt(description, sql), model_id)
+        checkpoint.add(key, input_hash=content_hash(description), sql=sql, tables=tables, columns=columns, input=question)
+
+    pending = []
+    for sql in queries:
+        key = content_hash(sql)
+        record = checkpoint.get(key)
+        if record is None or not checkpoint.fresh(key, content_hash(extract_descriptions(schema, record["tables"], record["columns"]))):
+            pending.append((key, sql))
+    return stage_report(pending, run_parallel(pending, translate, workers, "translations"))
+
+
+def summary_inputs(table_name, table_desc, examples):
+    # The other tables in the prompt are context only; hashing them would re-summarize every
+    # table whenever any one of them changes
+    return {
+        "description": content_hash(table_desc.get("table_desc")),
+        "columns": content_hash(table_desc.get("cols")),
+        "examples": sorted(example_id(example) for example in search_table_queries(examples, table_name))
+    }
+
+
+def summarize_tables(runner, schema, examples, checkpoint, workers):
+    """Summarizes the tables whose description, columns or matching sample queries changed."""
+    all_tables_schema = json.dumps(schema, indent=2)
+
+    def summarize(table_name, item):
+        table_desc, inputs = item
+        matched_queries = search_table_queries(examples, table_name)
+        prompt = get_summarization_prompt(all_tables_schema, json.dumps(table_desc, indent=2), matched_queries)
+        checkpoint.add(table_name, input_hash=content_hash(inputs), inputs=inputs,
+                       table_summary=runner.converse(SUMMARIZATION_SYS_PROMPT, prompt))
+
+    pending, reasons = [], {}
+    for table_name, table_desc in iter_tables(schema):
+        inputs = summary_inputs(table_name, table_desc, examples)
+        if checkpoint.fresh(table_name, content_hash(inputs)):
+            continue
+        previous = checkpoint.get(table_name)
+        reasons[table_name] = ["new"] if previous is None else [name for name in inputs if previous["inputs"].get(name) != inputs[name]]
+        pending.append((table_name, (table_desc, inputs)))
+    for table_name, changed in reasons.items():
+        logging.info(f"summaries: {table_name} changed ({', '.join(changed)})")
+    return dict(stage_report(pending, run_parallel(pending, summarize, workers, "summaries")), changed=reasons)
+
+
+def embed_summaries(runner, schema, summaries, checkpoint, workers):
+    def embed(table_name, summary):
+        checkpoint.add(table_name, input_hash=content_hash(summary), embedding=runner.embed(summary))
+
+    pending = []
+    for table_name, _ in iter_tables(schema):
+        if table_name in summaries:
+            summary = summaries.get(table_name)["table_summary"]
+            if not checkpoint.fresh(table_name, content_hash(summary)):
+                pending.append((table_name, summary))
+    return stage_report(pending, run_parallel(pending, embed, workers, "summary-embeddings"))
+
+
+def embed_examples(runner, examples, checkpoint, workers):
+    # Keyed by the hash of the question itself, so only new or reworded questions are embedded
+    def embed(key, text):
+        checkpoint.add(key, embedding=runner.embed(text))
+
+    pending = {example_key(example): example['input'] for example in examples}
+    pending = [(key, text) for key, text in pending.items() if key not in checkpoint]
+    return stage_report(pending, run_parallel(pending, embed, workers, "example-embeddings"))
+
+
+def write_atomic(path, write):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        write(file)
+    os.replace(temp_path, path)
+
+
+def write_examples(examples, output_path):
+    def write(file):
+        for example in examples:
+            file.write(json.dumps({"input": example['input'], "query": example['query']}, ensure_ascii=False) + "\n")
+
+    write_atomic(output_path, write)
+
+
+def write_detailed_schema(schema, summaries, embeddings, summary_path, output_path):
+    """Same layout as the notebooks: a list of `{table_name: {..., table_summary[, table_summary_v]}}`."""
+    with_summaries, with_embeddings = [], []
+    for table_name, table_desc in iter_tables(schema):
+        if table_name not in summaries:
+            continue
+        described = dict(table_desc, table_summary=summaries.get(table_name)['table_summary'])
+        with_summaries.append({table_name: described})
+        if table_name in embeddings:
+            with_embeddings.append({table_name: dict(described, table_summary_v=embeddings.get(table_name)['embedding'])})
+
+    write_atomic(summary_path, lambda file: json.dump(with_summaries, file, ensure_ascii=False, indent=4))
+    write_atomic(output_path, lambda file: json.dump(with_embeddings, file, ensure_ascii=False, indent=4))
+    return len(with_embeddings)
+
+
+def schema_documents(schema, summaries, embeddings):
+    """`schema_descriptions` index documents, as the lab2 notebook builds them, keyed by table name."""
+    documents = {}
+    for table_name, table_desc in iter_tables(schema):
+        if table_name in summaries and table_name in embeddings:
+            documents[table_name] = {
+                "table_name": table_name,
+                "table_desc": table_desc["table_desc"],
+                "columns": [{"col_name": col["col"], "col_desc": col["col_desc"]} for col in table_desc["cols"]],
+                "table_summary": summaries.get(table_name)["table_summary"],
+                "table_summary_v": embeddings.get(table_name)["embedding"]
+            }
+    return documents
+
+
+def example_documents(examples, embeddings):
+    documents = {}
+    for example in examples:
+        record = embeddings.get(example_key(example))
+        if record is not None:
+            documents[example_id(example)] = {"input": example['input'], "query": example['query'], "input_v": record['embedding']}
+    return documents
+
+
+def write_bulk(path, index_name, documents):
+    """OpenSearch bulk NDJSON in the notebook format; ids are left to the index (serverless vector collections assign them)."""
+    def write(file):
+        for document in documents:
+            file.write(json.dumps({"index": {"_index": index_name}}, ensure_ascii=False) + "\n")
+            file.write(json.dumps(document, ensure_ascii=False) + "\n")
+
+    write_atomic(path, write)
+
+
+def write_delta(checkpoint_dir, manifest, index_name, documents, key_field):
+    """
+    Changes since the last applied delta as two files: `<index>_delta_delete.json`, a terms query on
+    the keyword `key_field` matching every stored document that changed or disappeared, and
+    `<index>_delta.jsonl`, plain index actions for the current documents with those keys.
+    Documents are tracked by content hash in the manifest, since the index assigns their ids. The
+    manifest only advances in `apply_delta`, so changes from builds that were never applied stay in
+    the delta; the first build seeds it, as its full bulk file is what gets loaded.
+    """
+    previous = manifest.get(index_name, {})
+    current = {doc_id: {"hash": content_hash(document), "key": document[key_field]} for doc_id, document in documents.items()}
+    stale = {entry["key"] for doc_id, entry in previous.items() if current.get(doc_id, {}).get("hash") != entry["hash"]}
+    stale |= {entry["key"] for doc_id, entry in current.items() if doc_id not in previous}
+    reindexed = [document for document in documents.values() if document[key_field] in stale]
+
+    delete_path = os.path.join(checkpoint_dir, f"{index_name}_delta_delete.json")
+    write_atomic(delete_path, lambda file: json.dump({"query": {"terms": {key_field: sorted(stale)}}}, file, ensure_ascii=False))
+    path = os.path.join(checkpoint_dir, f"{index_name}_delta.jsonl")
+    write_bulk(path, index_name, reindexed)
+    write_atomic(os.path.join(checkpoint_dir, f"{index_name}_delta_state.json"), lambda file: json.dump(current, file))
+    manifest.setdefault(index_name, current)
+    return {"file": path, "delete_file": delete_path, "keys": len(stale), "indexed": len(reindexed)}
+
+
+def apply_delta(client, checkpoint_dir, index_name):
+    """
+    Loads a delta into an index built from this pipeline's files: deletes the stale documents by
+    the ids a search returns, then bulk-indexes the replacements. Needs neither custom document
+    ids nor _delete_by_query, so it also works on serverless vector collections. The manifest
+    advances to the delta's state only when the bulk load reports no errors.
+    """
+    with open(os.path.join(checkpoint_dir, f"{index_name}_delta_delete.json"), 'r', encoding='utf-8') as file:
+        query = json.load(file)
+    deleted = 0
+    if query["query"]["terms"] and next(iter(query["query"]["terms"].values())):
+        hits = client.search(index=index_name, body={**query, "_source": False, "size": 10000})["hits"]["hits"]
+        if hits:
+            actions = "".join(json.dumps({"delete": {"_index": index_name, "_id": hit["_id"]}}) + "\n" for hit in hits)
+            client.bulk(body=actions)
+            deleted = len(hits)
+    with open(os.path.join(checkpoint_dir, f"{index_name}_delta.jsonl"), 'r', encoding='utf-8') as file:
+        bulk_data = file.read()
+    response = client.bulk(body=bulk_data) if bulk_data else {"errors": False}
+    if not response["errors"]:
+        with open(os.path.join(checkpoint_dir, f"{index_name}_delta_state.json"), 'r', encoding='utf-8') as file:
+            state = json.load(file)
+        manifest_path = os.path.join(checkpoint_dir, MANIFEST_FILE)
+        manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as file:
+                manifest = json.load(file)
+        manifest[index_name] = state
+        write_atomic(manifest_path, lambda file: json.dump(manifest, file))
+    return {"deleted": deleted, "indexed": bulk_data.count("\n") // 2, "errors": response["errors"]}
+
+
+def build(runner, schema_file, examples_file, summary_file, detailed_schema_file, example_bulk_file,
+          checkpoint_dir, queries_file=None, index_name="example_queries", schema_index_name="schema_descriptions",
+          workers=8, stages=("queries", "summaries", "examples"), translation_model=None):
+    """
+    Incremental metadata build. Every item records the hash of the inputs it was built from, and
+    only items whose inputs changed are rebuilt: sample queries are translated again when their SQL
+    or the descriptions they use change, tables are summarized again when their description,
+    columns or matching sample queries change, and vectors are recomputed only for changed text.
+    Full outputs keep the notebook formats; the `<index>_delta*` files hold just the changes (see `apply_delta`).
+    An output is left untouched while any of its items failed; a rerun finishes them.
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    schema = load_schema(schema_file)
+    report = {}
+    manifest_path = os.path.join(checkpoint_dir, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+
+    if "queries" in stages and queries_file:
+        translations = Checkpoint(os.path.join(checkpoint_dir, "translations.jsonl"))
+        queries = load_sql_queries(queries_file)
+        report["translations"] = translate_queries(runner, schema, queries, translations, workers, translation_model)
+        if report["translations"]["failed"]:
+            report["throttled"] = runner.throttled
+            return report
+        examples = [{"input": translations.get(content_hash(sql))["input"], "query": sql} for sql in queries]
+        write_examples(examples, examples_file)
+        translations.compact({content_hash(sql) for sql in queries})
+    else:
+        examples = load_examples(examples_file)
+
+    if "summaries" in stages:
+        summaries = Checkpoint(os.path.join(checkpoint_dir, "table_summaries.jsonl"))
+        summary_embeddings = Checkpoint(os.path.join(checkpoint_dir, "table_summary_embeddings.jsonl"))
+        report["summaries"] = summarize_tables(runner, schema, examples, summaries, workers)
+        report["summary_embeddings"] = embed_summaries(runner, schema, summaries, summary_embeddings, workers)
+        if not report["summaries"]["failed"] and not report["summary_embeddings"]["failed"]:
+            report["tables"] = write_detailed_schema(schema, summaries, summary_embeddings, summary_file, detailed_schema_file)
+            report["schema_delta"] = write_delta(checkpoint_dir, manifest, schema_index_name,
+                                                 schema_documents(schema, summaries, summary_embeddings), "table_name")
+            tables = {table_name for table_name, _ in iter_tables(schema)}
+            summaries.compact(tables)
+            summary_embeddings.compact(tables)
+
+    if "examples" in stages:
+        example_embeddings = Checkpoint(os.path.join(checkpoint_dir, "example_embeddings.jsonl"))
+        report["example_embeddings"] = embed_examples(runner, examples, example_embeddings, workers)
+        if not report["example_embeddings"]["failed"]:
+            documents = example_documents(examples, example_embeddings)
+            write_bulk(example_bulk_file, index_name, documents.values())
+            report["examples"] = len(documents)
+            # `query` is the keyword field of the example index; `input` is analyzed text
+            report["examples_delta"] = write_delta(checkpoint_dir, manifest, index_name, documents, "query")
+            example_embeddings.compact({example_key(example) for example in examples})
+
+    write_atomic(manifest_path, lambda file: json.dump(manifest, file))
+    report["throttled"] = runner.throttled
+    return report
@@ -0,0 +1,88 @@
+EXTRACTION_SYS_PROMPT = [{
+    "text": """
+You are an expert in extracting table names and column names from SQL queries.
+From the provided SQL query, extract all table names and column names used for SELECT, WHERE, and JOIN clauses, excluding asterisks ("*").
+Ensure that the response is in a valid JSON format that can be used directly with json.load().
+Skip the preamble and only provide the answer in a JSON document:
+
+{
+  "table": ["table1", "table2", ...],
+  "column": ["col1", "col2", ...]
+}
+
+<input>
+SQL:
+SELECT * from sample_table
+where sample_column like '%something%'
+LIMIT 200;
+</input>
+
+<output>
+{
+  "table": ["sample_table"],
+  "column": ["sample_column"]
+}
+</output>
+"""
+}]
+
+TRANSLATION_SYS_PROMPT = [{
+    "text": """
+You are an SQL expert who can understand the intent behind a given SQL query.
+Translate the SQL query into a natural language request that a real user might make.
+
+- Keep your translation concise and conversational, mimicking how an actual user would ask for the information sought by the query.
+- Do not reference the <description> section directly and do not use a question form.
+- Ensure to include all conditions specified in the SQL query in the request.
+- Skip the preamble and phrase only the natural language request using a concise and straightforward tone without a verb ending.
+"""
+}]
+
+SUMMARIZATION_SYS_PROMPT = [{
+    "text": """
+You are an SQL expert. Provide a concise summary of a specific database table in 200 characters or less. Include:
+
+1. Table's primary function
+2. Key relationships (primary/foreign keys)
+3. Unique role in the database context
+4. How it connects to other tables
+
+Focus on essential, non-redundant information that captures the table's core purpose and significance in the schema.
+"""
+}]
+
+
+def get_extraction_prompt(sql):
+    return [{
+        "role": "user",
+        "content": [{"text": f"SQL: \n{sql}"}]
+    }]
+
+
+def get_translation_prompt(description, sql):
+    return [{
+        "role": "user",
+        "content": [{"text": f"<description>\n{description}\n</description>\n\n SQL: {sql}"}]
+    }]
+
+
+def get_summarization_prompt(all_tables_schema, target_table_schema, sample_queries):
+    return [{
+        "role": "user",
+        "content": [{"text": f"""
+<all_tables>
+{all_tables_schema}
+</all_tables>
+
+<target_table>
+{target_table_schema}
+</target_table>
+
+<sample_queries>
+{sample_queries}
+</sample_queries>
+
+Based on the provided information about all tables in the database, the specific schema of the target table, and the sample queries, provide a concise summary and context for the target table.
+Follow the structure specified in your instructions, focusing on the table's role in the overall database and its unique characteristics.
+"""}]
+    }]
@@ -0,0 +1,357 @@
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+TOKEN = re.compile(r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*'|\$\$.*?\$\$)
+  | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`)
+  | (?P<param>\$\d+|%s|%\(\w+\)s|\?|:\w+)
+  | (?P<number>\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b|\.\d+\b)
+  | (?P<word>[A-Za-z_][\w$]*)
+  | (?P<unterminated>'|/\*|\$\$)
+  | (?P<op><>|<=|>=|!=|\|\||::|[^\s\w])
+  | (?P<space>\s+)
+""", re.S | re.X)
+
+SYSTEM_PREFIXES = ("pg_", "information_schema", "stl_", "stv_", "svl_", "svv_", "sys.", "sqlite_")
+READ_STATEMENTS = {"select", "with"}
+# Words that end a FROM item, so they are never taken for a table alias
+CLAUSE_WORDS = {"where", "join", "inner", "left", "right", "full", "cross", "outer", "natural", "on", "using", "group",
+                "order", "having", "limit", "offset", "fetch", "union", "except", "intersect", "window", "lateral"}
+# Words after which a `-` is a sign rather than a subtraction
+SIGN_WORDS = {"select", "where", "and", "or", "not", "on", "when", "then", "else", "in", "between", "by", "is", "like",
+              "having", "limit", "offset", "values", "return", "case", "all", "any", "some", "distinct"}
+
+
+def tokenize(sql):
+    """(kind, text) pairs without whitespace and comments."""
+    return [(match.lastgroup, match.group()) for match in TOKEN.finditer(sql)
+            if match.lastgroup not in ("space", "comment")]
+
+
+def normalize(tokens):
+    """
+    Canonical text of a statement: literals and bind parameters become `?`, unquoted words are
+    lower-cased, a sign is folded into the literal after it, and IN lists / VALUES rows collapse to
+    one element, so statements that differ only in literals share a fingerprint.
+    """
+    parts = []
+    for i, (kind, text) in enumerate(tokens):
+        if kind in ("number", "param") and is_sign(tokens, i - 1):
+            parts[-1] = "?"
+        elif kind in ("string", "number", "param"):
+            parts.append("?")
+        elif kind == "word":
+            parts.append(text.lower())
+        elif text != ";":
+            parts.append(text)
+    normalized = " ".join(parts)
+    normalized = re.sub(r"\?(?: , \?)+", "?", normalized)
+    return re.sub(r"\( \? \)(?: , \( \? \))+", "( ? )", normalized)
+
+
+def is_sign(tokens, i):
+    """Whether the token at `i` is a unary `-` or `+`."""
+    if i < 0 or tokens[i][1] not in ("-", "+"):
+        return False
+    if i == 0:
+        return True
+    kind, text = tokens[i - 1]
+    if kind == "op":
+        return text != ")"
+    return kind == "word" and text.lower() in SIGN_WORDS
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def dotted_name(tokens, i):
+    """The parts of a possibly schema-qualified name starting at `i`, and the index after it."""
+    parts = []
+    while i < len(tokens) and tokens[i][0] in ("word", "quoted"):
+        parts.append(tokens[i][1].strip('"`').lower())
+        if i + 2 < len(tokens) and tokens[i + 1][1] == "." and tokens[i + 2][0] in ("word", "quoted"):
+            i += 2
+            continue
+        return tuple(parts), i + 1
+    return None, i
+
+
+def referenced_tables(tokens):
+    """
+    Names after FROM and JOIN as tuples of their dotted parts (`schema.table` gives two), including
+    every item of a comma-separated FROM list.
+    """
+    tables = set()
+    i = 0
+    while i < len(tokens):
+        if tokens[i][0] != "word" or tokens[i][1].lower() not in ("from", "join"):
+            i += 1
+            continue
+        i += 1
+        while True:
+            name, i = dotted_name(tokens, i)
+            if name is None:
+                break
+            tables.add(name)
+            if i < len(tokens) and tokens[i][1].lower() == "as":
+                i += 1
+            if i < len(tokens) and tokens[i][0] in ("word", "quoted") and tokens[i][1].lower() not in CLAUSE_WORDS:
+                i += 1
+            if i < len(tokens) and tokens[i][1] == ",":
+                i += 1
+                continue
+            break
+    return tables
+
+
+def split_statements(lines):
+    """Splits a stream of SQL text on top-level semicolons, keeping an unfinished statement buffered."""
+    buffer = ""
+    for line in lines:
+        buffer += line
+        if ";" not in line:
+            continue
+        if not any(marker in buffer for marker in ("'", "--", "/*", "$$")):
+            *statements, buffer = buffer.split(";")
+            yield from (statement.strip() for statement in statements if statement.strip())
+            continue
+        tokens = list(TOKEN.finditer(buffer))
+        # An unterminated string or comment: wait for the lines that close it
+        if any(match.lastgroup == "unterminated" for match in tokens):
+            continue
+        start = 0
+        for match in tokens:
+            if match.group() == ";" and match.lastgroup == "op":
+                statement = buffer[start:match.start()].strip()
+                if statement:
+                    yield statement
+                start = match.end()
+        buffer = buffer[start:]
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def detect_format(path, header):
+    if path.endswith(".sql"):
+        return "sql"
+    columns = {column.strip().lower() for column in header}
+    if "querytxt" in columns:
+        return "stl_query"
+    if "query" in columns and "calls" in columns:
+        return "pg_stat_statements"
+    raise ValueError(f"Cannot tell the log format of {path} from its header: {sorted(columns)}")
+
+
+def read_log(path, log_format=None, delimiter=None):
+    """
+    Streams (statement, count) pairs from a plain SQL file, a `pg_stat_statements` export (`query`,
+    `calls`) or a Redshift `STL_QUERY` export (`querytxt`, one row per execution; aborted rows skipped).
+    """
+    csv.field_size_limit(sys.maxsize)
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as file:
+        if log_format == "sql" or (log_format is None and path.endswith(".sql")):
+            for statement in split_statements(file):
+                yield statement, 1
+            return
+
+        sample = file.read(65536)
+        file.seek(0)
+        if delimiter is None:
+            try:
+                delimiter = csv.Sniffer().sniff(sample, delimiters=",|\t").delimiter
+            except csv.Error:
+                delimiter = ","
+        reader = csv.DictReader(file, delimiter=delimiter)
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+        log_format = log_format or detect_format(path, reader.fieldnames)
+        for row in reader:
+            if log_format == "pg_stat_statements":
+                yield row["query"], int(float(row.get("calls") or 1))
+            elif str(row.get("aborted", "0")).strip() != "1":
+                yield row["querytxt"].strip(), 1
+
+
+class MinHashLSH:
+    """
+    Groups statements whose token 3-shingle sets have Jaccard similarity of at least `threshold`:
+    MinHash signatures bucketed by band, then confirmed with the exact similarity.
+    """
+    def __init__(self, threshold=0.8, permutations=64, bands=8, seed=0):
+        self.threshold = threshold
+        self.bands = bands
+        random = np.random.default_rng(seed)
+        self.a = random.integers(1, 2 ** 32, permutations, dtype=np.uint64) | np.uint64(1)
+        self.b = random.integers(0, 2 ** 32, permutations, dtype=np.uint64)
+
+    @staticmethod
+    def shingles(normalized):
+        tokens = normalized.split(" ")
+        if len(tokens) < 3:
+            return {normalized}
+        return {" ".join(tokens[i:i + 3]) for i in range(len(tokens) - 2)}
+
+    def signature(self, shingles):
+        hashes = np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64)
+        return ((np.outer(hashes, self.a) + self.b) >> np.uint64(32)).min(axis=0)
+
+    def clusters(self, normalized_texts):
+        """Lists of indexes into `normalized_texts`, one list per cluster."""
+        parent = list(range(len(normalized_texts)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        shingle_sets = [self.shingles(text) for text in normalized_texts]
+        buckets = defaultdict(list)
+        for index, shingles in enumerate(shingle_sets):
+            signature = self.signature(shingles)
+            for band, rows in enumerate(np.array_split(signature, self.bands)):
+                buckets[(band, rows.tobytes())].append(index)
+
+        for members in buckets.values():
+            for other in members[1:]:
+                first, second = find(members[0]), find(other)
+                if first == second:
+                    continue
+                left, right = shingle_sets[members[0]], shingle_sets[other]
+                if len(left & right) / len(left | right) >= self.threshold:
+                    parent[second] = first
+
+        groups = defaultdict(list)
+        for index in range(len(normalized_texts)):
+            groups[find(index)].append(index)
+        return list(groups.values())
+
+
+class QueryLogMiner:
+    """
+    Aggregates log statements by fingerprint, clusters near-duplicate fingerprints and picks one
+    representative per cluster: the original text of its most frequent fingerprint.
+    """
+    def __init__(self, tables=None, threshold=0.8):
+        self.tables = {table.lower() for table in tables} if tables else None
+        self.lsh = MinHashLSH(threshold)
+        self.fingerprints = {}
+        self.seen = 0
+        self.skipped = 0
+
+    def accept(self, tokens):
+        words = [text.lower() for kind, text in tokens if kind == "word"]
+        if not words or words[0] not in READ_STATEMENTS:
+            return False
+        names = referenced_tables(tokens)
+        if any(".".join(name).startswith(SYSTEM_PREFIXES) for name in names):
+            return False
+        return self.tables is None or any(name[-1] in self.tables for name in names)
+
+    def add(self, statement, count=1):
+        self.seen += count
+        tokens = tokenize(statement)
+        if not self.accept(tokens):
+            self.skipped += count
+            return
+        normalized = normalize(tokens)
+        key = fingerprint(normalized)
+        entry = self.fingerprints.get(key)
+        if entry is None:
+            entry = self.fingerprints[key] = {"fingerprint": key, "normalized": normalized, "count": 0, "example": None}
+        entry["count"] += count
+        # The example goes into a `;`-separated file, so one with a semicolon in a literal is passed over
+        if entry["example"] is None and ";" not in statement:
+            entry["example"] = " ".join(statement.split())
+
+    def clusters(self):
+        entries = list(self.fingerprints.values())
+        clusters = []
+        for members in self.lsh.clusters([entry["normalized"] for entry in entries]):
+            members = sorted((entries[index] for index in members), key=lambda entry: (-entry["count"], entry["fingerprint"]))
+            representative = next((entry for entry in members if entry["example"]), None)
+            if representative is None:
+                continue
+            clusters.append({
+                "weight": sum(entry["count"] for entry in members),
+                "representative": representative["example"],
+                "fingerprint": representative["fingerprint"],
+                "fingerprints": len(members),
+                "members": [{k: entry[k] for k in ("fingerprint", "count", "normalized")} for entry in members[:10]]
+            })
+        return sorted(clusters, key=lambda cluster: (-cluster["weight"], cluster["fingerprint"]))
+
+    def select(self, top=None, min_count=1):
+        """Representative clusters by descending frequency; only these go on to translation and embedding."""
+        selected = [cluster for cluster in self.clusters() if cluster["weight"] >= min_count]
+        return selected[:top] if top else selected
+
+
+def load_schema_tables(schema_file):
+    with open(schema_file, "r", encoding="utf-8") as file:
+        schema = json.load(file)
+    return [table_name for table_info in schema for table_name in table_info]
+
+
+def write_outputs(clusters, miner, sql_path, report_path):
+    temp_path = f"{sql_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(";\n".join(cluster["representative"] for cluster in clusters) + (";\n" if clusters else ""))
+    os.replace(temp_path, sql_path)
+    report = {
+        "statements": miner.seen,
+        "skipped": miner.skipped,
+        "fingerprints": len(miner.fingerprints),
+        "selected": len(clusters),
+        "clusters": clusters
+    }
+    with open(report_path, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m libs.metadata_build.query_log",
+        description="Mine representative read queries from query logs. The SQL output feeds "
+                    "`python -m libs.metadata_build --queries <output>` for translation and embedding."
+    )
+    parser.add_argument("logs", nargs="+", help="Plain .sql files, pg_stat_statements or STL_QUERY CSV exports")
+    parser.add_argument("--format", choices=["sql", "pg_stat_statements", "stl_query"], help="Default: detected per file")
+    parser.add_argument("--delimiter", help="CSV delimiter (default: sniffed from , | and tab)")
+    parser.add_argument("--schema", default="../db_metadata/chinook_schema.json",
+                        help="Keep statements that read at least one of these tables; pass '' to keep all")
+    parser.add_argument("--output", default="../db_metadata/mined_queries.sql")
+    parser.add_argument("--report", help="Cluster report (default: <output>.json)")
+    parser.add_argument("--top", type=int, default=200, help="Number of representative queries to keep")
+    parser.add_argument("--min-count", type=int, default=1)
+    parser.add_argument("--similarity", type=float, default=0.8, help="Jaccard threshold for near-duplicates")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    miner = QueryLogMiner(load_schema_tables(args.schema) if args.schema else None, args.similarity)
+    for path in args.logs:
+        for statement, count in read_log(path, args.format, args.delimiter):
+            miner.add(statement, count)
+        logging.info(f"{path}: {miner.seen} statements so far, {len(miner.fingerprints)} fingerprints")
+
+    clusters = miner.select(args.top, args.min_count)
+    report_path = args.report or os.path.splitext(args.output)[0] + ".json"
+    report = write_outputs(clusters, miner, args.output, report_path)
+    print(json.dumps({k: report[k] for k in ("statements", "skipped", "fingerprints", "selected")}, indent=2))
+    print(f"Queries written to {args.output}, clusters to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
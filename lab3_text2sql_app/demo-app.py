@@ -3,9 +3,8 @@ import boto3
 from typing import Dict, Tuple, List, Union
 from src.db_utils import DB_Tool_Client
 from src.insight_utils import analyze_main
-from src.common_utils import load_model_config, load_language_config, display_chat_messages, update_tokens_and_costs, calculate_and_display_costs, ToolStreamHandler
+from src.common_utils import load_model_config, load_language_config, display_chat_messages, update_tokens_and_costs, calculate_and_display_costs, init_opensearch, ToolStreamHandler, StreamlitCallbacks
 from src.models import calculate_cost_from_tokens
-from src.opensearch import init_opensearch
 
 
 st.set_page_config(page_title='Bedrock AI Chatbot', page_icon="🤖", layout="wide")
@@ -119,7 +118,7 @@ def main() -> None:
         with assistant_placeholder.container():
             with st.chat_message("assistant"):
                 history = parse_conversation_history(st.session_state.messages[1:][-3:])
-                db_client = DB_Tool_Client(model_info, database_config, st.session_state['language_select'], sql_os_client, schema_os_client, prompt, history)
+                db_client = DB_Tool_Client(model_info, database_config, st.session_state['language_select'], sql_os_client, schema_os_client, prompt, history, StreamlitCallbacks())
                 with st.expander("Scratchpad (Click to expand)", expanded=True): 
                     response_placeholder = st.empty()  
                     callback = ToolStreamHandler(response_placeholder)
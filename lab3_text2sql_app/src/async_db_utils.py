@@ -0,0 +1,640 @@
+import asyncio
+import inspect as pyinspect
+import json
+import logging
+from contextlib import AsyncExitStack
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import boto3
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+from opensearchpy import AsyncOpenSearch, AsyncHttpConnection, AWSV4SignerAsyncAuth
+from sqlalchemy import inspect, select, text as sql_text, Table, MetaData
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+
+from .bedrock_gateway import get_gateway, AsyncBedrockClient
+from .callbacks import NullStreamHandler
+from .config import load_pipeline_config
+from .db_utils import DB_ToolState, init_compactor, get_table_info, _schema_linkers, _join_graphs
+from .json_stream import StreamingJSONExtractor, JSONParseError
+from .opensearch import load_opensearch_config, knn_query, to_documents
+from .schema_linker import SchemaLinker
+from .tracing import tracer
+from .transport import make_async_bedrock_client, make_async_opensearch_connection
+from .join_graph import JoinGraph
+from .prompts import (
+    get_table_selection_prompt,
+    get_query_generation_prompt,
+    get_query_validation_prompt,
+    get_answer_generation_prompt,
+    get_global_prompt
+)
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+    'mariadb': 'mariadb+aiomysql'
+}
+
+# Async engines own connection pools bound to the running event loop, so they are shared per worker
+_async_engines = {}
+
+
+def to_async_uri(uri: str) -> str:
+    scheme, rest = uri.split('://', 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+
+def get_async_engine(uri: str) -> AsyncEngine:
+    if uri not in _async_engines:
+        _async_engines[uri] = create_async_engine(to_async_uri(uri))
+    return _async_engines[uri]
+
+
+async def close_stream(stream):
+    close = getattr(stream, 'close', None)
+    if close is not None:
+        result = close()
+        if pyinspect.isawaitable(result):
+            await result
+
+
+class AsyncBedrockClients:
+    """
+    Bedrock runtime and agent runtime clients on a shared aiohttp connection pool.
+    Calls are admitted by the shared gateway limiters and follow the transport mode, like the sync clients.
+    Use as `async with AsyncBedrockClients(region) as clients:` once per worker.
+    """
+    def __init__(self, region: str, priority: str = "interactive"):
+        self.region = region
+        self.priority = priority
+        self.gateway = get_gateway(region)
+        self.config = self.gateway.client_config(AioConfig)
+        self.session = get_session()
+        self.exit_stack = AsyncExitStack()
+        self.runtime = None
+        self.agent_runtime = None
+
+    def create_client(self, service: str):
+        return self.exit_stack.enter_async_context(self.session.create_client(service, region_name=self.region, config=self.config))
+
+    async def __aenter__(self):
+        runtime = await make_async_bedrock_client("bedrock-runtime", self.region, lambda: self.create_client("bedrock-runtime"))
+        agent_runtime = await make_async_bedrock_client("bedrock-agent-runtime", self.region, lambda: self.create_client("bedrock-agent-runtime"))
+        self.runtime = self.agent_runtime = AsyncBedrockClient(self.gateway, runtime, agent_runtime, self.priority)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.exit_stack.aclose()
+
+
+class AsyncOpenSearchClient:
+    def __init__(self, region_name, index_name, vector, output, pool_maxsize=100):
+        self.index_name = index_name
+        self.vector = vector
+        self.output = output
+        self.conn = make_async_opensearch_connection(lambda: self.connect(region_name, pool_maxsize))
+
+    def connect(self, region_name, pool_maxsize):
+        config = load_opensearch_config()
+
+        credentials = boto3.Session().get_credentials()
+        auth = AWSV4SignerAsyncAuth(credentials, region_name, 'aoss')
+
+        host = config['COLLECTION_ENDPOINT'].replace("https://", "").split(':')[0]
+
+        return AsyncOpenSearch(
+            hosts=[{'host': host, 'port': 443}],
+            http_auth=auth,
+            use_ssl=True,
+            verify_certs=True,
+            connection_class=AsyncHttpConnection,
+            pool_maxsize=pool_maxsize
+        )
+
+    async def close(self):
+        await self.conn.close()
+
+
+class AsyncOpenSearchVectorRetriever:
+    def __init__(self, os_client: AsyncOpenSearchClient, bedrock_runtime, k=5):
+        self.emb_model = "amazon.titan-embed-text-v2:0"
+        self.os_client = os_client
+        self.bedrock_runtime = bedrock_runtime
+        self.k = k
+
+    async def _embedding(self, input_text):
+        with tracer.span("embedding", model=self.emb_model):
+            response = await self.bedrock_runtime.invoke_model(
+                modelId=self.emb_model,
+                body=json.dumps({"inputText": input_text})
+            )
+            async with response['body'] as body:
+                return json.loads(await body.read())['embedding']
+
+    async def vector_search(self, input_text, index_name):
+        embedding = await self._embedding(input_text)
+        with tracer.span("knn", index=index_name, k=self.k) as span:
+            result = await self.os_client.conn.search(index=index_name, body=knn_query(self.os_client.vector, embedding, self.k))
+            span.set(hits=len(result['hits']['hits']))
+        return to_documents(result, self.os_client.output)
+
+
+async def stream_converse_messages(client, model, tool_config, messages, system, callback, tokens):
+    response = await client.converse_stream(
+        modelId=model,
+        messages=messages,
+        system=system,
+        toolConfig=tool_config
+    )
+
+    stop_reason = ""
+    message = {"content": []}
+    text = ''
+    tool_use = {}
+
+    stream = response['stream']
+    try:
+        async for chunk in stream:
+            if 'messageStart' in chunk:
+                message['role'] = chunk['messageStart']['role']
+            elif 'contentBlockStart' in chunk:
+                tool = chunk['contentBlockStart']['start']['toolUse']
+                tool_use['toolUseId'] = tool['toolUseId']
+                tool_use['name'] = tool['name']
+            elif 'contentBlockDelta' in chunk:
+                delta = chunk['contentBlockDelta']['delta']
+                if 'toolUse' in delta:
+                    if 'input' not in tool_use:
+                        tool_use['input'] = ''
+                    tool_use['input'] += delta['toolUse']['input']
+                elif 'text' in delta:
+                    text += delta['text']
+                    callback.on_llm_new_token(delta['text'])
+            elif 'contentBlockStop' in chunk:
+                if 'input' in tool_use:
+                    tool_use['input'] = json.loads(tool_use['input'])
+                    message['content'].append({'toolUse': tool_use})
+                    tool_use = {}
+                else:
+                    message['content'].append({'text': text})
+                    text = ''
+            elif 'messageStop' in chunk:
+                stop_reason = chunk['messageStop']['stopReason']
+            elif 'metadata' in chunk:
+                tokens['total_input_tokens'] += chunk['metadata']['usage']['inputTokens']
+                tokens['total_output_tokens'] += chunk['metadata']['usage']['outputTokens']
+    finally:
+        # Releases the HTTP connection when the question is cancelled mid-stream
+        await close_stream(stream)
+    callback.flush()
+    return stop_reason, message
+
+
+async def converse_stream_json(client, model: str, messages: List[Dict], system: List[Dict], tokens: Dict,
+                               on_field: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Any]:
+    response = await client.converse_stream(modelId=model, messages=messages, system=system)
+    extractor = StreamingJSONExtractor()
+    stream = response['stream']
+    try:
+        async for chunk in stream:
+            if 'contentBlockDelta' in chunk:
+                delta = chunk['contentBlockDelta']['delta']
+                if 'text' in delta:
+                    for key, value in extractor.feed(delta['text']):
+                        if on_field:
+                            on_field(key, value)
+            elif 'metadata' in chunk:
+                tokens['total_input_tokens'] += chunk['metadata']['usage']['inputTokens']
+                tokens['total_output_tokens'] += chunk['metadata']['usage']['outputTokens']
+    finally:
+        await close_stream(stream)
+    return extractor.result()
+
+
+class AsyncSQLDatabase:
+    def __init__(self, engine: AsyncEngine, uri: str):
+        self.engine = engine
+        self.uri = uri
+
+    async def run_sync(self, fn, *args):
+        async with self.engine.connect() as conn:
+            return await conn.run_sync(fn, *args)
+
+    async def run(self, query: str) -> Union[str, List[Dict[str, Any]]]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(sql_text(query))
+            rows = result.fetchall()
+
+        if not rows:
+            return ""
+
+        return [dict(row._mapping) for row in rows]
+
+    async def get_table_info(self, table_names: List[str], profile=None) -> str:
+        return await self.run_sync(get_table_info, table_names, None, profile)
+
+    async def get_usable_table_names(self) -> List[str]:
+        return await self.run_sync(lambda conn: inspect(conn).get_table_names())
+
+    async def get_join_graph(self, refresh: bool = False) -> JoinGraph:
+        # Keyed like the sync SQLDatabase so both paths share one graph per database
+        key = str(make_url(self.uri))
+        if refresh or key not in _join_graphs:
+            _join_graphs[key] = await self.run_sync(JoinGraph.from_engine)
+        return _join_graphs[key]
+
+    async def get_tables_with_samples(self, table_names: List[str], limit: int, skip_samples=()):
+        def load(conn):
+            missing_tables = set(table_names) - set(inspect(conn).get_table_names())
+            if missing_tables:
+                raise ValueError(f"table_names {missing_tables} not found in database")
+            metadata = MetaData()
+            tables = [Table(table_name, metadata, autoload_with=conn) for table_name in table_names]
+            samples = {table.name: [dict(row._mapping) for row in conn.execute(select(table).limit(limit)).fetchall()]
+                       for table in tables if table.name not in skip_samples}
+            return tables, samples
+        return await self.run_sync(load)
+
+
+class AsyncDB_Tools(DB_ToolState):
+    """
+    asyncio counterpart of DB_Tools with the same tools and tool state.
+
+    Bedrock, OpenSearch and database calls are awaited on shared clients, so one worker can keep
+    many questions in flight. Metadata builds (join graph, linker, value index) run through
+    `run_sync` and share the module caches of the sync path.
+    """
+    def __init__(self, tokens: dict, uri: str, dialect: str, model: str, region: str, clients: AsyncBedrockClients,
+                 sql_os_client: AsyncOpenSearchClient, schema_os_client: AsyncOpenSearchClient, language: str, prompt: str,
+                 exclude_own_sample: bool = False):
+        self.tokens = tokens
+        self.exclude_own_sample = exclude_own_sample
+        self.uri = uri
+        self.dialect = dialect
+        self.model = model
+        self.region = region
+        self.language = language
+        self.clients = clients
+        self.sql_os_client = sql_os_client
+        self.schema_os_client = schema_os_client
+        self.engine = get_async_engine(uri)
+        self.db = AsyncSQLDatabase(self.engine, uri)
+        self.prompt = prompt
+        self.pipeline_config = load_pipeline_config()
+        self.init_tool_state(prompt)
+        self.samples = []
+        self.retry = 0
+        self.plan_prefetch = {}
+        self.pending = set()
+
+    @classmethod
+    async def create(cls, *args, **kwargs):
+        tool = cls(*args, **kwargs)
+        tool.samples = await tool.get_sample_queries()
+        return tool
+
+    def spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+        return task
+
+    def cancel_pending(self):
+        for task in list(self.pending):
+            task.cancel()
+
+    async def get_sample_queries(self):
+        sql_os_retriever = AsyncOpenSearchVectorRetriever(self.sql_os_client, self.clients.runtime, k=10)
+        samples = await sql_os_retriever.vector_search(self.prompt, self.sql_os_client.index_name)
+        page_contents = self.without_own_sample([json.loads(doc.page_content) for doc in samples])
+        with tracer.span("rerank", documents=len(page_contents)) as span:
+            response = await self.clients.agent_runtime.rerank(**self.rerank_request(page_contents))
+            span.set(results=len(response['results']))
+        return self.reranked_samples(page_contents, response)
+
+    async def get_table_summaries_by_similarities(self):
+        schema_os_retriever = AsyncOpenSearchVectorRetriever(self.schema_os_client, self.clients.runtime, k=5)
+        matched_tables = await schema_os_retriever.vector_search(self.prompt, self.schema_os_client.index_name)
+        return json.dumps([json.loads(document.page_content) for document in matched_tables], ensure_ascii=False)
+
+    async def get_schema_descriptions(self) -> Dict[str, Dict]:
+        response = await self.schema_os_client.conn.search(index=self.schema_os_client.index_name, body=self.schema_descriptions_query())
+        return self.schema_descriptions(response)
+
+    async def get_column_description(self, table_name: str) -> Dict[str, str]:
+        response = await self.schema_os_client.conn.search(index=self.schema_os_client.index_name, body=self.column_description_query(table_name))
+        return self.column_descriptions(response)
+
+    async def get_value_index(self):
+        index_config = self.pipeline_config.get('value_index', {})
+        if not index_config.get('enabled', True):
+            return None
+        try:
+            value_index = await asyncio.to_thread(self.load_value_index, index_config)
+            fresh = self.claim_value_index_refresh(value_index, index_config)
+            if fresh is not None:
+                try:
+                    refreshed = await self.db.run_sync(fresh.refresh)
+                    await asyncio.to_thread(self.save_value_index, fresh, refreshed)
+                    value_index = fresh
+                finally:
+                    self.release_value_index_refresh()
+            return value_index
+        except Exception as e:
+            logging.error(f"Error in get_value_index: {str(e)}")
+            return None
+
+    async def get_value_hints(self) -> str:
+        value_index = await self.get_value_index()
+        if not value_index:
+            return "None"
+        return value_index.format_hints(value_index.lookup(self.prompt)) or "None"
+
+    async def get_schema_linker(self):
+        key = (self.uri, self.schema_os_client.index_name)
+        if key not in _schema_linkers:
+            linking_config = self.pipeline_config.get('schema_linking', {})
+            try:
+                descriptions = await self.get_schema_descriptions()
+            except Exception as e:
+                logging.warning(f"Schema descriptions unavailable for linking: {str(e)}")
+                descriptions = {}
+            value_index = await self.get_value_index()
+            join_graph = await self.db.get_join_graph()
+            _schema_linkers[key] = await self.db.run_sync(lambda conn: SchemaLinker.from_database(
+                conn,
+                descriptions,
+                join_graph=join_graph,
+                categorical_values=value_index.categorical_values() if value_index else None,
+                skip_threshold=linking_config.get('skip_threshold', 0.8),
+                max_tables=linking_config.get('max_tables', 5)
+            ))
+        return _schema_linkers[key]
+
+    async def link_schema(self):
+        if not self.pipeline_config.get('schema_linking', {}).get('enabled', True):
+            return None
+        if self.tool_state["failure_log"] != "None":
+            return None
+        try:
+            link = (await self.get_schema_linker()).link(self.prompt)
+        except Exception as e:
+            logging.error(f"Error in link_schema: {str(e)}")
+            return None
+        logging.info(f"Schema linking: tables={link.tables}, confidence={link.confidence}, skip_llm={link.skip_llm}")
+        return link
+
+    async def get_table_schemas(self, table_names: List[str]) -> Dict[str, Dict]:
+        try:
+            tables = [t.strip() for t in table_names]
+            data, descs = await asyncio.gather(
+                self.db.get_table_info(tables, self.load_db_profile()),
+                asyncio.gather(*(self.get_column_description(table) for table in tables))
+            )
+            if not data:
+                logging.warning("No data returned from DB")
+                return {}
+            return self.table_schemas(tables, data, dict(zip(tables, descs)))
+        except Exception as e:
+            logging.error(f"Error in get_table_schemas: {str(e)}")
+            return {}
+
+    async def get_schema_context(self, table_names: List[str], join_graph: JoinGraph):
+        builder = self.schema_context_builder()
+        try:
+            names = [t.strip() for t in table_names]
+            profile = self.load_db_profile()
+            (tables, sample_rows), descs = await asyncio.gather(
+                self.db.get_tables_with_samples(names, builder.sample_rows, profile.tables if profile else ()),
+                asyncio.gather(*(self.get_column_description(name) for name in names))
+            )
+            col_descs = dict(zip(names, descs))
+            schema_context = builder.build(self.prompt, tables, col_descs, sample_rows, self.engine.dialect,
+                                           join_graph.join_columns(table_names), profile)
+        except Exception as e:
+            logging.error(f"Error in get_schema_context: {str(e)}")
+            return await self.get_table_schemas(table_names)
+        return self.record_schema_context(schema_context)
+
+    async def query_generation(self, input: str): # dummy input
+        combined_log = self.combined_log()
+
+        # Table Selection
+        with tracer.span("table_selection", tokens=self.tokens) as span:
+            link = await self.link_schema()
+            if link and link.skip_llm:
+                table_names = link.tables
+                span.set(method="lexical", confidence=link.confidence)
+            else:
+                table_summaries = await self.get_table_summaries_by_similarities()
+                sys_prompt, usr_prompt = get_table_selection_prompt(table_summaries, self.prompt, self.samples, combined_log)
+                response = await self.clients.runtime.converse(modelId=self.model, messages=usr_prompt, system=sys_prompt)
+                self.update_tokens(response)
+                table_names = response['output']['message']['content'][0]['text'].split(',')
+                span.set(method="llm", confidence=link.confidence if link else None)
+
+            join_graph = await self.db.get_join_graph()
+            table_names = join_graph.close([t.strip() for t in table_names if t.strip()])
+            join_hints = "\n".join(join_graph.join_hints(table_names)) or "None"
+            span.set(tables=len(table_names))
+
+        with tracer.span("schema_context"):
+            if self.pipeline_config.get('schema_context', {}).get('enabled', True):
+                schema_task = self.get_schema_context(table_names, join_graph)
+            else:
+                schema_task = self.get_table_schemas(table_names)
+            value_hints, table_schemas = await asyncio.gather(self.get_value_hints(), schema_task)
+
+        sys_prompt, usr_prompt = get_query_generation_prompt(self.samples, self.dialect, table_schemas, join_hints, value_hints, self.language, self.prompt, combined_log)
+        with tracer.span("generation", tokens=self.tokens, retry=self.retry) as span:
+            try:
+                return await converse_stream_json(self.clients.runtime, self.model, usr_prompt, sys_prompt, self.tokens, self.prefetch_query_plan)
+            except JSONParseError as e:
+                span.fail(f"{type(e).__name__}: {e}")
+                return {"error": str(e), "error_type": type(e).__name__}
+
+    def prefetch_query_plan(self, key, value):
+        if key == "query" and isinstance(value, str) and value not in self.plan_prefetch and self.can_prefetch_plan():
+            self.plan_prefetch[value] = self.spawn(self.db.run(self.get_explain_query(value)))
+
+    async def get_query_plan(self, query: str):
+        task = self.plan_prefetch.pop(query, None)
+        with tracer.span("explain", prefetched=task is not None):
+            if task is not None:
+                return await task
+            return await self.db.run(self.get_explain_query(query))
+
+    async def validate_and_run_queries(self, generated_query: str):
+        self.tool_state["initial_query"] = generated_query
+        try:
+            query_plan = await self.get_query_plan(generated_query)
+        except Exception as e:
+            return self.query_failure_handling(f"[E01] An error occurred while generating the EXPLAIN query: {str(e)}", generated_query)
+
+        execution = {}
+        def execute_final_query(key, value):
+            if key == "final_query" and isinstance(value, str) and "task" not in execution:
+                execution["task"] = self.spawn(self.db.run(value))
+
+        try:
+            with tracer.span("validation", tokens=self.tokens, retry=self.retry):
+                sys_prompt, usr_prompt = get_query_validation_prompt(self.dialect, query_plan, generated_query, self.language, self.prompt)
+                parsed_json = await converse_stream_json(self.clients.runtime, self.model, usr_prompt, sys_prompt, self.tokens, execute_final_query)
+                query = parsed_json.get("final_query")
+                if not isinstance(query, str):
+                    raise JSONParseError("'final_query' is missing from the model output.")
+        except Exception as e:
+            if "task" in execution:
+                execution["task"].cancel()
+            return self.query_failure_handling(f"[E02] An issue unrelated to the query was encountered: {str(e)} (Model-related problem)", generated_query)
+
+        try:
+            with tracer.span("execution", early_start="task" in execution, retry=self.retry) as span:
+                result = await execution["task"] if "task" in execution else await self.db.run(query)
+                span.set(rows=len(result))
+        except Exception as e:
+            return self.query_failure_handling(f"[E03] An error occurred while executing the final query: {str(e)}", query)
+
+        return await asyncio.to_thread(self.record_query_result, query, result)
+
+    async def schema_explorer(self, keyword: str):
+        response = await self.schema_os_client.conn.search(
+            index=self.schema_os_client.index_name,
+            body=self.schema_explorer_query(keyword)
+        )
+        return self.schema_explorer_result(keyword, response)
+
+    async def tool_router(self, tool, callback):
+        with callback.stage(f"Running Tool... ({tool['name']}, Retry: {self.retry})"), tracer.span(f"tool.{tool['name']}", retry=self.retry) as span:
+            if tool['name'] == 'query_generation':
+                res = await self.query_generation(tool['input']['input'])
+                tool_result = {"toolUseId": tool['toolUseId'], "content": [{"json": res}]}
+            elif tool['name'] == 'validate_and_run_queries':
+                res = await self.validate_and_run_queries(tool['input']['generated_query'])
+                tool_result = {"toolUseId": tool['toolUseId'], "content": [{"json": res}]}
+                self.update_retry_state(res)
+            elif tool['name'] == 'schema_exploration':
+                res = await self.schema_explorer(tool['input']['keyword'])
+                tool_result = {"toolUseId": tool['toolUseId'], "content": [{"json": res}]}
+            else:
+                tool_result = {"toolUseId": tool['toolUseId'], "content": [{"text": "Unknown tool name"}]}
+            if isinstance(tool_result["content"][0].get("json"), dict) and "failure_log" in tool_result["content"][0]["json"]:
+                span.fail(tool_result["content"][0]["json"]["failure_log"])
+
+        callback.on_llm_new_result(json.dumps({
+            "tool_name": tool['name'],
+            "content": tool_result["content"][0]
+        }))
+
+        return {"role": "user", "content": [{"toolResult": tool_result}]}
+
+
+class AsyncDB_Tool_Client:
+    def __init__(self, clients: AsyncBedrockClients, model_info, config, language, sql_os_client, schema_os_client, prompt):
+        self.clients = clients
+        self.model = model_info['model_id']
+        self.region = model_info['region_name']
+        self.uri = config['uri']
+        self.dialect = config['dialect']
+        self.exclude_own_sample = config.get('exclude_own_sample', False)
+        self.language = language
+        self.sql_os_client = sql_os_client
+        self.schema_os_client = schema_os_client
+        self.prompt = prompt
+        self.tool_config = self.load_tool_config()
+        self.tokens = {'total_input_tokens': 0, 'total_output_tokens': 0, 'total_tokens': 0, 'context_tokens_saved': 0, 'conversation_tokens_saved': 0}
+        self.db_tool = None
+        self.compactor = init_compactor(load_pipeline_config())
+
+    def load_tool_config(self):
+        with open("./src/db_tool_config.json", 'r') as file:
+            return json.load(file)
+
+    def compact(self, messages):
+        if self.compactor is None:
+            return messages
+        return self.compactor.prepare(messages, self.tokens)
+
+    def save_log(self, trace_id):
+        self.db_tool.tool_state['endtime'] = datetime.now().isoformat()
+        self.db_tool.tool_state['token_used'] = self.tokens['total_tokens']
+        self.db_tool.tool_state['trace_id'] = trace_id
+        logging.info(json.dumps(self.db_tool.tool_state, indent=4))
+
+    async def converse(self, stage, messages, sys_prompt, callback):
+        with tracer.span(stage, tokens=self.tokens, retry=self.db_tool.retry):
+            return await stream_converse_messages(self.clients.runtime, self.model, self.tool_config, messages, sys_prompt, callback, self.tokens)
+
+    async def invoke(self, callback=None):
+        callback = callback or NullStreamHandler()
+        with tracer.span("request", tokens=self.tokens, model=self.model, dialect=self.dialect) as span:
+            self.db_tool = await AsyncDB_Tools.create(self.tokens, self.uri, self.dialect, self.model, self.region, self.clients,
+                                                      self.sql_os_client, self.schema_os_client, self.language, self.prompt,
+                                                      self.exclude_own_sample)
+            callback.on_samples(self.db_tool.samples)
+            try:
+                sys_prompt, usr_prompt = get_global_prompt(self.language, self.prompt)
+                messages = usr_prompt
+                stop_reason, message = await self.converse("orchestration", self.compact(messages), sys_prompt, callback)
+                messages.append(message)
+
+                while stop_reason == "tool_use":
+                    for c in message["content"]:
+                        if "toolUse" not in c:
+                            continue
+                        messages.append(await self.db_tool.tool_router(c["toolUse"], callback))
+
+                    stop_reason, message = await self.converse("orchestration", self.compact(messages), sys_prompt, callback)
+                    messages.append(message)
+
+                final_sys_prompt, final_usr_prompt = get_answer_generation_prompt(self.language, self.db_tool.tool_state, self.compact(usr_prompt))
+                stop_reason, message = await self.converse("answer", final_usr_prompt, final_sys_prompt, callback)
+            finally:
+                # Prefetched plans and early executions must not outlive a cancelled question
+                self.db_tool.cancel_pending()
+
+            final_response = message['content'][0]['text']
+            self.tokens['total_tokens'] = self.tokens['total_input_tokens'] + self.tokens['total_output_tokens']
+            span.set(success=self.db_tool.tool_state["success"] == "True", retries=self.db_tool.retry,
+                     context_tokens_saved=self.tokens['context_tokens_saved'],
+                     conversation_tokens_saved=self.tokens['conversation_tokens_saved'])
+            self.save_log(span.trace.trace_id)
+        return final_response, self.tokens
+
+
+async def answer_questions(questions: List[str], model_info: Dict, config: Dict, language: str,
+                           callback_factory: Optional[Callable[[str], Any]] = None, max_concurrency: int = 100,
+                           priority: str = "batch") -> List[Dict]:
+    """
+    Answers many questions concurrently on one set of shared clients.
+    `max_concurrency` bounds the questions in flight; results keep the order of `questions`.
+    """
+    region = model_info['region_name']
+    sql_os_client = AsyncOpenSearchClient(region, 'example_queries', 'input_v', ["input", "query"])
+    schema_os_client = AsyncOpenSearchClient(region, 'schema_descriptions', 'table_summary_v', ["table_name", "table_summary"])
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async with AsyncBedrockClients(region, priority) as clients:
+        async def answer(question):
+            async with semaphore:
+                client = AsyncDB_Tool_Client(clients, model_info, config, language, sql_os_client, schema_os_client, question)
+                try:
+                    callback = callback_factory(question) if callback_factory else None
+                    response, tokens = await client.invoke(callback)
+                    return {"question": question, "response": response, "tokens": tokens, "tool_state": client.db_tool.tool_state}
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logging.error(f"Error answering '{question}': {str(e)}")
+                    return {"question": question, "error": str(e), "tokens": client.tokens}
+
+        try:
+            return await asyncio.gather(*(answer(question) for question in questions))
+        finally:
+            await sql_os_client.close()
+            await schema_os_client.close()
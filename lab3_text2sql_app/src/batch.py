@@ -0,0 +1,190 @@
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from .benchmark import Benchmark, summarize_results
+from .config import load_model_config
+from .transport import LIVE, RECORD, REPLAY, load_transport_config
+
+CHECKPOINT_FILE = "checkpoint.jsonl"
+
+# Set per worker process by init_worker (or once in the main process for the thread pool)
+_runner = None
+
+
+def load_batch(path: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Reads `{"question": ...}` lines (`input` is accepted too, as in the sample-query file).
+    `id` defaults to the line position; `gold_sql`, when present, is scored like the benchmark.
+    """
+    items = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'index' in record:
+                continue
+            question = record.get('question', record.get('input'))
+            if not question:
+                continue
+            item_id = str(record.get('id', f"q{len(items):05d}"))
+            items.append({"id": item_id, "question": question, "gold_sql": record.get('gold_sql', record.get('query'))})
+    ids = [item['id'] for item in items]
+    if len(ids) != len(set(ids)):
+        raise ValueError(f"Duplicate question ids in {path}")
+    return items[:limit] if limit else items
+
+
+def safe_name(item_id: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', item_id)
+
+
+def load_checkpoint(output_dir: str, retry_errors: bool = False) -> Set[str]:
+    """Ids already answered in an earlier run; failed ones are excluded when `retry_errors` is set."""
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted run
+                continue
+            if entry['status'] == "ok" or not retry_errors:
+                done.add(entry['id'])
+            else:
+                done.discard(entry['id'])
+    return done
+
+
+def init_worker(model_info: Dict, config: Dict, language: str):
+    # Engines, schema linkers, OpenSearch clients and embeddings are cached per process and
+    # shared by every question that process answers
+    global _runner
+    _runner = Benchmark(model_info, config, language)
+
+
+def answer(item: Dict[str, Any]) -> Dict[str, Any]:
+    result = _runner.run_question(item)
+    result["id"] = item['id']
+    return result
+
+
+def write_outputs(output_dir: str, result: Dict[str, Any]):
+    question_dir = os.path.join(output_dir, safe_name(result['id']))
+    os.makedirs(question_dir, exist_ok=True)
+    sql = result.get('predicted_sql')
+    if sql and sql != "None":
+        with open(os.path.join(question_dir, "query.sql"), 'w', encoding='utf-8') as file:
+            file.write(sql)
+    csv_file = result.get('result_csv_file')
+    if csv_file and os.path.exists(csv_file):
+        shutil.copyfile(csv_file, os.path.join(question_dir, "result.csv"))
+    with open(os.path.join(question_dir, "metrics.json"), 'w', encoding='utf-8') as file:
+        json.dump(result, file, indent=2, ensure_ascii=False, default=str)
+
+
+def append_checkpoint(output_dir: str, result: Dict[str, Any]):
+    entry = {"id": result['id'], "status": "error" if 'error' in result else "ok", "finished_at": datetime.now().isoformat()}
+    with open(os.path.join(output_dir, CHECKPOINT_FILE), 'a', encoding='utf-8') as file:
+        file.write(json.dumps(entry) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def load_results(output_dir: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    results = []
+    for item in items:
+        path = os.path.join(output_dir, safe_name(item['id']), "metrics.json")
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                results.append(json.load(file))
+    return results
+
+
+def run_batch(items: List[Dict[str, Any]], output_dir: str, model_info: Dict, config: Dict, language: str = "English",
+              workers: int = 4, executor: str = "thread", retry_errors: bool = False) -> Dict[str, Any]:
+    """
+    Answers `items` with a thread or process pool, writing `<id>/query.sql`, `<id>/result.csv`
+    and `<id>/metrics.json` per question. Every finished question is appended to the checkpoint,
+    so an interrupted run resumes with the questions that are still missing.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    done = load_checkpoint(output_dir, retry_errors)
+    pending = [item for item in items if item['id'] not in done]
+    logging.info(f"{len(items) - len(pending)} of {len(items)} questions already answered, {len(pending)} to go")
+
+    if executor == "process":
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(model_info, config, language))
+    else:
+        init_worker(model_info, config, language)
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+
+    start = time.perf_counter()
+    with pool:
+        futures = {pool.submit(answer, item): item for item in pending}
+        for count, future in enumerate(as_completed(futures), 1):
+            item = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # Worker crashes are recorded like pipeline errors so the rest of the batch continues
+                result = {"id": item['id'], "question": item['question'], "error": f"{type(e).__name__}: {str(e)}",
+                          "latency_ms": 0.0, "tokens": {}, "cost": 0.0, "stages": {}, "retries": 0, "generation_attempts": 0}
+            write_outputs(output_dir, result)
+            append_checkpoint(output_dir, result)
+            logging.info(f"[{count}/{len(pending)}] {item['id']}: {'error' if 'error' in result else 'ok'} ({result['latency_ms']} ms)")
+
+    results = load_results(output_dir, items)
+    summary = summarize_results(results)
+    if not any(item.get('gold_sql') for item in items):
+        summary.pop("execution_accuracy")
+        summary.pop("correct")
+    summary.update({"elapsed_s": round(time.perf_counter() - start, 2), "answered_this_run": len(pending), "workers": workers, "executor": executor})
+    with open(os.path.join(output_dir, "summary.json"), 'w', encoding='utf-8') as file:
+        json.dump(summary, file, indent=2, ensure_ascii=False, default=str)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions offline. Run from the app directory.")
+    parser.add_argument("questions", help="JSONL with a `question` (and optional `id`, `gold_sql`) per line")
+    parser.add_argument("--uri", default="sqlite:///Chinook.db")
+    parser.add_argument("--dialect", default="SQLite")
+    parser.add_argument("--model", default="Claude 3.5 Sonnet v2", help="Model name from config.yml")
+    parser.add_argument("--region", default=os.getenv("AWS_REGION", "us-west-2"))
+    parser.add_argument("--language", default="English")
+    parser.add_argument("--output", help="Output directory; reuse it to resume (default ./batch_runs/<timestamp>)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    parser.add_argument("--transport", choices=[LIVE, RECORD, REPLAY], help="Overrides transport.mode in config.yml")
+    parser.add_argument("--retry-errors", action="store_true", help="Answer questions that failed in an earlier run again")
+    parser.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.transport:
+        # Set before any worker starts, so process workers inherit it
+        os.environ['TEXT2SQL_TRANSPORT'] = args.transport
+
+    model_info = dict(load_model_config()[args.model], region_name=args.region)
+    config = {"dialect": args.dialect, "uri": args.uri}
+    output_dir = args.output or os.path.join("./batch_runs", datetime.now().strftime('%Y%m%d%H%M%S'))
+
+    summary = run_batch(load_batch(args.questions, args.limit), output_dir, model_info, config, args.language,
+                        args.workers, args.executor, args.retry_errors)
+    print(json.dumps({"output": output_dir, "transport": load_transport_config()['mode'], **summary}, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
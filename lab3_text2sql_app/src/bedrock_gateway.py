@@ -0,0 +1,444 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from .config import load_config_section
+from .schema_context import estimate_tokens
+from .transport import make_bedrock_client, transport_mode, REPLAY
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+THROTTLING_CODES = {"throttlingexception", "toomanyrequestsexception", "servicequotaexceededexception"}
+RETRYABLE_CODES = THROTTLING_CODES | {"serviceunavailableexception", "modelnotreadyexception", "internalserverexception"}
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def error_code(error: Exception) -> str:
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code', '').lower()
+    return ''
+
+
+class TokenBucket:
+    """Refills `rate_per_minute` units per minute up to one minute of burst. The level may go negative to settle debts."""
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self.refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount: float):
+        self.refill()
+        self.level -= amount
+
+
+class GatewayMetrics:
+    SAMPLES = 1000
+
+    def __init__(self):
+        self.requests = 0
+        self.throttles = 0
+        self.retries = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.queue_delays = {name: deque(maxlen=self.SAMPLES) for name in PRIORITIES}
+        self.queue_totals = {name: [0, 0.0, 0.0] for name in PRIORITIES}  # count, sum, max
+
+    def record_queue_delay(self, priority: str, delay: float):
+        self.queue_delays[priority].append(delay)
+        totals = self.queue_totals[priority]
+        totals[0] += 1
+        totals[1] += delay
+        totals[2] = max(totals[2], delay)
+
+    def snapshot(self) -> Dict[str, Any]:
+        queue = {}
+        for name, delays in self.queue_delays.items():
+            count, total, longest = self.queue_totals[name]
+            ordered = sorted(delays)
+            queue[name] = {
+                "count": count,
+                "mean": round(total / count, 4) if count else 0.0,
+                "p50": round(ordered[len(ordered) // 2], 4) if ordered else 0.0,
+                "p95": round(ordered[int(len(ordered) * 0.95)], 4) if ordered else 0.0,
+                "max": round(longest, 4)
+            }
+        return {
+            "requests": self.requests,
+            "throttles": self.throttles,
+            "retries": self.retries,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "queue_delay": queue
+        }
+
+
+class ModelLimiter:
+    """
+    Admission control for one model: requests/min and tokens/min token buckets plus an
+    AIMD concurrency limit. Waiters are served by priority, then arrival order.
+
+    The limit grows by 1/limit per successful call and halves on throttling, at most once per
+    `decrease_cooldown` seconds so a burst of concurrent throttles counts as one signal.
+    """
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, model: str, rpm: int = 60, tpm: int = 200000, max_concurrency: int = 8,
+                 min_concurrency: int = 1, decrease_cooldown: float = 2.0):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.decrease_cooldown = decrease_cooldown
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.waiting = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.metrics = GatewayMetrics()
+
+    def enqueue(self, priority: str):
+        ticket = (PRIORITIES[priority], next(self.sequence))
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+        return ticket
+
+    def dequeue(self, ticket):
+        with self.condition:
+            if ticket in self.waiting:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+            self.condition.notify_all()
+
+    def try_admit(self, ticket, cost: int) -> float:
+        # Returns 0 when admitted, otherwise how long to wait before trying again. Caller holds the condition.
+        if self.waiting[0] != ticket or self.in_flight >= max(int(self.limit), self.min_concurrency):
+            return self.POLL_INTERVAL
+        wait = max(self.requests.wait_time(1), self.tokens.wait_time(cost))
+        if wait > 0:
+            return wait
+        heapq.heappop(self.waiting)
+        self.requests.consume(1)
+        self.tokens.consume(min(cost, self.tokens.capacity))
+        self.in_flight += 1
+        self.metrics.requests += 1
+        return 0.0
+
+    def acquire(self, priority: str, cost: int):
+        start = time.monotonic()
+        ticket = self.enqueue(priority)
+        try:
+            with self.condition:
+                while True:
+                    wait = self.try_admit(ticket, cost)
+                    if not wait:
+                        break
+                    self.condition.wait(wait)
+                self.condition.notify_all()
+        except BaseException:
+            self.dequeue(ticket)
+            raise
+        self.metrics.record_queue_delay(priority, time.monotonic() - start)
+
+    async def acquire_async(self, priority: str, cost: int):
+        start = time.monotonic()
+        ticket = self.enqueue(priority)
+        try:
+            while True:
+                with self.condition:
+                    wait = self.try_admit(ticket, cost)
+                    if not wait:
+                        self.condition.notify_all()
+                        break
+                await asyncio.sleep(min(wait, self.POLL_INTERVAL))
+        except BaseException:
+            self.dequeue(ticket)
+            raise
+        self.metrics.record_queue_delay(priority, time.monotonic() - start)
+
+    def release(self, estimated: int, usage: Optional[Dict] = None, throttled: bool = False):
+        with self.condition:
+            self.in_flight -= 1
+            if usage:
+                actual = usage.get('inputTokens', 0) + usage.get('outputTokens', 0)
+                self.tokens.consume(actual - min(estimated, self.tokens.capacity))
+                self.metrics.input_tokens += usage.get('inputTokens', 0)
+                self.metrics.output_tokens += usage.get('outputTokens', 0)
+            now = time.monotonic()
+            if throttled:
+                self.metrics.throttles += 1
+                if now - self.last_decrease >= self.decrease_cooldown:
+                    self.limit = max(float(self.min_concurrency), self.limit / 2)
+                    self.last_decrease = now
+                    logging.warning(f"Bedrock throttling on {self.model}, concurrency limit lowered to {self.limit:.1f}")
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.condition:
+            data = self.metrics.snapshot()
+            data.update({"concurrency_limit": round(self.limit, 2), "in_flight": self.in_flight, "waiting": len(self.waiting)})
+        return data
+
+
+class MeteredStream:
+    """Iterates a converse stream and returns its limiter slot once, with the reported usage."""
+    def __init__(self, limiter: ModelLimiter, cost: int, stream):
+        self.limiter = limiter
+        self.cost = cost
+        self.stream = stream
+        self.usage = None
+        self.released = False
+
+    def release(self, throttled: bool = False):
+        if not self.released:
+            self.released = True
+            self.limiter.release(self.cost, self.usage, throttled)
+
+    def __iter__(self):
+        try:
+            for event in self.stream:
+                if 'metadata' in event:
+                    self.usage = event['metadata'].get('usage')
+                yield event
+        except ClientError as e:
+            self.release(error_code(e) in THROTTLING_CODES)
+            raise
+        finally:
+            self.release()
+
+    async def __aiter__(self):
+        try:
+            async for event in self.stream:
+                if 'metadata' in event:
+                    self.usage = event['metadata'].get('usage')
+                yield event
+        except ClientError as e:
+            self.release(error_code(e) in THROTTLING_CODES)
+            raise
+        finally:
+            self.release()
+
+    def close(self):
+        self.release()
+        close = getattr(self.stream, 'close', None)
+        if close is not None:
+            return close()
+
+
+class BedrockGateway:
+    """
+    Process-wide entry point for Bedrock calls in one region.
+
+    Every call is admitted by the limiter of its model, so sessions share the request and token
+    rates instead of each retrying on its own. Throttled calls are retried here with jittered
+    backoff; botocore retries are disabled so throttling reaches the AIMD controller.
+    """
+    def __init__(self, region: str, config: Optional[Dict] = None):
+        self.region = region
+        self.config = config if config is not None else load_config_section('bedrock_gateway')
+        self.max_retries = self.config.get('max_retries', 6)
+        self.base_backoff = self.config.get('base_backoff', 0.5)
+        self.output_tokens_estimate = self.config.get('output_tokens_estimate', 512)
+        if transport_mode() == REPLAY:
+            # Replayed calls are not rate limited by the service, so only orchestration overhead is measured
+            self.config = {**self.config, 'default': {'rpm': 10 ** 6, 'tpm': 10 ** 9, 'max_concurrency': 10 ** 4}, 'models': {}}
+        self.runtime = make_bedrock_client("bedrock-runtime", region, lambda: boto3.client("bedrock-runtime", region_name=region, config=self.client_config()))
+        self.agent_runtime = make_bedrock_client("bedrock-agent-runtime", region, lambda: boto3.client("bedrock-agent-runtime", region_name=region, config=self.client_config()))
+        self.limiters = {}
+        self.limiters_lock = threading.Lock()
+
+    def limiter(self, model: str) -> ModelLimiter:
+        with self.limiters_lock:
+            if model not in self.limiters:
+                limits = dict(self.config.get('default', {}))
+                limits.update(self.config.get('models', {}).get(model, {}))
+                self.limiters[model] = ModelLimiter(model, **limits)
+            return self.limiters[model]
+
+    def estimate_cost(self, kwargs: Dict) -> int:
+        prompt = json.dumps(kwargs.get('messages', [])) + json.dumps(kwargs.get('system', []))
+        max_tokens = kwargs.get('inferenceConfig', {}).get('maxTokens', self.output_tokens_estimate)
+        return estimate_tokens(prompt) + max_tokens
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, self.base_backoff * (2 ** attempt))
+
+    def client_config(self, config_class=Config):
+        # Retries happen in the gateway, so throttling is seen by the concurrency controller
+        return config_class(
+            region_name=self.region,
+            retries={"total_max_attempts": 1, "mode": "standard"},
+            max_pool_connections=self.config.get('max_pool_connections', 50)
+        )
+
+    def call(self, model: str, priority: str, cost: int, fn, **kwargs):
+        limiter = self.limiter(model)
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire(priority, cost)
+            try:
+                response = fn(**kwargs)
+            except ClientError as e:
+                code = error_code(e)
+                limiter.release(cost, throttled=code in THROTTLING_CODES)
+                if code not in RETRYABLE_CODES or attempt == self.max_retries:
+                    raise
+                limiter.metrics.retries += 1
+                time.sleep(self.backoff(attempt))
+                continue
+            except BaseException:
+                limiter.release(cost)
+                raise
+            return limiter, response
+
+    def converse(self, priority: str = "interactive", **kwargs):
+        cost = self.estimate_cost(kwargs)
+        limiter, response = self.call(kwargs['modelId'], priority, cost, self.runtime.converse, **kwargs)
+        limiter.release(cost, response.get('usage'))
+        return response
+
+    def converse_stream(self, priority: str = "interactive", **kwargs):
+        # The slot is held until the stream is consumed or closed
+        cost = self.estimate_cost(kwargs)
+        limiter, response = self.call(kwargs['modelId'], priority, cost, self.runtime.converse_stream, **kwargs)
+        response['stream'] = MeteredStream(limiter, cost, response['stream'])
+        return response
+
+    def invoke_model(self, priority: str = "interactive", **kwargs):
+        cost = self.invoke_model_cost(kwargs)
+        limiter, response = self.call(kwargs['modelId'], priority, cost, self.runtime.invoke_model, **kwargs)
+        limiter.release(cost)
+        return response
+
+    def rerank_cost(self, kwargs: Dict):
+        model_arn = kwargs['rerankingConfiguration']['bedrockRerankingConfiguration']['modelConfiguration']['modelArn']
+        texts = [q.get('textQuery', {}).get('text', '') for q in kwargs.get('queries', [])]
+        texts += [s.get('inlineDocumentSource', {}).get('textDocument', {}).get('text', '') for s in kwargs.get('sources', [])]
+        return model_arn.split('foundation-model/')[-1], sum(estimate_tokens(t) for t in texts)
+
+    def invoke_model_cost(self, kwargs: Dict) -> int:
+        body = kwargs.get('body', '')
+        return estimate_tokens(body if isinstance(body, str) else '')
+
+    def rerank(self, priority: str = "interactive", **kwargs):
+        model, cost = self.rerank_cost(kwargs)
+        limiter, response = self.call(model, priority, cost, self.agent_runtime.rerank, **kwargs)
+        limiter.release(cost)
+        return response
+
+    def metrics(self) -> Dict[str, Dict]:
+        with self.limiters_lock:
+            limiters = dict(self.limiters)
+        return {model: limiter.snapshot() for model, limiter in limiters.items()}
+
+
+class BedrockClient:
+    """Drop-in replacement for the boto3 bedrock-runtime client, routed through the shared gateway."""
+    def __init__(self, gateway: BedrockGateway, priority: str = "interactive"):
+        self.gateway = gateway
+        self.priority = priority
+        self.meta = gateway.runtime.meta
+
+    def converse(self, **kwargs):
+        return self.gateway.converse(self.priority, **kwargs)
+
+    def converse_stream(self, **kwargs):
+        return self.gateway.converse_stream(self.priority, **kwargs)
+
+    def invoke_model(self, **kwargs):
+        return self.gateway.invoke_model(self.priority, **kwargs)
+
+    def rerank(self, **kwargs):
+        return self.gateway.rerank(self.priority, **kwargs)
+
+
+def get_gateway(region: str) -> BedrockGateway:
+    with _gateways_lock:
+        if region not in _gateways:
+            _gateways[region] = BedrockGateway(region)
+        return _gateways[region]
+
+
+def get_bedrock_client(region: str, priority: str = "interactive") -> BedrockClient:
+    return BedrockClient(get_gateway(region), priority)
+
+
+class AsyncBedrockClient:
+    """asyncio variant of BedrockClient over aiobotocore clients, sharing the gateway limiters."""
+    def __init__(self, gateway: BedrockGateway, runtime, agent_runtime, priority: str = "interactive"):
+        self.gateway = gateway
+        self.runtime = runtime
+        self.agent_runtime = agent_runtime
+        self.priority = priority
+        self.meta = runtime.meta
+
+    async def call(self, model: str, cost: int, fn, **kwargs):
+        limiter = self.gateway.limiter(model)
+        for attempt in range(self.gateway.max_retries + 1):
+            await limiter.acquire_async(self.priority, cost)
+            try:
+                response = await fn(**kwargs)
+            except ClientError as e:
+                code = error_code(e)
+                limiter.release(cost, throttled=code in THROTTLING_CODES)
+                if code not in RETRYABLE_CODES or attempt == self.gateway.max_retries:
+                    raise
+                limiter.metrics.retries += 1
+                await asyncio.sleep(self.gateway.backoff(attempt))
+                continue
+            except BaseException:
+                limiter.release(cost)
+                raise
+            return limiter, response
+
+    async def converse(self, **kwargs):
+        cost = self.gateway.estimate_cost(kwargs)
+        limiter, response = await self.call(kwargs['modelId'], cost, self.runtime.converse, **kwargs)
+        limiter.release(cost, response.get('usage'))
+        return response
+
+    async def converse_stream(self, **kwargs):
+        cost = self.gateway.estimate_cost(kwargs)
+        limiter, response = await self.call(kwargs['modelId'], cost, self.runtime.converse_stream, **kwargs)
+        response['stream'] = MeteredStream(limiter, cost, response['stream'])
+        return response
+
+    async def invoke_model(self, **kwargs):
+        cost = self.gateway.invoke_model_cost(kwargs)
+        limiter, response = await self.call(kwargs['modelId'], cost, self.runtime.invoke_model, **kwargs)
+        limiter.release(cost)
+        return response
+
+    async def rerank(self, **kwargs):
+        model, cost = self.gateway.rerank_cost(kwargs)
+        limiter, response = await self.call(model, cost, self.agent_runtime.rerank, **kwargs)
+        limiter.release(cost)
+        return response
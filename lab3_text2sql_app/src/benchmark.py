@@ -0,0 +1,280 @@
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+
+from .callbacks import NullStreamHandler
+from .config import load_model_config
+from .models import calculate_cost_from_tokens
+from .transport import LIVE, RECORD, REPLAY, load_transport_config
+
+_ORDER_BY = re.compile(r'\bORDER\s+BY\b', re.IGNORECASE)
+
+
+def load_questions(path: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+    """
+    Reads a question set from JSONL. Accepts the OpenSearch bulk file format used for the
+    sample queries (`{"index": ...}` lines followed by `{"input", "query"}` documents) as
+    well as plain `{"question", "gold_sql"}` lines.
+    """
+    questions = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'index' in record:
+                continue
+            question = record.get('question', record.get('input'))
+            gold_sql = record.get('gold_sql', record.get('query'))
+            if question and gold_sql:
+                questions.append({"question": question, "gold_sql": gold_sql})
+    return questions[:limit] if limit else questions
+
+
+def normalize_value(value: Any) -> Any:
+    if isinstance(value, (float, Decimal)):
+        return round(float(value), 4)
+    if isinstance(value, bytes):
+        return value.hex()
+    return value
+
+
+def execute_rows(engine: Engine, query: str) -> List[tuple]:
+    with engine.connect() as connection:
+        result = connection.execute(text(query))
+        return [tuple(normalize_value(v) for v in row) for row in result.fetchall()]
+
+
+def rows_key(rows: List[tuple], ordered: bool, by_values: bool = False) -> List:
+    # `by_values` ignores column order, so `SELECT a, b` matches `SELECT b, a`
+    rows = [tuple(sorted(row, key=repr)) if by_values else row for row in rows]
+    return rows if ordered else sorted(rows, key=repr)
+
+
+def compare_results(gold_rows: List[tuple], predicted_rows: List[tuple], ordered: bool) -> bool:
+    """Execution accuracy: the predicted query returns the same rows as the gold query."""
+    if len(gold_rows) != len(predicted_rows):
+        return False
+    if rows_key(gold_rows, ordered) == rows_key(predicted_rows, ordered):
+        return True
+    return rows_key(gold_rows, ordered, True) == rows_key(predicted_rows, ordered, True)
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def percentile(q):
+        return round(values[min(int(len(values) * q), len(values) - 1)], 1)
+
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 1),
+        "p50_ms": percentile(0.5),
+        "p90_ms": percentile(0.9),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(values[-1], 1)
+    }
+
+
+class Benchmark:
+    """
+    Runs a question set through DB_Tool_Client end to end and scores the executed result of
+    the final query against the gold SQL on the same database.
+
+    The default question set is the sample query corpus the few-shot examples are retrieved
+    from, so with `exclude_own_sample` in `config` each question's own example (and gold SQL) is
+    dropped from its retrieved samples; otherwise accuracy would mostly measure copying.
+    """
+    def __init__(self, model_info: Dict, config: Dict, language: str = "English"):
+        # Imported here so the scoring helpers above stay usable without the app dependencies
+        from .opensearch import get_opensearch_client
+
+        self.model_info = model_info
+        self.config = config
+        self.language = language
+        self.engine = create_engine(config['uri'])
+        region = model_info['region_name']
+        self.sql_os_client = get_opensearch_client(region, 'example_queries', 'mappings-sql', 'input_v', 'input', ["input", "query"])
+        self.schema_os_client = get_opensearch_client(region, 'schema_descriptions', 'mappings-detailed-schema', 'table_summary_v', 'table_summary', ["table_name", "table_summary"])
+
+    def score(self, gold_sql: str, predicted_sql: Optional[str]) -> Dict[str, Any]:
+        if not predicted_sql or predicted_sql == "None":
+            return {"correct": False, "reason": "no query"}
+        try:
+            gold_rows = execute_rows(self.engine, gold_sql)
+        except Exception as e:
+            return {"correct": False, "reason": f"gold query failed: {str(e)}"}
+        try:
+            predicted_rows = execute_rows(self.engine, predicted_sql)
+        except Exception as e:
+            return {"correct": False, "reason": f"predicted query failed: {str(e)}"}
+        correct = compare_results(gold_rows, predicted_rows, bool(_ORDER_BY.search(gold_sql)))
+        return {"correct": correct, "reason": "match" if correct else "result mismatch",
+                "gold_rows": len(gold_rows), "predicted_rows": len(predicted_rows)}
+
+    def run_question(self, item: Dict[str, str]) -> Dict[str, Any]:
+        from .db_utils import DB_Tool_Client
+
+        result = {"question": item['question'], "gold_sql": item.get('gold_sql')}
+        start = time.perf_counter()
+        client = None
+        try:
+            client = DB_Tool_Client(self.model_info, self.config, self.language, self.sql_os_client, self.schema_os_client, item['question'], "")
+            response, tokens = client.invoke(NullStreamHandler())
+            result["response"] = response
+        except Exception as e:
+            logging.error(f"Benchmark question failed '{item['question']}': {str(e)}")
+            result["error"] = f"{type(e).__name__}: {str(e)}"
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+        tool_state = client.db_tool.tool_state if client is not None else {}
+        tokens = dict(client.tokens) if client is not None else {'total_input_tokens': 0, 'total_output_tokens': 0}
+        tokens['total_tokens'] = tokens['total_input_tokens'] + tokens['total_output_tokens']
+        result["predicted_sql"] = tool_state.get("final_query")
+        result["result_csv_file"] = tool_state.get("result_csv_file")
+        if item.get('gold_sql'):
+            result.update(self.score(item['gold_sql'], result["predicted_sql"]))
+        result["tokens"] = tokens
+        result["cost"] = round(calculate_cost_from_tokens(tokens, self.model_info['model_id'])[2], 6)
+
+        stages = defaultdict(float)
+        spans = client.trace_span.trace.spans if client is not None else []
+        for span in spans:
+            if span.parent_id is not None and span.duration_ms is not None:
+                stages[span.name] += span.duration_ms
+        result["stages"] = {name: round(ms, 1) for name, ms in stages.items()}
+        # `retry` on a span is the number of consecutive failures before that stage started
+        result["retries"] = max([span.attributes.get('retry', 0) for span in spans] or [0])
+        result["generation_attempts"] = sum(1 for span in spans if span.name == "generation")
+        result["trace_id"] = client.trace_span.trace.trace_id if client is not None else None
+        return result
+
+    def run(self, questions: List[Dict[str, str]], workers: int = 1) -> List[Dict[str, Any]]:
+        if workers <= 1:
+            return [self.run_question(item) for item in questions]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="benchmark") as executor:
+            return list(executor.map(self.run_question, questions))
+
+
+def summarize_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    correct = sum(1 for r in results if r.get('correct'))
+    stage_latencies = defaultdict(list)
+    for r in results:
+        for name, ms in r.get('stages', {}).items():
+            stage_latencies[name].append(ms)
+    input_tokens = sum(r['tokens'].get('total_input_tokens', 0) for r in results)
+    output_tokens = sum(r['tokens'].get('total_output_tokens', 0) for r in results)
+    n = len(results) or 1
+    return {
+        "questions": len(results),
+        "execution_accuracy": round(correct / n, 4),
+        "correct": correct,
+        "errors": sum(1 for r in results if 'error' in r),
+        "latency": percentiles([r['latency_ms'] for r in results]),
+        "stages": {name: percentiles(values) for name, values in sorted(stage_latencies.items())},
+        "tokens": {
+            "input": input_tokens,
+            "output": output_tokens,
+            "total": input_tokens + output_tokens,
+            "mean_per_question": round((input_tokens + output_tokens) / n, 1),
+            "context_tokens_saved": sum(r['tokens'].get('context_tokens_saved', 0) for r in results),
+            "conversation_tokens_saved": sum(r['tokens'].get('conversation_tokens_saved', 0) for r in results)
+        },
+        "cost": {"total": round(sum(r['cost'] for r in results), 6), "mean_per_question": round(sum(r['cost'] for r in results) / n, 6)},
+        "retries": {
+            "total": sum(r['retries'] for r in results),
+            "questions_with_retries": sum(1 for r in results if r['retries'] > 0),
+            "generation_attempts": sum(r['generation_attempts'] for r in results)
+        }
+    }
+
+
+def compare_reports(report: Dict, baseline: Dict) -> Dict[str, Any]:
+    """Headline deltas of `report` against `baseline` (positive means higher in `report`)."""
+    current, previous = report['summary'], baseline['summary']
+
+    def delta(a, b):
+        return round(a - b, 4) if a is not None and b is not None else None
+
+    changed = [r['question'] for r, b in zip(report['results'], baseline['results'])
+               if r['question'] == b['question'] and r.get('correct') != b.get('correct')]
+    return {
+        "baseline": baseline.get('label'),
+        "execution_accuracy": delta(current['execution_accuracy'], previous['execution_accuracy']),
+        "latency_p50_ms": delta(current['latency'].get('p50_ms'), previous['latency'].get('p50_ms')),
+        "latency_p95_ms": delta(current['latency'].get('p95_ms'), previous['latency'].get('p95_ms')),
+        "total_tokens": delta(current['tokens']['total'], previous['tokens']['total']),
+        "cost": delta(current['cost']['total'], previous['cost']['total']),
+        "retries": delta(current['retries']['total'], previous['retries']['total']),
+        "changed_questions": changed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Execution accuracy and latency benchmark for the text-to-SQL pipeline. Run from the app directory.")
+    parser.add_argument("--questions", default="../db_metadata/example_queries.jsonl")
+    parser.add_argument("--keep-own-sample", action="store_true",
+                        help="Keep a question's own example among its few-shot samples (only for a held-out question set)")
+    parser.add_argument("--model", default="Claude 3.5 Sonnet v2", help="Model name from config.yml")
+    parser.add_argument("--region", default=os.getenv("AWS_REGION", "us-west-2"))
+    parser.add_argument("--uri", default="sqlite:///Chinook.db")
+    parser.add_argument("--dialect", default="SQLite")
+    parser.add_argument("--language", default="English")
+    parser.add_argument("--transport", choices=[LIVE, RECORD, REPLAY], help="Overrides transport.mode in config.yml")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--output", help="Report path (default ./benchmarks/<label>_<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    args = parser.parse_args()
+
+    if args.transport:
+        os.environ['TEXT2SQL_TRANSPORT'] = args.transport
+
+    model_info = dict(load_model_config()[args.model], region_name=args.region)
+    config = {"dialect": args.dialect, "uri": args.uri, "exclude_own_sample": not args.keep_own_sample}
+    questions = load_questions(args.questions, args.limit)
+
+    started_at = datetime.now().isoformat()
+    results = Benchmark(model_info, config, args.language).run(questions, args.workers)
+    report = {
+        "label": args.label,
+        "started_at": started_at,
+        "model": args.model,
+        "model_id": model_info['model_id'],
+        "region": args.region,
+        "uri": args.uri,
+        "transport": load_transport_config()['mode'],
+        "question_set": args.questions,
+        "own_sample_excluded": config["exclude_own_sample"],
+        "summary": summarize_results(results),
+        "results": results
+    }
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            report["comparison"] = compare_reports(report, json.load(file))
+
+    output = args.output or os.path.join("./benchmarks", f"{args.label}_{datetime.now().strftime('%Y%m%d%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, ensure_ascii=False, default=str)
+
+    print(json.dumps({"report": output, **report['summary'], **({"comparison": report["comparison"]} if args.baseline else {})}, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import asyncio
+import json
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+
+class PipelineCallbacks:
+    """
+    Receives the events of a text-to-SQL request. The pipeline never talks to a UI directly;
+    every method is a no-op here, so the pipeline runs headless unless a front end subclasses this.
+    """
+    render_count = 0
+
+    @contextmanager
+    def stage(self, message: str):
+        # Wraps a long-running step (e.g. a tool call); front ends show progress while it runs
+        yield
+
+    def on_samples(self, samples: List[Dict]) -> None:
+        pass
+
+    def on_refined_prompt(self, prompt: str) -> None:
+        pass
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def on_llm_end(self, response=None, **kwargs) -> None:
+        pass
+
+    def on_llm_new_result(self, token: str, **kwargs) -> None:
+        pass
+
+
+class NullStreamHandler(PipelineCallbacks):
+    """Discards the scratchpad, for runs without a UI."""
+
+
+class EventQueueCallbacks(PipelineCallbacks):
+    """
+    Turns pipeline events into `(event, data)` items on an asyncio queue, for streaming responses.
+    Safe to call from worker threads as well as from the event loop that owns the queue.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        self.loop = loop
+        self.queue = queue
+
+    def emit(self, event: str, data: Any) -> None:
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self.queue.put_nowait((event, data))
+        else:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, (event, data))
+
+    @contextmanager
+    def stage(self, message: str):
+        self.emit("stage", {"message": message, "status": "started"})
+        try:
+            yield
+        finally:
+            self.emit("stage", {"message": message, "status": "finished"})
+
+    def on_samples(self, samples: List[Dict]) -> None:
+        self.emit("samples", samples)
+
+    def on_refined_prompt(self, prompt: str) -> None:
+        self.emit("refined_prompt", {"prompt": prompt})
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        self.emit("token", {"text": token})
+
+    def on_llm_new_result(self, token: str, **kwargs) -> None:
+        try:
+            self.emit("tool_result", json.loads(token))
+        except json.JSONDecodeError:
+            self.emit("tool_result", {"text": token})
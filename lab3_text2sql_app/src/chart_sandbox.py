@@ -0,0 +1,304 @@
+import atexit
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from .config import load_config_section
+
+
+class ChartSandboxError(RuntimeError):
+    """Generated chart code failed, produced no figure or was stopped."""
+
+
+class ChartTimeoutError(ChartSandboxError):
+    """The job exceeded its wall-clock timeout and its worker was killed."""
+
+
+class ChartCancelledError(ChartSandboxError):
+    """The job was cancelled by the caller."""
+
+
+class _CPULimitExceeded(BaseException):
+    pass
+
+
+def _vm_bytes() -> int:
+    with open('/proc/self/statm', 'r') as file:
+        return int(file.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def worker_main(conn, cpu_seconds: float, memory_mb: int):
+    """
+    Worker process loop. Imports the plotting stack once, then runs one job per message.
+    Memory is capped for the life of the worker; CPU time is capped per job.
+    """
+    import builtins
+    import io
+    import resource
+    import signal
+    import sys
+    import types
+
+    import numpy as np
+    import pandas as pd
+    import plotly.express as px
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    # Generated code calls `st.plotly_chart(fig)`; a stand-in module captures the figure instead
+    figures = []
+    streamlit = types.ModuleType("streamlit")
+    streamlit.plotly_chart = lambda fig, *args, **kwargs: figures.append(fig)
+    streamlit.__getattr__ = lambda name: (lambda *args, **kwargs: None)
+    sys.modules["streamlit"] = streamlit
+
+    # The last result file read, so re-rendering the same result skips parsing it again
+    loaded = {}
+
+    def load_dataframe(data_file):
+        if not data_file:
+            raise ValueError("No data file was given for this chart.")
+        stat = os.stat(data_file)
+        key = (data_file, stat.st_mtime_ns, stat.st_size)
+        if key not in loaded:
+            loaded.clear()
+            loaded[key] = pd.read_parquet(data_file) if data_file.endswith('.parquet') else pd.read_csv(data_file)
+        return loaded[key].copy()
+
+    def on_cpu_limit(signum, frame):
+        raise _CPULimitExceeded()
+
+    signal.signal(signal.SIGXCPU, on_cpu_limit)
+    if memory_mb and sys.platform.startswith('linux'):
+        limit = _vm_bytes() + memory_mb * 2 ** 20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, resource.getrlimit(resource.RLIMIT_AS)[1]))
+    conn.send({"ready": True})
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+
+        figures.clear()
+        namespace = {"__builtins__": builtins, "__name__": "__chart__", "pd": pd, "np": np, "px": px, "go": go,
+                     "io": io, "StringIO": io.StringIO, "st": streamlit,
+                     "load_dataframe": lambda: load_dataframe(job.get("data_file"))}
+        hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+        used = resource.getrusage(resource.RUSAGE_SELF).ru_utime + resource.getrusage(resource.RUSAGE_SELF).ru_stime
+        soft = int(used + cpu_seconds) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (soft if hard == resource.RLIM_INFINITY else min(soft, hard), hard))
+        try:
+            exec(compile(job["code"], "<chart>", "exec"), namespace)
+            fig = figures[-1] if figures else namespace.get("fig")
+            if fig is None:
+                reply = {"ok": False, "error": "The code did not produce a figure (expected `fig`)."}
+            else:
+                reply = {"ok": True, "figure": pio.to_json(fig)}
+        except _CPULimitExceeded:
+            reply = {"ok": False, "error": f"CPU time limit of {cpu_seconds}s exceeded.", "recycle": True}
+        except MemoryError:
+            reply = {"ok": False, "error": f"Memory limit of {memory_mb} MB exceeded.", "recycle": True}
+        except Exception as e:
+            reply = {"ok": False, "error": f"{type(e).__name__}: {str(e)}"}
+        finally:
+            resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+        conn.send(reply)
+
+
+class _Worker:
+    def __init__(self, context, cpu_seconds: float, memory_mb: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_conn, cpu_seconds, memory_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+        self.ready = False
+
+    def wait_ready(self, timeout: float) -> bool:
+        try:
+            if not self.ready and self.conn.poll(timeout):
+                self.ready = bool(self.conn.recv().get("ready"))
+        except (EOFError, OSError):
+            # The worker died while importing (e.g. a missing plotting package)
+            return False
+        return self.ready
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
+
+class ChartJob:
+    """Handle for a submitted chart job; `cancel()` stops it even while it is running."""
+    def __init__(self):
+        self.future = Future()
+        self.cancelled = False
+        self.worker = None
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.worker is not None:
+                self.worker.kill()
+
+    def result(self, timeout: Optional[float] = None) -> str:
+        return self.future.result(timeout)
+
+
+class ChartSandbox:
+    """
+    Pre-warmed pool of worker processes for model-generated plotting code. Each worker has
+    pandas/numpy/plotly imported, a memory cap, and a per-job CPU-time cap; the parent enforces a
+    wall-clock timeout and kills the worker on timeout or cancellation, replacing it in the background.
+    Jobs return the figure serialized with `plotly.io.to_json`.
+    """
+    def __init__(self, workers: int = 2, timeout: float = 30.0, cpu_seconds: float = 20.0, memory_mb: int = 1024,
+                 max_jobs_per_worker: int = 50, startup_timeout: float = 60.0):
+        self.size = workers
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.startup_timeout = startup_timeout
+        # spawn: forking the multi-threaded app server is unsafe
+        self.context = multiprocessing.get_context("spawn")
+        self.idle = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chart-sandbox")
+        self.closed = False
+        for _ in range(workers):
+            self.idle.put(self.spawn())
+
+    @classmethod
+    def from_config(cls, config: Dict):
+        return cls(
+            workers=config.get('workers', 2),
+            timeout=config.get('timeout', 30.0),
+            cpu_seconds=config.get('cpu_seconds', 20.0),
+            memory_mb=config.get('memory_mb', 1024),
+            max_jobs_per_worker=config.get('max_jobs_per_worker', 50)
+        )
+
+    def spawn(self) -> _Worker:
+        return _Worker(self.context, self.cpu_seconds, self.memory_mb)
+
+    def replace(self, worker: _Worker):
+        worker.kill()
+        if not self.closed:
+            self.idle.put(self.spawn())
+
+    def release(self, worker: _Worker):
+        # A worker finishing after shutdown is stopped instead of returned to the drained pool
+        if self.closed:
+            worker.kill()
+        else:
+            self.idle.put(worker)
+
+    def acquire(self) -> _Worker:
+        while True:
+            if self.closed:
+                raise ChartCancelledError("Chart sandbox was shut down.")
+            try:
+                return self.idle.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def submit(self, code: str, data_file: Optional[str] = None, timeout: Optional[float] = None) -> ChartJob:
+        """`data_file` (CSV or Parquet) is what `load_dataframe()` returns inside the chart code."""
+        job = ChartJob()
+        if self.closed:
+            job.future.set_exception(ChartCancelledError("Chart sandbox was shut down."))
+            return job
+        data_file = os.path.abspath(data_file) if data_file else None
+        task = self.executor.submit(self.execute, job, {"code": code, "data_file": data_file}, timeout or self.timeout)
+        # Jobs still queued at shutdown are dropped by the executor, so their result is set here
+        task.add_done_callback(lambda task: task.cancelled() and job.future.set_exception(ChartCancelledError("Chart sandbox was shut down.")))
+        return job
+
+    def run(self, code: str, data_file: Optional[str] = None, timeout: Optional[float] = None) -> str:
+        return self.submit(code, data_file, timeout).result()
+
+    def execute(self, job: ChartJob, request: Dict, timeout: float):
+        try:
+            worker = self.acquire()
+        except ChartCancelledError as e:
+            job.future.set_exception(e)
+            return
+        try:
+            if not worker.wait_ready(self.startup_timeout):
+                self.replace(worker)
+                raise ChartSandboxError("Chart worker failed to start.")
+            with job.lock:
+                if job.cancelled:
+                    self.release(worker)
+                    raise ChartCancelledError("Chart job cancelled.")
+                job.worker = worker
+            reply = self.exchange(job, worker, request, timeout)
+            job.future.set_result(reply)
+        except BaseException as e:
+            job.future.set_exception(e if isinstance(e, ChartSandboxError) else ChartSandboxError(str(e)))
+
+    def exchange(self, job: ChartJob, worker: _Worker, request: Dict, timeout: float) -> str:
+        deadline = time.monotonic() + timeout
+        try:
+            worker.conn.send(request)
+            while not worker.conn.poll(min(0.1, max(deadline - time.monotonic(), 0))):
+                if job.cancelled:
+                    raise ChartCancelledError("Chart job cancelled.")
+                if time.monotonic() >= deadline:
+                    raise ChartTimeoutError(f"Chart code did not finish within {timeout}s.")
+            reply = worker.conn.recv()
+        except (EOFError, OSError, BrokenPipeError):
+            self.replace(worker)
+            if job.cancelled:
+                raise ChartCancelledError("Chart job cancelled.")
+            raise ChartSandboxError("Chart worker exited while running the job (resource limit exceeded).")
+        except ChartSandboxError:
+            self.replace(worker)
+            raise
+
+        worker.jobs += 1
+        if reply.get("recycle") or worker.jobs >= self.max_jobs_per_worker:
+            self.replace(worker)
+        else:
+            self.release(worker)
+        if not reply["ok"]:
+            raise ChartSandboxError(reply["error"])
+        return reply["figure"]
+
+    def shutdown(self):
+        self.closed = True
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        while True:
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                worker.conn.send(None)
+            except (OSError, BrokenPipeError):
+                pass
+            worker.kill()
+
+
+_sandbox = None
+_sandbox_lock = threading.Lock()
+
+
+def get_chart_sandbox() -> ChartSandbox:
+    # One pool per server process, shared by all sessions
+    global _sandbox
+    with _sandbox_lock:
+        if _sandbox is None:
+            _sandbox = ChartSandbox.from_config(load_config_section('chart_sandbox'))
+            atexit.register(_sandbox.shutdown)
+        return _sandbox
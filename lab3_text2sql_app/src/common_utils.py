@@ -1,36 +1,109 @@
 import json
+import time
+from contextlib import contextmanager
 from typing import List, Union
 import streamlit as st
 import os
-import yaml
-import re
 from PIL import Image, UnidentifiedImageError
 from langchain.callbacks.base import BaseCallbackHandler
 
+# The pipeline itself is headless; these are re-exported for existing Streamlit imports
+from .callbacks import PipelineCallbacks, NullStreamHandler
+from .config import load_model_config, load_pipeline_config, load_language_config
+from .json_stream import stream_converse_messages
+from .opensearch import get_opensearch_client
+
 class ToolStreamHandler(BaseCallbackHandler):
-    def __init__(self, container, initial_text=""):
-        self.container = container
+    """
+    Streams the scratchpad into a Streamlit container.
+
+    Tokens are coalesced and the active block is re-rendered at most once per `flush_interval`
+    seconds or `flush_chars` characters. Completed tool-result blocks are rendered once into their
+    own placeholder and never re-sent. `render_count` counts placeholder updates for the response.
+    """
+    def __init__(self, container, initial_text="", flush_interval=0.1, flush_chars=200):
+        self.container = container.container()
         self.text = initial_text
+        self.active_text = initial_text
+        self.flush_interval = flush_interval
+        self.flush_chars = flush_chars
+        self.pending_chars = 0
+        self.last_render = 0.0
+        self.render_count = 0
         self.placeholder = self.container.empty()
 
     def on_llm_new_token(self, token: str, **kwargs) -> None:
         self.text += token
-        self.placeholder.markdown(self.text)
-        
+        self.active_text += token
+        self.pending_chars += len(token)
+        if self.pending_chars >= self.flush_chars or time.monotonic() - self.last_render >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending_chars:
+            return
+        self.placeholder.markdown(self.active_text)
+        self.render_count += 1
+        self.pending_chars = 0
+        self.last_render = time.monotonic()
+
+    def on_llm_end(self, response=None, **kwargs) -> None:
+        self.flush()
+
     def on_llm_new_result(self, token: str, **kwargs) -> None:
         try:
             parsed_token = json.loads(token)
             formatted_token = json.dumps(parsed_token, indent=2, ensure_ascii=False)
-            self.text += "\n\n```json\n" + formatted_token + "\n```\n\n"
+            block = "\n\n```json\n" + formatted_token + "\n```\n\n"
         except json.JSONDecodeError:
             if token.strip().upper().startswith("SELECT"):
-                self.text += "\n\n```sql\n" + token + "\n```\n\n"
+                block = "\n\n```sql\n" + token + "\n```\n\n"
             elif token.strip().upper().startswith("COUNTRY,TOTALREVENUE"):
-                self.text += "\n\n```\n" + token + "\n```\n\n"
+                block = "\n\n```\n" + token + "\n```\n\n"
             else:
-                self.text += "\n\n" + token + "\n\n"
-        
-        self.placeholder.markdown(self.text)
+                block = "\n\n" + token + "\n\n"
+        self.text += block
+
+        # Freeze the active block and the tool result, then continue streaming into a fresh block
+        self.flush()
+        self.container.markdown(block)
+        self.render_count += 1
+        self.active_text = ""
+        self.placeholder = self.container.empty()
+
+
+class StreamlitCallbacks(PipelineCallbacks):
+    """Renders pipeline progress (spinners, referenced samples, refined prompt) in the Streamlit page."""
+    @contextmanager
+    def stage(self, message: str):
+        with st.spinner(message):
+            yield
+
+    def on_samples(self, samples: List[dict]) -> None:
+        with st.expander("Referenced Sample Queries (Click to expand)", expanded=False):
+            display_sql_samples(samples)
+
+    def on_refined_prompt(self, prompt: str) -> None:
+        with st.expander("Auto-refined Prompt (Click to expand)", expanded=False):
+            st.write(prompt)
+
+
+def display_sql_samples(selected_samples: List[dict]) -> None:
+    if not selected_samples:
+        st.text("There is no similar samples.")
+        return
+
+    for sample in selected_samples:
+        try:
+            input_text = sample.get('input', 'No input available')
+            query = sample.get('query', 'No query available')
+
+            st.markdown(f"**Input:** {input_text}")
+            st.markdown(f"**Query:**")
+            st.code(query, language='sql')
+            st.markdown('<div style="margin: 5px 0;"><hr style="border: none; border-top: 1px solid #ccc; margin: 0;" /></div>', unsafe_allow_html=True)
+        except Exception as e:
+            st.text(f"Error processing sample: {str(e)}")
 
 
 def display_user_message(message_content: Union[str, List[dict]]) -> None:
@@ -63,68 +136,6 @@ def display_chat_messages(
             if message["role"] == "assistant":
                 display_assistant_message(message["content"])
 
-def stream_converse_messages(client, model, tool_config, messages, system, callback, tokens):
-    response = client.converse_stream(
-        modelId=model,
-        messages=messages,
-        system=system,
-        toolConfig=tool_config
-    )
-    
-    stop_reason = ""
-    message = {"content": []}
-    text = ''
-    tool_use = {}
-
-    for chunk in response['stream']:
-        if 'messageStart' in chunk:
-            message['role'] = chunk['messageStart']['role']
-        elif 'contentBlockStart' in chunk:
-            tool = chunk['contentBlockStart']['start']['toolUse']
-            tool_use['toolUseId'] = tool['toolUseId']
-            tool_use['name'] = tool['name']
-        elif 'contentBlockDelta' in chunk:
-            delta = chunk['contentBlockDelta']['delta']
-            if 'toolUse' in delta:
-                if 'input' not in tool_use:
-                    tool_use['input'] = ''
-                tool_use['input'] += delta['toolUse']['input']
-            elif 'text' in delta:
-                text += delta['text']
-                callback.on_llm_new_token(delta['text'])
-        elif 'contentBlockStop' in chunk:
-            if 'input' in tool_use:
-                tool_use['input'] = json.loads(tool_use['input'])
-                message['content'].append({'toolUse': tool_use})
-                tool_use = {}
-            else:
-                message['content'].append({'text': text})
-                text = ''
-        elif 'messageStop' in chunk:
-            stop_reason = chunk['messageStop']['stopReason']
-        elif 'metadata' in chunk:
-            tokens['total_input_tokens'] += chunk['metadata']['usage']['inputTokens']
-            tokens['total_output_tokens'] += chunk['metadata']['usage']['outputTokens']
-    return stop_reason, message
-
-
-def parse_json_format(json_string):
-    json_string = re.sub(r'"""\s*(.*?)\s*"""', r'"\1"', json_string, flags=re.DOTALL)
-    json_string = re.sub(r'```json|```|</?response_format>|\n\s*', ' ', json_string)
-    json_string = json_string.strip()
-    match = re.search(r'({.*})', json_string)
-    if match:
-        json_string = match.group(1)
-    else:
-        return "No JSON object found in the string."
-
-    try:
-        parsed_json = json.loads(json_string)
-    except json.JSONDecodeError as e:
-        print("Original output: ", json_string)
-        return f"JSON Parsing Error: {e}"
-    return parsed_json
-
 def update_tokens_and_costs(tokens):
     st.session_state.tokens['delta_input_tokens'] = tokens['total_input_tokens']
     st.session_state.tokens['delta_output_tokens'] = tokens['total_output_tokens']
@@ -231,23 +242,6 @@ def process_uploaded_files(uploaded_files: List[st.runtime.uploaded_file_manager
 
     return content_files
 
-def load_model_config():
-    file_dir = os.path.dirname(os.path.abspath(__file__))
-    config_file = os.path.join(file_dir, "config.yml")
-
-    with open(config_file, "r") as file:
-        config = yaml.safe_load(file)
-    return config['models']
-
-def load_language_config(language):
-    file_dir = os.path.dirname(os.path.abspath(__file__))
-    config_file = os.path.join(file_dir, "config.yml")
-
-    with open(config_file, "r") as file:
-        config = yaml.safe_load(file)
-    return config['languages'][language]
-
-
 def sample_query_indexing(os_client, lang_config):
     rag_query_file = st.text_input(lang_config['rag_query_file'], value='../db_metadata/example_queries.jsonl')
     if not os.path.exists(rag_query_file):
@@ -300,4 +294,39 @@ def schema_desc_indexing(os_client, lang_config):
                 st.error("Failed")
             else:
                 st.success("Success")
-    
\ No newline at end of file
+
+
+def initialize_os_client(client_params, indexing_function, lang_config):
+    client = get_opensearch_client(**client_params)
+    #indexing_function(client, lang_config)
+    return client
+
+def init_opensearch(region_name, lang_config):
+    with st.sidebar:
+        sql_os_client = initialize_os_client(
+            {
+                "region_name": region_name,
+                "index_name": 'example_queries',
+                "mapping_name": 'mappings-sql',
+                "vector": "input_v",
+                "text": "input",
+                "output": ["input", "query"]
+            },
+            sample_query_indexing,
+            lang_config
+        )
+
+        schema_os_client = initialize_os_client(
+            {
+                "region_name": region_name,
+                "index_name": 'schema_descriptions',
+                "mapping_name": 'mappings-detailed-schema',
+                "vector": "table_summary_v",
+                "text": "table_summary",
+                "output": ["table_name", "table_summary"]
+            },
+            schema_desc_indexing,
+            lang_config
+        )
+
+    return sql_os_client, schema_os_client
@@ -0,0 +1,31 @@
+import copy
+import os
+
+import yaml
+
+_config = None
+
+
+def load_config():
+    """config.yml, read once per process."""
+    global _config
+    if _config is None:
+        file_dir = os.path.dirname(os.path.abspath(__file__))
+        config_file = os.path.join(file_dir, "config.yml")
+
+        with open(config_file, "r") as file:
+            _config = yaml.safe_load(file)
+    return _config
+
+def load_config_section(name):
+    # A copy, so callers applying environment overrides never change the cached file
+    return copy.deepcopy(load_config().get(name, {}))
+
+def load_model_config():
+    return load_config_section('models')
+
+def load_pipeline_config():
+    return load_config_section('pipeline')
+
+def load_language_config(language):
+    return load_config_section('languages')[language]
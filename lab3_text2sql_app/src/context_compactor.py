@@ -0,0 +1,171 @@
+import copy
+import hashlib
+import json
+import re
+from collections import namedtuple
+from typing import Any, Dict, List, Optional, Tuple
+
+from .schema_context import estimate_tokens
+
+CompactionStats = namedtuple('CompactionStats', ['tokens', 'original_tokens', 'tokens_saved'])
+
+_CREATE_TABLE = re.compile(r'CREATE TABLE\s+[`"\[]?(\w+)', re.IGNORECASE)
+
+
+def truncate_text(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + f" ... [{len(text) - max_chars} chars truncated]"
+
+
+def count_tokens(value: Any) -> int:
+    return estimate_tokens(value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str))
+
+
+class ConversationCompactor:
+    """
+    Compacts the tool-loop messages before each converse call.
+
+    The full conversation is kept by the caller; only the copy sent to the model is compacted.
+    The most recent tool results keep their structure with long row lists and strings truncated,
+    older results are reduced to their scalar fields, and paragraphs already sent earlier in the
+    conversation (e.g. repeated CREATE TABLE blocks) are replaced by a short reference. If the
+    copy still exceeds the token budget, older tool results are stubbed and older assistant text
+    is shortened. The first message, the latest exchange and any block holding the original of a
+    deduplicated paragraph are never shortened.
+    """
+    SUMMARY_CHARS = 200
+
+    def __init__(self, token_budget: int = 6000, keep_recent_results: int = 2, max_rows: int = 5,
+                 max_chars: int = 1500, min_dedupe_chars: int = 200):
+        self.token_budget = token_budget
+        self.keep_recent_results = keep_recent_results
+        self.max_rows = max_rows
+        self.max_chars = max_chars
+        self.min_dedupe_chars = min_dedupe_chars
+
+    @classmethod
+    def from_config(cls, config: Dict):
+        return cls(
+            token_budget=config.get('token_budget', 6000),
+            keep_recent_results=config.get('keep_recent_results', 2),
+            max_rows=config.get('max_rows', 5),
+            max_chars=config.get('max_chars', 1500)
+        )
+
+    def prepare(self, messages: List[Dict], tokens: Dict) -> List[Dict]:
+        compacted, stats = self.compact(messages)
+        tokens['conversation_tokens_saved'] = tokens.get('conversation_tokens_saved', 0) + stats.tokens_saved
+        return compacted
+
+    def compact(self, messages: List[Dict]) -> Tuple[List[Dict], CompactionStats]:
+        original_tokens = count_tokens(messages)
+        compacted = copy.deepcopy(messages)
+        tool_names = self.tool_names(compacted)
+        results = self.tool_result_positions(compacted)
+        recent = set(results[-self.keep_recent_results:]) if self.keep_recent_results > 0 else set()
+
+        # Paragraph hash -> position of the block that sent it first, and the positions later copies refer to
+        seen, referenced = {}, set()
+        for i, message in enumerate(compacted):
+            for j, content in enumerate(message.get('content', [])):
+                if 'text' in content:
+                    content['text'] = self.dedupe_text(content['text'], seen, (i, j), referenced)
+                elif 'toolResult' in content:
+                    result = content['toolResult']
+                    if (i, j) in recent:
+                        result['content'] = [self.shrink_block(block, seen, (i, j), referenced) for block in result['content']]
+                    else:
+                        name = tool_names.get(result.get('toolUseId'))
+                        result['content'] = [self.summarize_block(block, name) for block in result['content']]
+
+        tokens = count_tokens(compacted)
+        if tokens > self.token_budget:
+            tokens = self.enforce_budget(compacted, results, referenced)
+        return compacted, CompactionStats(tokens, original_tokens, max(original_tokens - tokens, 0))
+
+    def enforce_budget(self, messages: List[Dict], results: List[Tuple[int, int]], referenced: set = frozenset()) -> int:
+        protected = {0, len(messages) - 1, len(messages) - 2}
+        for i, j in results[:-1]:
+            if i in protected or (i, j) in referenced:
+                continue
+            result = messages[i]['content'][j]['toolResult']
+            result['content'] = [{"json": {"omitted": "Earlier tool result removed to fit the context budget."}}]
+            tokens = count_tokens(messages)
+            if tokens <= self.token_budget:
+                return tokens
+
+        for i, message in enumerate(messages):
+            if i in protected or message.get('role') != 'assistant':
+                continue
+            for j, content in enumerate(message.get('content', [])):
+                if 'text' in content and (i, j) not in referenced:
+                    content['text'] = truncate_text(content['text'], self.SUMMARY_CHARS)
+            tokens = count_tokens(messages)
+            if tokens <= self.token_budget:
+                return tokens
+        return count_tokens(messages)
+
+    def tool_names(self, messages: List[Dict]) -> Dict[str, str]:
+        names = {}
+        for message in messages:
+            for content in message.get('content', []):
+                if 'toolUse' in content:
+                    names[content['toolUse']['toolUseId']] = content['toolUse']['name']
+        return names
+
+    def tool_result_positions(self, messages: List[Dict]) -> List[Tuple[int, int]]:
+        return [(i, j) for i, message in enumerate(messages)
+                for j, content in enumerate(message.get('content', [])) if 'toolResult' in content]
+
+    def dedupe_text(self, text: str, seen: Dict[str, Tuple[int, int]], position: Tuple[int, int], referenced: set,
+                    max_chars: Optional[int] = None) -> str:
+        """Replaces paragraphs sent earlier; with `max_chars`, paragraphs past the truncation point are not counted as sent."""
+        paragraphs = text.split("\n\n")
+        end = -2
+        for k, paragraph in enumerate(paragraphs):
+            if len(paragraph) >= self.min_dedupe_chars:
+                key = hashlib.sha1(' '.join(paragraph.split()).encode()).hexdigest()
+                if key in seen:
+                    table = _CREATE_TABLE.search(paragraph)
+                    paragraphs[k] = f"[schema of {table.group(1)} omitted, sent earlier]" if table else "[repeated block omitted, sent earlier]"
+                    if seen[key] != position:
+                        referenced.add(seen[key])
+                elif max_chars is None or end + 2 + len(paragraph) <= max_chars:
+                    seen[key] = position
+            end += 2 + len(paragraphs[k])
+        return "\n\n".join(paragraphs)
+
+    def shrink_value(self, value: Any, seen: Dict, position: Tuple[int, int], referenced: set) -> Any:
+        if isinstance(value, dict):
+            return {k: self.shrink_value(v, seen, position, referenced) for k, v in value.items()}
+        if isinstance(value, list):
+            shrunk = [self.shrink_value(v, seen, position, referenced) for v in value[:self.max_rows]]
+            if len(value) > self.max_rows:
+                shrunk.append(f"[{len(value) - self.max_rows} more items omitted]")
+            return shrunk
+        if isinstance(value, str):
+            return truncate_text(self.dedupe_text(value, seen, position, referenced, self.max_chars), self.max_chars)
+        return value
+
+    def shrink_block(self, block: Dict, seen: Dict, position: Tuple[int, int], referenced: set) -> Dict:
+        if 'json' in block:
+            return {"json": self.shrink_value(block['json'], seen, position, referenced)}
+        if 'text' in block:
+            return {"text": truncate_text(self.dedupe_text(block['text'], seen, position, referenced, self.max_chars), self.max_chars)}
+        return block
+
+    def summarize_block(self, block: Dict, tool_name: Optional[str]) -> Dict:
+        if 'json' in block and isinstance(block['json'], dict):
+            summary = {}
+            for key, value in block['json'].items():
+                if isinstance(value, str):
+                    summary[key] = truncate_text(value, self.SUMMARY_CHARS)
+                elif isinstance(value, (list, dict)):
+                    summary[key] = f"[{len(value)} items omitted]"
+                else:
+                    summary[key] = value
+            return {"json": summary}
+        if 'text' in block:
+            return {"text": truncate_text(block['text'], self.SUMMARY_CHARS)}
+        return {"text": f"[{tool_name or 'tool'} result omitted]"}
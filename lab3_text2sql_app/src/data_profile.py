@@ -0,0 +1,281 @@
+import json
+import os
+import warnings
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+CHUNK_ROWS = 100_000
+
+
+def _scalar(value: Any) -> Any:
+    if pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def looks_like_dates(series: pd.Series) -> bool:
+    """Text column whose leading values are written as dates (CSV results carry dates as strings)."""
+    if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+        return False
+    head = series.dropna().head(50)
+    return not head.empty and bool(head.astype(str).str.contains(r'\d{4}-\d{2}|\d{1,2}/\d{1,2}/\d{2,4}', regex=True).all())
+
+
+def to_datetime(series: pd.Series) -> pd.Series:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return pd.to_datetime(series, errors='coerce')
+
+
+def _leading_zeros(values: np.ndarray) -> np.ndarray:
+    zeros = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        empty = values < (np.uint64(1) << np.uint64(64 - shift))
+        zeros[empty] += shift
+        values = np.where(empty, values << np.uint64(shift), values)
+    return zeros + (values == 0)
+
+
+class HyperLogLog:
+    """Distinct-count sketch over 64-bit hashes; about 1.6% standard error at the default precision."""
+    def __init__(self, precision: int = 12):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, hashes: np.ndarray):
+        if len(hashes) == 0:
+            return
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        rank = np.minimum(_leading_zeros(hashes << np.uint64(self.precision)), 64 - self.precision) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.exp2(-self.registers.astype(float)))
+        empty = int(np.count_nonzero(self.registers == 0))
+        # Linear counting is more accurate while many registers are still empty
+        return m * np.log(m / empty) if raw <= 2.5 * m and empty else raw
+
+
+class HeavyHitters:
+    """
+    Misra-Gries summary: keeps at most `capacity` candidates whose counts undercount by at most
+    `error`. While nothing has been evicted the counts are exact and cover every value.
+    """
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype='int64')
+        self.error = 0
+
+    def update(self, values: pd.Series):
+        if values.empty:
+            return
+        counts = values.value_counts(sort=False)
+        self.counts = counts if self.counts.empty else self.counts.add(counts, fill_value=0).astype('int64')
+        if len(self.counts) > self.capacity:
+            threshold = int(self.counts.nlargest(self.capacity + 1).iloc[-1])
+            self.counts = self.counts[self.counts > threshold] - threshold
+            self.error += threshold
+
+    def top(self, k: int) -> pd.Series:
+        return self.counts.nlargest(k)
+
+
+class KLLSketch:
+    """
+    Mergeable quantile sketch: a stack of compactors where each level's items weigh twice the
+    previous level's, and full levels promote every other sorted item. Seeded, so repeatable.
+    """
+    def __init__(self, k: int = 200, seed: int = 0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.random = np.random.default_rng(seed)
+        self.count = 0
+
+    def capacity(self, level: int) -> int:
+        return max(int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - level - 1))), 2)
+
+    def update(self, values: np.ndarray):
+        self.count += len(values)
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                paired = len(items) - len(items) % 2
+                self.levels[level + 1] = np.concatenate((self.levels[level + 1], items[self.random.integers(2):paired:2]))
+                self.levels[level] = items[paired:]
+            level += 1
+
+    def quantiles(self, qs: Iterable[float]) -> np.ndarray:
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_items), 2.0 ** level) for level, level_items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side='left')
+        return items[order][np.minimum(positions, len(items) - 1)]
+
+
+class ColumnProfiler:
+    """
+    Per-column statistics in one streaming pass over result chunks: null ratio, distinct count
+    (HyperLogLog), frequent values (Misra-Gries), and min/max plus quantiles (KLL) for numeric and
+    date columns. Memory stays constant however many rows are fed.
+    """
+    def __init__(self, sample_rows: int = 5, top_values: int = 8, max_chars: int = 60, quantiles=QUANTILES):
+        self.sample_rows = sample_rows
+        self.top_values = top_values
+        self.max_chars = max_chars
+        self.qs = quantiles
+        self.rows = 0
+        self.samples = []
+        self.columns = None
+
+    def init_columns(self, chunk: pd.DataFrame):
+        self.columns = {}
+        for name in chunk.columns:
+            series = chunk[name]
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                kind = "numeric"
+            elif pd.api.types.is_datetime64_any_dtype(series) or looks_like_dates(series):
+                kind = "date"
+            else:
+                kind = "text"
+            self.columns[name] = {"kind": kind, "dtype": str(series.dtype), "nulls": 0, "min": None, "max": None,
+                                  "hll": HyperLogLog(), "hitters": HeavyHitters(), "kll": KLLSketch()}
+
+    def update(self, chunk: pd.DataFrame) -> "ColumnProfiler":
+        if self.columns is None:
+            self.init_columns(chunk)
+        if len(self.samples) < self.sample_rows:
+            head = chunk.head(self.sample_rows - len(self.samples))
+            self.samples.extend(head.astype(object).where(head.notna(), None).to_dict(orient='records'))
+        self.rows += len(chunk)
+
+        for name, state in self.columns.items():
+            values = chunk[name].dropna()
+            state["nulls"] += len(chunk) - len(values)
+            if state["kind"] != "text":
+                ordered = pd.to_numeric(values, errors='coerce') if state["kind"] == "numeric" else to_datetime(values)
+                if ordered.isna().any():
+                    # A later chunk holds values that are not numbers/dates: keep counting it as text
+                    state["kind"], state["min"], state["max"] = "text", None, None
+                else:
+                    if state["kind"] == "date":
+                        numbers = ordered.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+                    else:
+                        numbers = ordered.to_numpy(dtype=float)
+                    if len(numbers):
+                        state["min"] = numbers.min() if state["min"] is None else min(state["min"], numbers.min())
+                        state["max"] = numbers.max() if state["max"] is None else max(state["max"], numbers.max())
+                    state["kll"].update(numbers.astype(float))
+                    state["hll"].update(pd.util.hash_array(numbers))
+                    state["hitters"].update(pd.Series(numbers))
+                    continue
+            text = values.astype(str).to_numpy(dtype=object)
+            state["hll"].update(pd.util.hash_array(text))
+            state["hitters"].update(pd.Series(text))
+        return self
+
+    def decode(self, state: Dict, value: Any) -> Any:
+        if state["kind"] == "date":
+            return pd.Timestamp(int(value)).isoformat()
+        if state["kind"] == "numeric":
+            return int(value) if float(value).is_integer() and state["dtype"].startswith(('int', 'Int')) else float(value)
+        return str(value)[:self.max_chars]
+
+    def result(self) -> Dict[str, Any]:
+        columns = []
+        for name, state in (self.columns or {}).items():
+            hitters = state["hitters"]
+            # With no evictions the frequent-value summary holds every value, so the count is exact
+            exact = hitters.error == 0
+            distinct = len(hitters.counts) if exact else int(round(state["hll"].estimate()))
+            column = {
+                "name": str(name),
+                "dtype": state["dtype"],
+                "nulls": int(state["nulls"]),
+                "null_ratio": round(state["nulls"] / self.rows, 4) if self.rows else 0.0,
+                "distinct": distinct
+            }
+            if not exact:
+                column["distinct_approximate"] = True
+            if state["kind"] != "text" and state["min"] is not None:
+                column["min"] = self.decode(state, state["min"])
+                column["max"] = self.decode(state, state["max"])
+                column["quantiles"] = {f"p{int(q * 100)}": self.decode(state, round(value) if state["kind"] == "date" else value)
+                                       for q, value in zip(self.qs, state["kll"].quantiles(self.qs))}
+            if distinct <= self.top_values or state["kind"] == "text":
+                column["top_values"] = {str(self.decode(state, value)): int(count) for value, count in hitters.top(self.top_values).items()}
+            columns.append(column)
+
+        return {
+            "rows": int(self.rows),
+            "columns": columns,
+            "sample_rows": [{k: (str(v)[:self.max_chars] if isinstance(v, str) else _scalar(v)) for k, v in row.items()}
+                            for row in self.samples]
+        }
+
+
+def profile_dataframe(df: pd.DataFrame, sample_rows: int = 5, top_values: int = 8, max_chars: int = 60) -> Dict[str, Any]:
+    """
+    Compact description of a result set for prompting: per-column dtype, null count and
+    cardinality, min/max and quantiles for numeric and date columns, the most frequent values,
+    plus a few sample rows. Its size does not grow with the row count.
+    """
+    profiler = ColumnProfiler(sample_rows, top_values, max_chars)
+    for start in range(0, max(len(df), 1), CHUNK_ROWS):
+        profiler.update(df.iloc[start:start + CHUNK_ROWS])
+    return profiler.result()
+
+
+def profile_file(data_file: str, chunk_rows: int = CHUNK_ROWS, **kwargs) -> Dict[str, Any]:
+    """Same profile as `profile_dataframe`, read from a CSV in chunks so the file is never fully loaded."""
+    profiler = ColumnProfiler(**kwargs)
+    if data_file.endswith('.parquet'):
+        df = pd.read_parquet(data_file)
+        chunks = (df.iloc[start:start + chunk_rows] for start in range(0, max(len(df), 1), chunk_rows))
+    else:
+        chunks = pd.read_csv(data_file, chunksize=chunk_rows)
+    for chunk in chunks:
+        profiler.update(chunk)
+    return profiler.result()
+
+
+def load_result_profile(data_file: str, dataframe: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+    """
+    Profile of a result file, cached next to it as `<file>.profile.json` and rebuilt when the file
+    changes. A `dataframe` already holding the file's rows is profiled instead of re-reading it.
+    """
+    stat = os.stat(data_file)
+    source = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    cache_file = f"{data_file}.profile.json"
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as file:
+            cached = json.load(file)
+        if cached.get("source") == source:
+            return cached["profile"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    profile = profile_dataframe(dataframe) if dataframe is not None else profile_file(data_file)
+    profile = json.loads(format_profile(profile))
+    temp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as file:
+        json.dump({"source": source, "profile": profile}, file, ensure_ascii=False, default=str)
+    os.replace(temp_file, cache_file)
+    return profile
+
+
+def format_profile(profile: Dict[str, Any]) -> str:
+    return json.dumps(profile, ensure_ascii=False, indent=1, default=str)
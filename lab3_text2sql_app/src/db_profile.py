@@ -0,0 +1,206 @@
+import argparse
+import json
+import os
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Union
+
+from sqlalchemy import create_engine, inspect, select, func, desc, Table, MetaData, String, LargeBinary, JSON, ARRAY, PickleType
+from sqlalchemy.engine import Engine, Connection, make_url
+
+# Types without a useful ordering or equality in SQL: only their null counts are profiled
+_OPAQUE_TYPES = (LargeBinary, JSON, ARRAY, PickleType)
+
+
+def _jsonable(value: Any, max_chars: int) -> Any:
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)[:max_chars]
+
+
+def database_identity(uri: str) -> str:
+    """The URI with its password masked; a profile only describes the database it was built from."""
+    return make_url(uri).render_as_string(hide_password=True)
+
+
+class DatabaseProfile:
+    """
+    Offline table and column statistics served to prompt building instead of live sample rows.
+
+    Each table keeps its row count and, per column, the non-null and distinct counts, null fraction,
+    min/max and most frequent values. Tables larger than `sample_rows` are profiled from their first
+    `sample_rows` rows (a LIMIT prefix, not a random sample, so skewed by insertion order). Like the
+    value index, `refresh` only re-profiles tables whose row count changed. `database` records the
+    password-masked URI the profile was built from.
+    """
+    def __init__(self, tables: Optional[Dict[str, Dict]] = None, sample_rows: int = 100000,
+                 top_values: int = 5, max_categories: int = 50, max_chars: int = 40, database: Optional[str] = None):
+        self.database = database
+        self.tables = tables or {}
+        self.sample_rows = sample_rows
+        self.top_values = top_values
+        self.max_categories = max_categories
+        self.max_chars = max_chars
+        self.built_at = 0.0
+        self.summaries = {}
+
+    @classmethod
+    def build(cls, bind: Union[Engine, Connection], **kwargs):
+        profile = cls(**kwargs)
+        profile.refresh(bind)
+        return profile
+
+    def refresh(self, bind: Union[Engine, Connection]) -> List[str]:
+        """Re-profiles tables that are new or whose row count changed, and drops tables that no longer exist."""
+        if isinstance(bind, Engine):
+            with bind.connect() as conn:
+                return self.refresh(conn)
+
+        conn = bind
+        metadata = MetaData()
+        table_names = inspect(conn).get_table_names()
+        refreshed = []
+        for table_name in table_names:
+            table = Table(table_name, metadata, autoload_with=conn)
+            row_count = conn.execute(select(func.count()).select_from(table)).scalar()
+            cached = self.tables.get(table_name)
+            if cached is not None and cached['row_count'] == row_count and set(cached['columns']) == set(table.columns.keys()):
+                continue
+            self.tables[table_name] = self.profile_table(conn, table, row_count)
+            refreshed.append(table_name)
+
+        for table_name in list(self.tables):
+            if table_name not in table_names:
+                del self.tables[table_name]
+                refreshed.append(table_name)
+        if refreshed:
+            self.summaries = {}
+        self.built_at = time.time()
+        return refreshed
+
+    def profile_table(self, conn: Connection, table: Table, row_count: int) -> Dict[str, Any]:
+        sampled = row_count > self.sample_rows
+        source = select(table).limit(self.sample_rows).subquery() if sampled else table
+        profiled = [c for c in source.columns if not isinstance(c.type, _OPAQUE_TYPES)]
+
+        # One scan for every column's counts and range
+        aggregates = [func.count()]
+        for column in source.columns:
+            aggregates.append(func.count(column))
+        for column in profiled:
+            aggregates += [func.count(func.distinct(column)), func.min(column), func.max(column)]
+        row = conn.execute(select(*aggregates).select_from(source)).one()
+
+        scanned = row[0]
+        non_null = dict(zip(source.columns.keys(), row[1:len(source.columns) + 1]))
+        ranges = row[len(source.columns) + 1:]
+        columns = {}
+        for column in source.columns:
+            count = non_null[column.name]
+            columns[column.name] = {
+                "type": str(column.type),
+                "text": isinstance(column.type, String),
+                "non_null": count,
+                "null_fraction": round(1 - count / scanned, 4) if scanned else 0.0
+            }
+        for i, column in enumerate(profiled):
+            distinct, minimum, maximum = ranges[3 * i:3 * i + 3]
+            stats = columns[column.name]
+            stats.update(distinct=distinct, min=_jsonable(minimum, self.max_chars), max=_jsonable(maximum, self.max_chars))
+            if distinct and (stats["text"] or distinct <= min(self.max_categories, stats["non_null"] - 1)):
+                frequent = conn.execute(
+                    select(column, func.count().label('n')).select_from(source).where(column.isnot(None))
+                    .group_by(column).order_by(desc('n'), column).limit(self.top_values)
+                ).all()
+                stats["top_values"] = [[_jsonable(value, self.max_chars), n] for value, n in frequent]
+        return {"row_count": row_count, "sampled_rows": scanned if sampled else None, "columns": columns}
+
+    def format_column(self, stats: Dict[str, Any]) -> str:
+        parts = []
+        distinct = stats.get('distinct')
+        unique = distinct is not None and distinct == stats['non_null'] and distinct > 0
+        if distinct is not None:
+            parts.append("unique" if unique else f"{distinct} distinct")
+        if stats['null_fraction']:
+            parts.append(f"{stats['null_fraction']:.0%} null")
+        top_values = stats.get('top_values')
+        if stats.get('min') is not None and not (stats.get('text') and top_values):
+            parts.append(f"range {stats['min']}..{stats['max']}")
+        if top_values:
+            # Values of a unique column only show its format
+            top_values = top_values[:2] if unique else top_values
+            values = ", ".join(repr(value) for value, _ in top_values)
+            parts.append(f"values {values}" if distinct is not None and distinct <= len(top_values) else f"e.g. {values}")
+        return ", ".join(parts)
+
+    def column_summaries(self, table_name: str) -> Dict[str, str]:
+        """Prompt text per column, formatted once per table."""
+        if table_name not in self.summaries:
+            table = self.tables.get(table_name)
+            if table is None:
+                return {}
+            self.summaries[table_name] = {name: self.format_column(stats) for name, stats in table['columns'].items()}
+        return self.summaries[table_name]
+
+    def row_count_note(self, table_name: str) -> str:
+        table = self.tables[table_name]
+        sampled = f", statistics from the first {table['sampled_rows']} rows" if table.get('sampled_rows') else ""
+        return f"{table['row_count']} rows{sampled}"
+
+    def format_table(self, table_name: str) -> str:
+        summaries = self.column_summaries(table_name)
+        lines = "\n".join(f"{name}: {summary}" for name, summary in summaries.items() if summary)
+        table = self.tables[table_name]
+        sampled = f" from the first {table['sampled_rows']} rows" if table.get('sampled_rows') else ""
+        # Same header as live sample rows, so callers parsing "<n> rows from <table> table" keep working
+        return f"{table['row_count']} rows from {table_name} table (column statistics{sampled}):\n{lines}"
+
+    def save(self, file_path: str):
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        data = {
+            "database": self.database,
+            "built_at": self.built_at,
+            "sample_rows": self.sample_rows,
+            "top_values": self.top_values,
+            "tables": self.tables
+        }
+        temp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False, indent=1)
+        os.replace(temp_path, file_path)
+
+    @classmethod
+    def load(cls, file_path: str, **kwargs):
+        with open(file_path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        kwargs.setdefault('sample_rows', data.get('sample_rows', 100000))
+        kwargs.setdefault('top_values', data.get('top_values', 5))
+        kwargs.setdefault('database', data.get('database'))
+        profile = cls(data.get('tables', {}), **kwargs)
+        profile.built_at = data.get('built_at', 0.0)
+        return profile
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile every table of a database into the metadata artifacts. "
+                                                 "Rerunning re-profiles only tables whose row count changed.")
+    parser.add_argument("--uri", default="sqlite:///Chinook.db")
+    parser.add_argument("--output", default="../db_metadata/chinook_db_profile.json")
+    parser.add_argument("--sample-rows", type=int, default=100000)
+    parser.add_argument("--top-values", type=int, default=5)
+    args = parser.parse_args()
+
+    kwargs = {"sample_rows": args.sample_rows, "top_values": args.top_values}
+    database = database_identity(args.uri)
+    profile = DatabaseProfile.load(args.output, **kwargs) if os.path.exists(args.output) else None
+    if profile is None or profile.database != database:
+        # Statistics of another database are never carried over
+        profile = DatabaseProfile(database=database, **kwargs)
+    refreshed = profile.refresh(create_engine(args.uri))
+    profile.save(args.output)
+    print(json.dumps({"tables": len(profile.tables), "refreshed": refreshed, "output": args.output}, indent=2))
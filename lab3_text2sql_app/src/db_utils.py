@@ -1,25 +1,39 @@
-from botocore.config import Config
-import boto3
 import pandas as pd
+import copy
 import uuid
 import pytz
+import hashlib
+import time
 import json
 import logging
 import os
 import re
-import streamlit as st
+import threading
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from sqlalchemy import create_engine
 from typing import List, Dict, Any, Union
 
 from sqlalchemy import inspect, MetaData, Table, select
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.schema import CreateTable
 from sqlalchemy import exc as sa_exc
 
-from .common_utils import parse_json_format, stream_converse_messages
+from .bedrock_gateway import get_bedrock_client
+from .callbacks import PipelineCallbacks, NullStreamHandler
+from .config import load_pipeline_config
+from .context_compactor import ConversationCompactor
+from .data_profile import load_result_profile
+from .db_profile import DatabaseProfile, database_identity
+from .tracing import tracer
+from .json_stream import parse_json_format, converse_stream_json, stream_converse_messages, JSONParseError
 from .opensearch import OpenSearchVectorRetriever, OpenSearchClient
+from .schema_linker import SchemaLinker
+from .join_graph import JoinGraph
+from .schema_context import SchemaContextBuilder
+from .value_index import CategoricalValueIndex
 from .prompts import (
     get_table_selection_prompt, 
     get_query_generation_prompt, 
@@ -31,44 +45,80 @@ from .prompts import (
 
 warnings.filterwarnings('ignore', category=sa_exc.SAWarning)
 
-class SQLDatabase:
-    def __init__(self, engine: Engine):
-        self.engine = engine
-        self.metadata = MetaData()
+# Schema linkers and join graphs are expensive to build, so they are shared across questions
+_schema_linkers = {}
+_join_graphs = {}
+_value_indexes = {}
+# Guards _value_indexes and the set of URIs whose index one session is refreshing
+_value_indexes_lock = threading.Lock()
+_value_index_refreshes = set()
+# Offline column statistics, loaded once per artifact file and database and served to every prompt
+_db_profiles = {}
 
-    def get_table_info(self, table_names: List[str]) -> str:
-        inspector = inspect(self.engine)
-        all_table_names = inspector.get_table_names()
+# One engine (and connection pool) per database URI, shared by all sessions in the process
+_engines = {}
+_engines_lock = threading.Lock()
 
-        if not set(table_names).issubset(all_table_names):
-            missing_tables = set(table_names) - set(all_table_names)
-            raise ValueError(f"table_names {missing_tables} not found in database")
+# Runs EXPLAIN and query execution while the model is still streaming the rest of its answer
+_prefetch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="db-prefetch")
 
-        table_info = []
-        for table_name in table_names:
-            # Get table DDL
-            table = Table(table_name, self.metadata, autoload_with=self.engine)
-            create_table = str(CreateTable(table).compile(self.engine))
+def get_table_info(conn: Connection, table_names: List[str], metadata: MetaData = None, profile: DatabaseProfile = None) -> str:
+    """CREATE TABLE statements, each followed by sample rows (or profile statistics) in a comment."""
+    all_table_names = inspect(conn).get_table_names()
 
-            # Get sample rows
-            sample_rows = self.get_sample_rows(table)
+    if not set(table_names).issubset(all_table_names):
+        missing_tables = set(table_names) - set(all_table_names)
+        raise ValueError(f"table_names {missing_tables} not found in database")
 
-            table_info.append(f"{create_table.rstrip()}\n\n/*\n{sample_rows}\n*/")
+    metadata = metadata if metadata is not None else MetaData()
+    table_info = []
+    for table_name in table_names:
+        # Get table DDL
+        table = Table(table_name, metadata, autoload_with=conn)
+        create_table = str(CreateTable(table).compile(dialect=conn.dialect))
 
-        return "\n\n".join(table_info)
-    
-    def get_sample_rows(self, table: Table) -> str:
-        query = select(table).limit(3)
+        # Get sample rows
+        sample_rows = get_sample_rows(conn, table, profile)
+
+        table_info.append(f"{create_table.rstrip()}\n\n/*\n{sample_rows}\n*/")
+
+    return "\n\n".join(table_info)
+
+def get_sample_rows(conn: Connection, table: Table, profile: DatabaseProfile = None) -> str:
+    if profile is not None and table.name in profile.tables:
+        return profile.format_table(table.name)
+
+    result = conn.execute(select(table).limit(3))
+    rows = result.fetchall()
+
+    if not rows:
+        return "No rows found"
+
+    column_names = result.keys()
+    rows_str = "\n".join([str(dict(zip(column_names, row))) for row in rows])
+    return f"3 rows from {table.name} table:\n{rows_str}"
+
+class SQLDatabase:
+    def __init__(self, engine: Engine, profile: DatabaseProfile = None):
+        self.engine = engine
+        self.metadata = MetaData()
+        self.profile = profile
+
+    def get_table_info(self, table_names: List[str]) -> str:
         with self.engine.connect() as conn:
-            result = conn.execute(query)
-            rows = result.fetchall()
+            return get_table_info(conn, table_names, self.metadata, self.profile)
 
-        if not rows:
-            return "No rows found"
+    def get_tables(self, table_names: List[str]) -> List[Table]:
+        all_table_names = self.get_usable_table_names()
+        missing_tables = set(table_names) - set(all_table_names)
+        if missing_tables:
+            raise ValueError(f"table_names {missing_tables} not found in database")
+        return [Table(table_name, self.metadata, autoload_with=self.engine) for table_name in table_names]
 
-        column_names = result.keys()
-        rows_str = "\n".join([str(dict(zip(column_names, row))) for row in rows])
-        return f"3 rows from {table.name} table:\n{rows_str}"
+    def get_sample_row_dicts(self, table: Table, limit: int = 3) -> List[Dict[str, Any]]:
+        with self.engine.connect() as conn:
+            result = conn.execute(select(table).limit(limit))
+            return [dict(row._mapping) for row in result.fetchall()]
     
 
     def get_table_schemas(self, table_names: List[str]) -> Dict[str, Dict]:
@@ -118,6 +168,12 @@ class SQLDatabase:
         inspector = inspect(self.engine)
         return inspector.get_table_names()
 
+    def get_join_graph(self, refresh: bool = False) -> JoinGraph:
+        key = str(self.engine.url)
+        if refresh or key not in _join_graphs:
+            _join_graphs[key] = JoinGraph.from_engine(self.engine)
+        return _join_graphs[key]
+
     def run(self, query: str) -> Union[str, List[Dict[str, Any]]]:
         with self.engine.connect() as conn:
             result = conn.execute(query)
@@ -129,33 +185,49 @@ class SQLDatabase:
         return [dict(row) for row in rows]
 
 
-class DB_Tools:
-    def __init__(self, tokens: dict, uri: str, dialect: str, model: str, region: str, sql_os_client: OpenSearchClient, schema_os_client: OpenSearchClient, language: str, prompt: str, history: str):
-        self.tokens = tokens
-        self.uri = uri
-        self.dialect = dialect
-        self.model = model
-        self.region = region
-        self.language = language
-        self.sql_os_client = sql_os_client
-        self.schema_os_client = schema_os_client
-        self.boto3_client = self.init_boto3_client(region)
-        self.engine = create_engine(uri)
-        self.db = SQLDatabase(self.engine)
-        #self.prompt = self.prompt_refinement(prompt, history)
-        self.prompt = prompt
-        self.init_tool_state(prompt)
-        self.samples = self.collect_samples()
-        self.display_samples()
-        self.retry = 0
+def get_engine(uri: str) -> Engine:
+    with _engines_lock:
+        if uri not in _engines:
+            pool_config = load_pipeline_config().get('engine_pool', {})
+            url = make_url(uri)
+            # Sizing arguments only apply to QueuePool; SQLite gets NullPool (files, SQLAlchemy 1.4)
+            # or SingletonThreadPool (in memory), which reject them
+            if not pool_config or not issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+                _engines[uri] = create_engine(uri)
+            else:
+                _engines[uri] = create_engine(
+                    uri,
+                    pool_size=pool_config.get('pool_size', 5),
+                    max_overflow=pool_config.get('max_overflow', 10),
+                    pool_timeout=pool_config.get('pool_timeout', 30),
+                    pool_pre_ping=pool_config.get('pool_pre_ping', True)
+                )
+        return _engines[uri]
 
-    def init_boto3_client(self, region: str):
-        retry_config = Config(
-            region_name=region,
-            retries={"max_attempts": 10, "mode": "standard"}
-        )
-        return boto3.client("bedrock-runtime", region_name=region, config=retry_config)
 
+def pool_status(engine: Engine) -> Dict[str, Any]:
+    pool = engine.pool
+    status = {"pool": type(pool).__name__}
+    for name in ("size", "checkedout", "overflow", "checkedin"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            status[name] = method()
+    if "size" in status:
+        status["capacity"] = status["size"] + max(getattr(pool, '_max_overflow', 0), 0)
+    return status
+
+
+def init_compactor(pipeline_config):
+    compaction_config = pipeline_config.get('context_compaction', {})
+    if not compaction_config.get('enabled', True):
+        return None
+    return ConversationCompactor.from_config(compaction_config)
+
+
+class DB_ToolState:
+    # Tool state and bookkeeping shared by the sync and async tool implementations
+    # Set by benchmarks whose questions come from the sample corpus: a question's own example is not a few-shot sample
+    exclude_own_sample = False
     def init_tool_state(self, prompt):
         self.tool_state = {
             "user_prompt": prompt,
@@ -174,182 +246,12 @@ class DB_Tools:
         self.tokens["total_input_tokens"] += res["usage"]["inputTokens"]
         self.tokens["total_output_tokens"] += res["usage"]["outputTokens"]
 
-    def collect_samples(self):
-        with st.spinner("Collecting Sample Queries..."):
-            return self.get_sample_queries()
-
-    def display_samples(self):
-        with st.expander("Referenced Sample Queries (Click to expand)", expanded=False):
-            self.print_sql_samples(self.samples)
-
-    def print_sql_samples(self, selected_samples: List[str]) -> None:
-        if not selected_samples:
-            st.text("There is no similar samples.")
-            return
-        
-        for sample in selected_samples:
-            try:
-                input_text = sample.get('input', 'No input available')
-                query = sample.get('query', 'No query available')
-
-                st.markdown(f"**Input:** {input_text}")
-                st.markdown(f"**Query:**")
-                st.code(query, language='sql')
-                st.markdown('<div style="margin: 5px 0;"><hr style="border: none; border-top: 1px solid #ccc; margin: 0;" /></div>', unsafe_allow_html=True)
-            except Exception as e:
-                st.text(f"Error processing sample: {str(e)}") 
- 
-    def get_sample_queries(self): 
-        sql_os_retriever = OpenSearchVectorRetriever(
-            self.sql_os_client, 
-            self.region, 
-            k=10
-        )
-        samples = sql_os_retriever.vector_search(self.prompt, self.sql_os_client.index_name)
-        page_contents = [json.loads(doc.page_content) for doc in samples]
-
-        bedrock_agent_runtime = boto3.client('bedrock-agent-runtime', region_name=self.region)
-        rerank_model_id = "cohere.rerank-v3-5:0"
-        model_package_arn = f"arn:aws:bedrock:{self.region}::foundation-model/{rerank_model_id}"
-
-        text_sources = [
-            {
-                "type": "INLINE",
-                "inlineDocumentSource": {
-                    "type": "TEXT",
-                    "textDocument": {
-                        "text": content['input'],
-                    }
-                }
-            } for content in page_contents
-        ]
-
-        response = bedrock_agent_runtime.rerank(
-                    queries=[
-                        {
-                            "type": "TEXT",
-                            "textQuery": {
-                                "text": self.prompt
-                            }
-                        }
-                    ],
-                    sources=text_sources,
-                    rerankingConfiguration={
-                        "type": "BEDROCK_RERANKING_MODEL",
-                        "bedrockRerankingConfiguration": {
-                            "numberOfResults": 3,
-                            "modelConfiguration": {
-                                "modelArn": model_package_arn,
-                            }
-                        }
-                    }
-                )
-        
-        reranked_samples = []
-        for result in response['results']:
-            index = result['index']
-            sample_input = page_contents[index]['input']
-            sample_query = page_contents[index]['query']
-            reranked_samples.append({
-                'input': sample_input,
-                'query': sample_query,
-            })
-
-        return reranked_samples
-
-
-    def get_table_summaries_by_similarities(self):
-        schema_os_retriever = OpenSearchVectorRetriever(
-            self.schema_os_client, 
-            self.region, 
-            k=5
-        )
-        matched_tables = schema_os_retriever.vector_search(self.prompt, self.schema_os_client.index_name)
-
-        serializable_tables = []
-        for document in matched_tables:
-            table_data = json.loads(document.page_content)
-            serializable_tables.append(table_data)
-
-        return json.dumps(serializable_tables, ensure_ascii=False)
-
-    def get_table_summaries_all(self):
-        schema_os_retriever = OpenSearchVectorRetriever(
-            self.schema_os_client, 
-            self.region
-        )
-        documents = schema_os_retriever.get_all_documents(self.schema_os_client.index_name)
-
-        table_descriptions = {}
-        for doc in documents:
-            content = json.loads(doc.page_content)
-            table_name = content['table_name']
-            table_desc = content['table_summary']
-            table_descriptions[table_name] = table_desc
-
-        return table_descriptions
-
-    def get_column_description(self, table_name: str) -> Dict[str, str]:
-        query = {
-            "_source": ["columns.col_name", "columns.col_desc"],
-            "query": {
-                "match": {
-                    "table_name": table_name
-                }
-            }
-        }
-        response = self.schema_os_client.conn.search(index=self.schema_os_client.index_name, body=query)
-        if response['hits']['total']['value'] > 0:
-            source = response['hits']['hits'][0]['_source']
-            columns = source.get('columns', [])
-            if columns:
-                return {col['col_name']: col['col_desc'] for col in columns}
-            else:
-                return {}
-        else:
-            return {}
-
-    def get_table_schemas(self, table_names: List[str]) -> Dict[str, Dict]:
-        try:
-            tables = [t.strip() for t in table_names]
-            sql_statements = {}
-            sample_data = {}
-            data = self.db.get_table_info(tables)
-            if not data:
-                logging.warning("No data returned from DB")
-                return {}
+    # Dialects whose EXPLAIN form runs the statement: drafts are only explained once handed to validation
+    EXECUTING_EXPLAIN_DIALECTS = {'postgresql', 'postgres', 'redshift', 'presto', 'sqlserver'}
 
-            statements = data.split("\n\n")
+    def can_prefetch_plan(self):
+        return self.dialect.lower() not in self.EXECUTING_EXPLAIN_DIALECTS
 
-            for statement in statements:
-                if "CREATE TABLE" in statement:
-                    table_match = re.search(r"CREATE TABLE (?:`|\")?(\w+)(?:`|\")?", statement)
-                    if table_match:
-                        table_name = table_match.group(1)
-                        sql_statements[table_name] = statement.split("/*")[0].strip()
-                elif "rows from" in statement:
-                    table_name_match = re.search(r"rows from (\w+) table", statement)
-                    if table_name_match:
-                        table_name = table_name_match.group(1)
-                        sample_data[table_name] = statement.strip()
-
-            table_details = {}
-            for table in tables:
-                table_desc = self.get_column_description(table)
-                table_details[table] = {
-                    "table": table,
-                    "cols": table_desc if table_desc else {},
-                    "create_table_sql": sql_statements.get(table, "Not available"),
-                    "sample_data": sample_data.get(table, "No sample data available")
-                }
-
-                if not table_details[table]["cols"]:
-                    print(f"No columns found for table {table}")
-            return table_details
-        except Exception as e:
-            logging.error(f"Error in get_table_schemas: {str(e)}")
-            return {}
-    
     def get_explain_query(self, original_query):
         explain_statements = {
             'mysql': "EXPLAIN {query}",
@@ -406,87 +308,9 @@ class DB_Tools:
         return {
             "failure_log": log,
             "next_action": action
-        } 
-
-    def prompt_refinement(self, original_prompt, history):
-        today = datetime.now(pytz.timezone('Asia/Seoul')).strftime('%Y-%m-%d')
-
-        with st.spinner(f"Refining a prompt"):
-            sys_prompt, usr_prompt = get_prompt_refinement_prompt(original_prompt, today, history, self.language)
-            response = self.boto3_client.converse(modelId=self.model, messages=usr_prompt, system=sys_prompt)
-        self.update_tokens(response)
-        parsed_json = parse_json_format(response['output']['message']['content'][0]['text'])
-        refined_prompt = parsed_json.get("refined_prompt")
-        with st.expander("Auto-refined Prompt (Click to expand)", expanded=False): 
-            st.write(refined_prompt)
-        return refined_prompt
-
-    def query_generation(self, input: str): # dummy input
-        table_names = self.db.get_usable_table_names()
-        combined_log = """
-        failure_log: {failure_log}
-        failed_query: {failed_query}
-        retry_hint: {search_result}
-        """.format(failure_log=self.tool_state["failure_log"], failed_query=self.tool_state["failed_query"], search_result=self.tool_state["search_result"])
-
-        table_summaries = self.get_table_summaries_by_similarities() # RAG    
-
-        # Table Selection
-        sys_prompt, usr_prompt = get_table_selection_prompt(table_summaries, self.prompt, self.samples, combined_log)
-        response = self.boto3_client.converse(
-            modelId=self.model,
-            messages=usr_prompt,
-            system=sys_prompt
-        )
-        self.update_tokens(response)
-        # Loading Table Schemas
-        table_names = response['output']['message']['content'][0]['text'].split(',')
-        table_schemas = self.get_table_schemas(table_names)
-        
-        # SQL Query Generation
-        sys_prompt, usr_prompt = get_query_generation_prompt(self.samples, self.dialect, table_schemas, self.language, self.prompt, combined_log)
-        response = self.boto3_client.converse(
-            modelId=self.model,
-            messages=usr_prompt,
-            system=sys_prompt
-        )
-        self.update_tokens(response)
-        parsed_json = parse_json_format(response['output']['message']['content'][0]['text'])
-        return parsed_json
-
-    def validate_and_run_queries(self, generated_query: str):
-        self.tool_state["initial_query"] = generated_query
-        explain_query = self.get_explain_query(generated_query)
-        try:
-            query_plan = self.db.run(explain_query)
-        except Exception as e:
-            print(self.tool_state)
-            return self.query_failure_handling(f"[E01] An error occurred while generating the EXPLAIN query: {str(e)}", generated_query)
-    
-        try:
-            sys_prompt, usr_prompt = get_query_validation_prompt(self.dialect, query_plan, generated_query, self.language, self.prompt)
-            response = self.boto3_client.converse(
-                modelId=self.model,
-                messages=usr_prompt,
-                system=sys_prompt
-            )
-            self.update_tokens(response)
-            
-            parsed_json = parse_json_format(response['output']['message']['content'][0]['text'])
-            query = parsed_json.get("final_query") 
-            #output_columns = parsed_json.get("output_columns")
-
-        except Exception as e:
-            print(self.tool_state)
-            return self.query_failure_handling(f"[E02] An issue unrelated to the query was encountered: {str(e)} (Model-related problem)", generated_query)
-  
-        try:
-            result = self.db.run(query)
-
-        except Exception as e:
-            print(self.tool_state)
-            return self.query_failure_handling(f"[E03] An error occurred while executing the final query: {str(e)}", query)
+        }
 
+    def record_query_result(self, query, result):
         if result is None or (isinstance(result, (list, tuple)) and len(result) == 0):
             self.tool_state["final_query"] = query
             self.tool_state["result_csv_file"] = "No data found from query execution" 
@@ -494,7 +318,8 @@ class DB_Tools:
             return {"message": "Query executed successfully, but no matching data found."}
         
         try:
-            csv_file, query_file, df = self.save_to_csv(result, query)
+            with tracer.span("csv_write", rows=len(result)):
+                csv_file, query_file, df = self.save_to_csv(result, query)
         except Exception as e:
             print(self.tool_state)
             return self.query_failure_handling(f"[E04] An error occurred while saving the results to CSV: {str(e)}", query)
@@ -504,13 +329,238 @@ class DB_Tools:
         self.tool_state["result_csv_file"] = csv_file
         if len(df) > 20:
             self.tool_state["partial_result"] = df[:20].to_dict(orient='records')
+            # Statistics over every row, so the answer does not rely on the first 20 alone
+            try:
+                with tracer.span("result_profile", rows=len(df)):
+                    profile = load_result_profile(csv_file, df)
+                self.tool_state["result_profile"] = {"rows": profile["rows"], "columns": profile["columns"]}
+            except Exception as e:
+                logging.warning(f"Result profiling failed for {csv_file}: {str(e)}")
         else:
             self.tool_state["full_result"] = df.to_dict(orient='records')
         self.tool_state["success"] = "True"
         return {"message": "Query executed successfully"}
 
-    def schema_explorer(self, keyword: str):
-        query = {
+    def update_retry_state(self, res):
+        if 'failure_log' not in res:
+            self.retry = 0
+            self.tool_state["failure_log"] = "None"
+            self.tool_state["failed_query"] = "None"
+        else:
+            self.retry += 1
+
+    def combined_log(self):
+        return """
+        failure_log: {failure_log}
+        failed_query: {failed_query}
+        retry_hint: {search_result}
+        """.format(failure_log=self.tool_state["failure_log"], failed_query=self.tool_state["failed_query"], search_result=self.tool_state["search_result"])
+
+    def schema_context_builder(self):
+        context_config = self.pipeline_config.get('schema_context', {})
+        return SchemaContextBuilder(
+            token_budget=context_config.get('token_budget', 2000),
+            top_k_columns=context_config.get('top_k_columns', 12),
+            sample_rows=context_config.get('sample_rows', 3)
+        )
+
+    def record_schema_context(self, schema_context):
+        self.tokens['context_tokens_saved'] = self.tokens.get('context_tokens_saved', 0) + schema_context.tokens_saved
+        logging.info(f"Schema context: {schema_context.tokens} tokens (full: {schema_context.full_tokens}, saved: {schema_context.tokens_saved})")
+        return schema_context.text
+
+    def value_index_cache_file(self, index_config):
+        cache_dir = index_config.get('cache_dir', './metadata_cache')
+        return os.path.join(cache_dir, f"value_index_{hashlib.sha1(self.uri.encode()).hexdigest()[:12]}.json")
+
+    def load_value_index(self, index_config):
+        with _value_indexes_lock:
+            if self.uri not in _value_indexes:
+                index_kwargs = {
+                    "max_distinct": index_config.get('max_distinct', 300),
+                    "sample_rows": index_config.get('sample_rows', 100000)
+                }
+                cache_file = self.value_index_cache_file(index_config)
+                if os.path.exists(cache_file):
+                    _value_indexes[self.uri] = CategoricalValueIndex.load(cache_file, **index_kwargs)
+                else:
+                    _value_indexes[self.uri] = CategoricalValueIndex(**index_kwargs)
+            return _value_indexes[self.uri]
+
+    def claim_value_index_refresh(self, value_index, index_config):
+        """
+        A copy of a stale index for this session to refresh, or None if it is fresh or another
+        session is already refreshing it. Other sessions keep reading the old index meanwhile.
+        """
+        if time.time() - value_index.built_at <= index_config.get('refresh_interval', 3600):
+            return None
+        with _value_indexes_lock:
+            # Already replaced by a refreshed copy, or being refreshed
+            if _value_indexes.get(self.uri) is not value_index or self.uri in _value_index_refreshes:
+                return None
+            _value_index_refreshes.add(self.uri)
+        fresh = copy.copy(value_index)
+        fresh.columns = dict(value_index.columns)
+        return fresh
+
+    def release_value_index_refresh(self):
+        with _value_indexes_lock:
+            _value_index_refreshes.discard(self.uri)
+
+    def save_value_index(self, value_index, refreshed):
+        value_index.save(self.value_index_cache_file(self.pipeline_config.get('value_index', {})))
+        with _value_indexes_lock:
+            _value_indexes[self.uri] = value_index
+        if refreshed:
+            logging.info(f"Value index refreshed {len(refreshed)} columns")
+            _schema_linkers.pop((self.uri, self.schema_os_client.index_name), None)
+
+    def load_db_profile(self):
+        profile_config = self.pipeline_config.get('db_profile', {})
+        if not profile_config.get('enabled', True):
+            return None
+        file_path = profile_config.get('file', '../db_metadata/chinook_db_profile.json')
+        # Keyed by database too: the artifact only applies to the database it was built from
+        key = (file_path, database_identity(self.uri))
+        if key not in _db_profiles:
+            profile = None
+            try:
+                profile = DatabaseProfile.load(file_path) if os.path.exists(file_path) else None
+            except Exception as e:
+                logging.warning(f"Database profile {file_path} could not be loaded: {str(e)}")
+            if profile is not None and profile.database != key[1]:
+                logging.info(f"Database profile {file_path} was built from {profile.database}, not {key[1]}")
+                profile = None
+            if profile is None:
+                logging.info(f"No database profile for {key[1]}; prompts use live sample rows")
+            _db_profiles[key] = profile
+        return _db_profiles[key]
+
+    def without_own_sample(self, page_contents):
+        if not self.exclude_own_sample:
+            return page_contents
+        question = ' '.join(self.prompt.split()).lower()
+        return [content for content in page_contents if ' '.join(content.get('input', '').split()).lower() != question]
+
+    def rerank_request(self, page_contents):
+        rerank_model_id = "cohere.rerank-v3-5:0"
+        model_package_arn = f"arn:aws:bedrock:{self.region}::foundation-model/{rerank_model_id}"
+
+        text_sources = [
+            {
+                "type": "INLINE",
+                "inlineDocumentSource": {
+                    "type": "TEXT",
+                    "textDocument": {
+                        "text": content['input'],
+                    }
+                }
+            } for content in page_contents
+        ]
+
+        return {
+            "queries": [
+                {
+                    "type": "TEXT",
+                    "textQuery": {
+                        "text": self.prompt
+                    }
+                }
+            ],
+            "sources": text_sources,
+            "rerankingConfiguration": {
+                "type": "BEDROCK_RERANKING_MODEL",
+                "bedrockRerankingConfiguration": {
+                    "numberOfResults": 3,
+                    "modelConfiguration": {
+                        "modelArn": model_package_arn,
+                    }
+                }
+            }
+        }
+
+    def reranked_samples(self, page_contents, response):
+        reranked_samples = []
+        for result in response['results']:
+            index = result['index']
+            sample_input = page_contents[index]['input']
+            sample_query = page_contents[index]['query']
+            reranked_samples.append({
+                'input': sample_input,
+                'query': sample_query,
+            })
+        return reranked_samples
+
+    def schema_descriptions_query(self):
+        return {
+            "size": 1000,
+            "_source": ["table_name", "table_desc", "columns.col_name", "columns.col_desc"],
+            "query": {"match_all": {}}
+        }
+
+    def schema_descriptions(self, response) -> Dict[str, Dict]:
+        descriptions = {}
+        for hit in response['hits']['hits']:
+            source = hit['_source']
+            descriptions[source['table_name']] = {
+                'desc': source.get('table_desc', ''),
+                'cols': {col['col_name']: col['col_desc'] for col in source.get('columns', [])}
+            }
+        return descriptions
+
+    def column_description_query(self, table_name: str):
+        return {
+            "_source": ["columns.col_name", "columns.col_desc"],
+            "query": {
+                "match": {
+                    "table_name": table_name
+                }
+            }
+        }
+
+    def column_descriptions(self, response) -> Dict[str, str]:
+        if response['hits']['total']['value'] > 0:
+            source = response['hits']['hits'][0]['_source']
+            columns = source.get('columns', [])
+            if columns:
+                return {col['col_name']: col['col_desc'] for col in columns}
+            else:
+                return {}
+        else:
+            return {}
+
+    def table_schemas(self, tables: List[str], data: str, col_descs: Dict[str, Dict]) -> Dict[str, Dict]:
+        # Splits get_table_info output into per-table DDL and sample data
+        sql_statements = {}
+        sample_data = {}
+        for statement in data.split("\n\n"):
+            if "CREATE TABLE" in statement:
+                table_match = re.search(r"CREATE TABLE (?:`|\")?(\w+)(?:`|\")?", statement)
+                if table_match:
+                    table_name = table_match.group(1)
+                    sql_statements[table_name] = statement.split("/*")[0].strip()
+            elif "rows from" in statement:
+                table_name_match = re.search(r"rows from (\w+) table", statement)
+                if table_name_match:
+                    table_name = table_name_match.group(1)
+                    sample_data[table_name] = statement.strip()
+
+        table_details = {}
+        for table in tables:
+            table_desc = col_descs.get(table)
+            table_details[table] = {
+                "table": table,
+                "cols": table_desc if table_desc else {},
+                "create_table_sql": sql_statements.get(table, "Not available"),
+                "sample_data": sample_data.get(table, "No sample data available")
+            }
+
+            if not table_details[table]["cols"]:
+                print(f"No columns found for table {table}")
+        return table_details
+
+    def schema_explorer_query(self, keyword: str):
+        return {
             "size": 10, 
             "query": {
                 "nested": {
@@ -528,11 +578,8 @@ class DB_Tools:
             },
             "_source": ["table_name"]
         }
-        response = self.schema_os_client.conn.search(
-            index=self.schema_os_client.index_name,
-            body=query
-        )
 
+    def schema_explorer_result(self, keyword: str, response):
         try:
             results = []
             table_names = set()  # To store unique table names
@@ -561,20 +608,328 @@ class DB_Tools:
             "tables_hits": table_names_list
         }
 
+class DB_Tools(DB_ToolState):
+    def __init__(self, tokens: dict, uri: str, dialect: str, model: str, region: str, sql_os_client: OpenSearchClient, schema_os_client: OpenSearchClient, language: str, prompt: str, history: str, callbacks: PipelineCallbacks = None,
+                 exclude_own_sample: bool = False):
+        self.tokens = tokens
+        self.exclude_own_sample = exclude_own_sample
+        self.callbacks = callbacks or NullStreamHandler()
+        self.uri = uri
+        self.dialect = dialect
+        self.model = model
+        self.region = region
+        self.language = language
+        self.sql_os_client = sql_os_client
+        self.schema_os_client = schema_os_client
+        self.boto3_client = self.init_boto3_client(region)
+        self.engine = get_engine(uri)
+        self.pipeline_config = load_pipeline_config()
+        self.db = SQLDatabase(self.engine, self.load_db_profile())
+        #self.prompt = self.prompt_refinement(prompt, history)
+        self.prompt = prompt
+        self.init_tool_state(prompt)
+        self.samples = self.collect_samples()
+        self.display_samples()
+        self.retry = 0
+        self.plan_prefetch = {}
+        self.pending = set()
+
+    def init_boto3_client(self, region: str):
+        return get_bedrock_client(region)
+
+    def spawn(self, fn, *args):
+        future = _prefetch_executor.submit(fn, *args)
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        return future
+
+    def cancel_pending(self):
+        # Queued work is dropped; a statement already running on the database finishes and is discarded
+        for future in list(self.pending):
+            future.cancel()
+        self.plan_prefetch.clear()
+
+    def collect_samples(self):
+        with self.callbacks.stage("Collecting Sample Queries..."):
+            return self.get_sample_queries()
+
+    def display_samples(self):
+        self.callbacks.on_samples(self.samples)
+ 
+    def get_sample_queries(self): 
+        sql_os_retriever = OpenSearchVectorRetriever(
+            self.sql_os_client, 
+            self.region, 
+            k=10
+        )
+        samples = sql_os_retriever.vector_search(self.prompt, self.sql_os_client.index_name)
+        page_contents = self.without_own_sample([json.loads(doc.page_content) for doc in samples])
+
+        with tracer.span("rerank", documents=len(page_contents)) as span:
+            response = self.boto3_client.rerank(**self.rerank_request(page_contents))
+            span.set(results=len(response['results']))
+        return self.reranked_samples(page_contents, response)
+
+
+    def get_table_summaries_by_similarities(self):
+        schema_os_retriever = OpenSearchVectorRetriever(
+            self.schema_os_client, 
+            self.region, 
+            k=5
+        )
+        matched_tables = schema_os_retriever.vector_search(self.prompt, self.schema_os_client.index_name)
+
+        serializable_tables = []
+        for document in matched_tables:
+            table_data = json.loads(document.page_content)
+            serializable_tables.append(table_data)
+
+        return json.dumps(serializable_tables, ensure_ascii=False)
+
+    def get_table_summaries_all(self):
+        schema_os_retriever = OpenSearchVectorRetriever(
+            self.schema_os_client, 
+            self.region
+        )
+        documents = schema_os_retriever.get_all_documents(self.schema_os_client.index_name)
+
+        table_descriptions = {}
+        for doc in documents:
+            content = json.loads(doc.page_content)
+            table_name = content['table_name']
+            table_desc = content['table_summary']
+            table_descriptions[table_name] = table_desc
+
+        return table_descriptions
+
+    def get_schema_descriptions(self) -> Dict[str, Dict]:
+        response = self.schema_os_client.conn.search(index=self.schema_os_client.index_name, body=self.schema_descriptions_query())
+        return self.schema_descriptions(response)
+
+    def get_schema_linker(self):
+        key = (self.uri, self.schema_os_client.index_name)
+        if key not in _schema_linkers:
+            linking_config = self.pipeline_config.get('schema_linking', {})
+            try:
+                descriptions = self.get_schema_descriptions()
+            except Exception as e:
+                logging.warning(f"Schema descriptions unavailable for linking: {str(e)}")
+                descriptions = {}
+            value_index = self.get_value_index()
+            _schema_linkers[key] = SchemaLinker.from_database(
+                self.engine,
+                descriptions,
+                join_graph=self.db.get_join_graph(),
+                categorical_values=value_index.categorical_values() if value_index else None,
+                skip_threshold=linking_config.get('skip_threshold', 0.8),
+                max_tables=linking_config.get('max_tables', 5)
+            )
+        return _schema_linkers[key]
+
+    def get_value_index(self):
+        index_config = self.pipeline_config.get('value_index', {})
+        if not index_config.get('enabled', True):
+            return None
+
+        try:
+            value_index = self.load_value_index(index_config)
+            fresh = self.claim_value_index_refresh(value_index, index_config)
+            if fresh is not None:
+                try:
+                    refreshed = fresh.refresh(self.engine)
+                    self.save_value_index(fresh, refreshed)
+                    value_index = fresh
+                finally:
+                    self.release_value_index_refresh()
+            return value_index
+        except Exception as e:
+            logging.error(f"Error in get_value_index: {str(e)}")
+            return None
+
+    def get_value_hints(self) -> str:
+        value_index = self.get_value_index()
+        if not value_index:
+            return "None"
+        return value_index.format_hints(value_index.lookup(self.prompt)) or "None"
+
+    def link_schema(self):
+        if not self.pipeline_config.get('schema_linking', {}).get('enabled', True):
+            return None
+        # Retries carry an error log the model needs to see, so only the first attempt is linked locally
+        if self.tool_state["failure_log"] != "None":
+            return None
+        try:
+            link = self.get_schema_linker().link(self.prompt)
+        except Exception as e:
+            logging.error(f"Error in link_schema: {str(e)}")
+            return None
+        logging.info(f"Schema linking: tables={link.tables}, confidence={link.confidence}, skip_llm={link.skip_llm}")
+        return link
+
+    def get_column_description(self, table_name: str) -> Dict[str, str]:
+        response = self.schema_os_client.conn.search(index=self.schema_os_client.index_name, body=self.column_description_query(table_name))
+        return self.column_descriptions(response)
+
+    def get_table_schemas(self, table_names: List[str]) -> Dict[str, Dict]:
+        try:
+            tables = [t.strip() for t in table_names]
+            data = self.db.get_table_info(tables)
+            if not data:
+                logging.warning("No data returned from DB")
+                return {}
+            return self.table_schemas(tables, data, {table: self.get_column_description(table) for table in tables})
+        except Exception as e:
+            logging.error(f"Error in get_table_schemas: {str(e)}")
+            return {}
+
+    def get_schema_context(self, table_names: List[str], join_graph: JoinGraph):
+        builder = self.schema_context_builder()
+        try:
+            tables = self.db.get_tables([t.strip() for t in table_names])
+            col_descs = {table.name: self.get_column_description(table.name) for table in tables}
+            profile = self.db.profile
+            # Profiled tables are described by their statistics, so only the others are queried for rows
+            sample_rows = {table.name: self.db.get_sample_row_dicts(table, builder.sample_rows) for table in tables
+                           if profile is None or table.name not in profile.tables}
+            schema_context = builder.build(self.prompt, tables, col_descs, sample_rows, self.engine.dialect,
+                                           join_graph.join_columns(table_names), profile)
+        except Exception as e:
+            logging.error(f"Error in get_schema_context: {str(e)}")
+            return self.get_table_schemas(table_names)
+
+        return self.record_schema_context(schema_context)
+    
+    def prompt_refinement(self, original_prompt, history):
+        today = datetime.now(pytz.timezone('Asia/Seoul')).strftime('%Y-%m-%d')
+
+        with self.callbacks.stage(f"Refining a prompt"), tracer.span("prompt_refinement", tokens=self.tokens):
+            sys_prompt, usr_prompt = get_prompt_refinement_prompt(original_prompt, today, history, self.language)
+            response = self.boto3_client.converse(modelId=self.model, messages=usr_prompt, system=sys_prompt)
+            self.update_tokens(response)
+        try:
+            parsed_json = parse_json_format(response['output']['message']['content'][0]['text'])
+        except JSONParseError as e:
+            logging.warning(f"Prompt refinement skipped: {str(e)}")
+            return original_prompt
+        refined_prompt = parsed_json.get("refined_prompt", original_prompt)
+        self.callbacks.on_refined_prompt(refined_prompt)
+        return refined_prompt
+
+    def query_generation(self, input: str): # dummy input
+        table_names = self.db.get_usable_table_names()
+        combined_log = self.combined_log()
+
+        # Table Selection
+        with tracer.span("table_selection", tokens=self.tokens) as span:
+            link = self.link_schema()
+            if link and link.skip_llm:
+                table_names = link.tables
+                span.set(method="lexical", confidence=link.confidence)
+            else:
+                table_summaries = self.get_table_summaries_by_similarities() # RAG    
+                sys_prompt, usr_prompt = get_table_selection_prompt(table_summaries, self.prompt, self.samples, combined_log)
+                response = self.boto3_client.converse(
+                    modelId=self.model,
+                    messages=usr_prompt,
+                    system=sys_prompt
+                )
+                self.update_tokens(response)
+                table_names = response['output']['message']['content'][0]['text'].split(',')
+                span.set(method="llm", confidence=link.confidence if link else None)
+
+            # Adding bridge tables required to join the selected tables
+            join_graph = self.db.get_join_graph()
+            table_names = join_graph.close([t.strip() for t in table_names if t.strip()])
+            join_hints = "\n".join(join_graph.join_hints(table_names)) or "None"
+            span.set(tables=len(table_names))
+
+        with tracer.span("schema_context") as span:
+            value_hints = self.get_value_hints()
+
+            # Loading Table Schemas
+            if self.pipeline_config.get('schema_context', {}).get('enabled', True):
+                table_schemas = self.get_schema_context(table_names, join_graph)
+            else:
+                table_schemas = self.get_table_schemas(table_names)
+            span.set(context_tokens_saved=self.tokens.get('context_tokens_saved', 0))
+        
+        # SQL Query Generation
+        sys_prompt, usr_prompt = get_query_generation_prompt(self.samples, self.dialect, table_schemas, join_hints, value_hints, self.language, self.prompt, combined_log)
+        with tracer.span("generation", tokens=self.tokens, retry=self.retry) as span:
+            try:
+                return converse_stream_json(self.boto3_client, self.model, usr_prompt, sys_prompt, self.tokens, self.prefetch_query_plan)
+            except JSONParseError as e:
+                span.fail(f"{type(e).__name__}: {e}")
+                return {"error": str(e), "error_type": type(e).__name__}
+
+    def prefetch_query_plan(self, key, value):
+        # The plan of the generated query is fetched while the model is still writing its confidence
+        if key == "query" and isinstance(value, str) and value not in self.plan_prefetch and self.can_prefetch_plan():
+            self.plan_prefetch[value] = self.spawn(self.db.run, self.get_explain_query(value))
+
+    def get_query_plan(self, query: str):
+        future = self.plan_prefetch.pop(query, None)
+        with tracer.span("explain", prefetched=future is not None):
+            if future is not None:
+                return future.result()
+            return self.db.run(self.get_explain_query(query))
+
+    def validate_and_run_queries(self, generated_query: str):
+        self.tool_state["initial_query"] = generated_query
+        try:
+            query_plan = self.get_query_plan(generated_query)
+        except Exception as e:
+            print(self.tool_state)
+            return self.query_failure_handling(f"[E01] An error occurred while generating the EXPLAIN query: {str(e)}", generated_query)
+
+        # The final query starts executing as soon as its field is complete, while the opinion is still streaming
+        execution = {}
+        def execute_final_query(key, value):
+            if key == "final_query" and isinstance(value, str) and "future" not in execution:
+                execution["future"] = self.spawn(self.db.run, value)
+
+        try:
+            with tracer.span("validation", tokens=self.tokens, retry=self.retry):
+                sys_prompt, usr_prompt = get_query_validation_prompt(self.dialect, query_plan, generated_query, self.language, self.prompt)
+                parsed_json = converse_stream_json(self.boto3_client, self.model, usr_prompt, sys_prompt, self.tokens, execute_final_query)
+                query = parsed_json.get("final_query")
+                if not isinstance(query, str):
+                    raise JSONParseError("'final_query' is missing from the model output.")
+                #output_columns = parsed_json.get("output_columns")
+
+        except Exception as e:
+            if "future" in execution:
+                execution["future"].cancel()
+            print(self.tool_state)
+            return self.query_failure_handling(f"[E02] An issue unrelated to the query was encountered: {str(e)} (Model-related problem)", generated_query)
+  
+        try:
+            with tracer.span("execution", early_start="future" in execution, retry=self.retry) as span:
+                result = execution["future"].result() if "future" in execution else self.db.run(query)
+                span.set(rows=len(result))
+
+        except Exception as e:
+            print(self.tool_state)
+            return self.query_failure_handling(f"[E03] An error occurred while executing the final query: {str(e)}", query)
+
+        return self.record_query_result(query, result)
+
+    def schema_explorer(self, keyword: str):
+        response = self.schema_os_client.conn.search(
+            index=self.schema_os_client.index_name,
+            body=self.schema_explorer_query(keyword)
+        )
+        return self.schema_explorer_result(keyword, response)
+
     def tool_router(self, tool, callback):
-        with st.spinner(f"Running Tool... ({tool['name']}, Retry: {self.retry})"):
+        with self.callbacks.stage(f"Running Tool... ({tool['name']}, Retry: {self.retry})"), tracer.span(f"tool.{tool['name']}", retry=self.retry) as span:
             if tool['name'] == 'query_generation':
                 res = self.query_generation(tool['input']['input'])
                 tool_result = {"toolUseId": tool['toolUseId'], "content": [{"json": res}]}
             elif tool['name'] == 'validate_and_run_queries':
                 res = self.validate_and_run_queries(tool['input']['generated_query'])
                 tool_result = {"toolUseId": tool['toolUseId'], "content": [{"json": res}]}
-                if 'failure_log' not in res:
-                    self.retry = 0
-                    self.tool_state["failure_log"] = "None"
-                    self.tool_state["failed_query"] = "None"
-                else:
-                    self.retry += 1
+                self.update_retry_state(res)
             elif tool['name'] == 'schema_exploration':
                 res = self.schema_explorer(tool['input']['keyword'])
                 tool_result = {"toolUseId": tool['toolUseId'], "content": [{"json": res}]}
@@ -582,6 +937,8 @@ class DB_Tools:
                 tool_result = {"toolUseId": tool['toolUseId'], "content": [{"text": "Unknown tool name"}]}
 
             #print("[DEBUG] Tool_Result:", tool_result)
+            if isinstance(tool_result["content"][0].get("json"), dict) and "failure_log" in tool_result["content"][0]["json"]:
+                span.fail(tool_result["content"][0]["json"]["failure_log"])
         callback.on_llm_new_result(json.dumps({
             "tool_name": tool['name'], 
             "content": tool_result["content"][0]
@@ -592,7 +949,7 @@ class DB_Tools:
         return tool_result_message
 
 class DB_Tool_Client:
-    def __init__(self, model_info, config, language, sql_os_client, schema_os_client, prompt, history):
+    def __init__(self, model_info, config, language, sql_os_client, schema_os_client, prompt, history, callbacks=None):
         self.model = model_info['model_id']
         self.region = model_info['region_name']
         self.dialect = config['dialect']
@@ -600,55 +957,85 @@ class DB_Tool_Client:
         self.top_k = 5
         self.tool_config = self.load_tool_config()
         self.boto3_client = self.init_boto3_client(self.region)
-        self.tokens = {'total_input_tokens': 0, 'total_output_tokens': 0, 'total_tokens': 0}
-        self.db_tool = DB_Tools(self.tokens, config['uri'], self.dialect, self.model, self.region, sql_os_client, schema_os_client, language, prompt, history)
+        self.tokens = {'total_input_tokens': 0, 'total_output_tokens': 0, 'total_tokens': 0, 'context_tokens_saved': 0, 'conversation_tokens_saved': 0}
+        # The request span covers sample collection in DB_Tools as well as invoke()
+        self.trace_span = tracer.start_span("request", tokens=self.tokens, model=self.model, dialect=self.dialect)
+        try:
+            self.db_tool = DB_Tools(self.tokens, config['uri'], self.dialect, self.model, self.region, sql_os_client, schema_os_client, language, prompt, history, callbacks,
+                                    config.get('exclude_own_sample', False))
+        except BaseException as e:
+            tracer.end_span(self.trace_span, e)
+            raise
         self.prompt = self.db_tool.prompt
+        self.compactor = init_compactor(self.db_tool.pipeline_config)
 
     def init_boto3_client(self, region: str):
-        retry_config = Config(
-            region_name=region,
-            retries={"max_attempts": 10, "mode": "standard"}
-        )
-        return boto3.client("bedrock-runtime", region_name=region, config=retry_config)
+        return get_bedrock_client(region)
 
     def load_tool_config(self):
         with open("./src/db_tool_config.json", 'r') as file:
             return json.load(file)
 
+    def compact(self, messages):
+        # The full history is kept in `messages`; only the copy sent to the model is compacted
+        if self.compactor is None:
+            return messages
+        return self.compactor.prepare(messages, self.tokens)
+
     def save_log(self):
         self.db_tool.tool_state['endtime'] = datetime.now().isoformat()
         self.db_tool.tool_state['token_used'] = self.tokens['total_tokens']
+        self.db_tool.tool_state['trace_id'] = self.trace_span.trace.trace_id
 
         log_entry = json.dumps(self.db_tool.tool_state, indent=4)
         logging.info(log_entry)
         
         for handler in logging.root.handlers:
             handler.flush()
-            handler.close()
+
+    def converse(self, stage, messages, sys_prompt, callback):
+        with tracer.span(stage, tokens=self.tokens, retry=self.db_tool.retry):
+            return stream_converse_messages(self.boto3_client, self.model, self.tool_config, messages, sys_prompt, callback, self.tokens)
 
     def invoke(self, callback): 
+        try:
+            final_response = self.run_tool_loop(callback)
+        except BaseException as e:
+            tracer.end_span(self.trace_span, e)
+            raise
+        self.trace_span.set(success=self.db_tool.tool_state["success"] == "True", retries=self.db_tool.retry,
+                            context_tokens_saved=self.tokens['context_tokens_saved'],
+                            conversation_tokens_saved=self.tokens['conversation_tokens_saved'])
+        tracer.end_span(self.trace_span)
+        return final_response, self.tokens
+
+    def run_tool_loop(self, callback):
         sys_prompt, usr_prompt = get_global_prompt(self.language, self.prompt)
         messages = usr_prompt
-        stop_reason, message = stream_converse_messages(self.boto3_client, self.model, self.tool_config, messages, sys_prompt, callback, self.tokens)
-        messages.append(message)
-
-        while stop_reason == "tool_use":
-            contents = message["content"]
-            for c in contents:
-                if "toolUse" not in c:
-                    continue
-                tool_use = c["toolUse"]
-                message = self.db_tool.tool_router(tool_use, callback)
-                messages.append(message)
-
-            stop_reason, message = stream_converse_messages(self.boto3_client, self.model, self.tool_config, messages, sys_prompt, callback, self.tokens)
+        try:
+            stop_reason, message = self.converse("orchestration", self.compact(messages), sys_prompt, callback)
             messages.append(message)
 
+            while stop_reason == "tool_use":
+                contents = message["content"]
+                for c in contents:
+                    if "toolUse" not in c:
+                        continue
+                    tool_use = c["toolUse"]
+                    message = self.db_tool.tool_router(tool_use, callback)
+                    messages.append(message)
+
+                stop_reason, message = self.converse("orchestration", self.compact(messages), sys_prompt, callback)
+                messages.append(message)
+        finally:
+            # Plans of discarded drafts and early executions must not outlive the tool calls
+            self.db_tool.cancel_pending()
+
         # Generating Final Response
-        final_sys_prompt, final_usr_prompt = get_answer_generation_prompt(self.language, self.db_tool.tool_state, usr_prompt)
-        stop_reason, message = stream_converse_messages(self.boto3_client, self.model, self.tool_config, final_usr_prompt, final_sys_prompt, callback, self.tokens)
+        final_sys_prompt, final_usr_prompt = get_answer_generation_prompt(self.language, self.db_tool.tool_state, self.compact(usr_prompt))
+        stop_reason, message = self.converse("answer", final_usr_prompt, final_sys_prompt, callback)
         final_response = message['content'][0]['text']
         self.tokens['total_tokens'] = self.tokens['total_input_tokens'] + self.tokens['total_output_tokens']
         self.save_log()
 
-        return final_response, self.tokens
+        return final_response
@@ -0,0 +1,227 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .data_profile import looks_like_dates, to_datetime
+
+LINE_PLOTS = {"Line Chart", "Area Chart"}
+SCATTER_PLOTS = {"Scatter Plot", "Bubble Chart"}
+
+# Categorical columns with at most this many values are treated as series/colour groups
+MAX_GROUPS = 20
+# Share of `max_points` a method may overshoot by (line end points, per-value minimums) before the result is capped
+POINT_TOLERANCE = 0.05
+
+
+def axis_values(series: pd.Series) -> np.ndarray:
+    """Numeric view of an axis column: datetimes become int64 nanoseconds, everything else float."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(float)
+    return series.to_numpy(dtype=float, na_value=np.nan)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: keeps the first and last point and, per bucket, the point
+    forming the largest triangle with the previously kept point and the next bucket's mean.
+    `x` must be sorted. Returns positions into `x`/`y`.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    # Mean of every bucket from prefix sums; the final bucket looks ahead to the last point
+    cx, cy = np.concatenate(([0.0], np.cumsum(x))), np.concatenate(([0.0], np.cumsum(y)))
+    counts = np.diff(edges)
+    avg_x = np.append((cx[edges[1:]] - cx[edges[:-1]]) / counts, x[-1])[1:]
+    avg_y = np.append((cy[edges[1:]] - cy[edges[:-1]]) / counts, y[-1])[1:]
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y[i] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y: np.ndarray, buckets: int) -> np.ndarray:
+    """Keeps the minimum and maximum of each of `buckets` equal-count buckets, plus both ends."""
+    n = len(y)
+    if 2 * buckets >= n:
+        return np.arange(n)
+    bucket = np.arange(n) * buckets // n
+    order = np.lexsort((y, bucket))
+    starts = np.flatnonzero(np.diff(bucket, prepend=-1))
+    ends = np.append(starts[1:], n) - 1
+    return np.unique(np.concatenate((order[starts], order[ends], [0, n - 1])))
+
+
+def downsample_series(df: pd.DataFrame, x: str, ys: List[str], max_points: int, method: str = "lttb",
+                      by: Optional[str] = None) -> pd.DataFrame:
+    """
+    Reduces each y column of a series to its visually significant points and keeps the union
+    of rows. With `by`, every group is reduced separately so each plotted line keeps its shape.
+    """
+    data = df.sort_values(x, kind='stable') if not df[x].is_monotonic_increasing else df
+    groups = data.groupby(by, dropna=False, sort=False).indices.values() if by else [np.arange(len(data))]
+    budget = max(max_points // (len(groups) * max(len(ys), 1)), 3)
+    x_values = axis_values(data[x])
+
+    keep = []
+    for y in ys:
+        y_values = axis_values(data[y])
+        missing = np.isnan(y_values) | np.isnan(x_values)
+        for positions in groups:
+            valid = positions[~missing[positions]]
+            if method == "minmax":
+                chosen = minmax_indices(y_values[valid], max(budget // 2, 1))
+            else:
+                chosen = lttb_indices(x_values[valid], y_values[valid], budget)
+            keep.append(valid[chosen])
+    keep = np.unique(np.concatenate(keep)) if keep else np.arange(0)
+    return data.iloc[keep]
+
+
+def stratified_sample(df: pd.DataFrame, column: Optional[str], n: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Deterministic proportional sample of at most `n` rows; every value of `column` keeps at least
+    one row while there are no more values than `n`. Without a column this is a plain seeded random
+    sample. Row order is preserved.
+    """
+    if n >= len(df):
+        return df
+    rng = np.random.default_rng(seed)
+    if column is None:
+        return df.iloc[np.sort(rng.choice(len(df), n, replace=False))]
+
+    codes, _ = pd.factorize(df[column], use_na_sentinel=False)
+    counts = np.bincount(codes)
+    quota = np.minimum(np.maximum(np.floor(counts * n / len(df)), 1), counts).astype(np.int64)
+    # The one-row minimum can overshoot `n`: take the excess from the largest quotas, then drop the rarest values
+    excess = int(quota.sum()) - n
+    for i in np.argsort(-quota, kind='stable'):
+        if excess <= 0:
+            break
+        cut = min(excess, quota[i] - 1)
+        quota[i] -= cut
+        excess -= cut
+    if excess > 0:
+        quota[np.argsort(counts, kind='stable')[:excess]] = 0
+    order = rng.permutation(len(df))
+    shuffled = codes[order]
+    rank = pd.Series(shuffled).groupby(shuffled).cumcount().to_numpy()
+    return df.iloc[np.sort(order[rank < quota[shuffled]])]
+
+
+def binned_aggregate(df: pd.DataFrame, x: str, y: str, bins: int = 100, size: Optional[str] = None,
+                     by: Optional[str] = None) -> Tuple[pd.DataFrame, str]:
+    """
+    Aggregates a scatter onto a `bins` x `bins` grid: one row per occupied cell (and group), with
+    the mean of x, y and other numeric columns, the sum of `size`, and the number of points merged.
+    Returns the frame and the name of the count column.
+    """
+    data = df.dropna(subset=[x, y])
+    keys = []
+    for column in (x, y):
+        values = axis_values(data[column])
+        low, high = np.nanmin(values), np.nanmax(values)
+        scale = bins / (high - low) if high > low else 0.0
+        keys.append(np.minimum(((values - low) * scale).astype(np.int64), bins - 1))
+    if by:
+        keys.append(pd.factorize(data[by], use_na_sentinel=False)[0])
+
+    count_column = "count" if "count" not in data.columns else "point_count"
+    aggregations = {}
+    for column in data.columns:
+        if column == size:
+            aggregations[column] = 'sum'
+        elif column in (x, y) or pd.api.types.is_numeric_dtype(data[column]) or pd.api.types.is_datetime64_any_dtype(data[column]):
+            aggregations[column] = 'mean'
+        else:
+            aggregations[column] = 'first'
+    grouped = data.groupby(keys, sort=True)
+    result = grouped.agg(aggregations).reset_index(drop=True)
+    result[count_column] = grouped.size().to_numpy()
+    return result, count_column
+
+
+def _parse_time_columns(df: pd.DataFrame) -> pd.DataFrame:
+    # CSV results carry dates as strings; a column whose leading values all parse is a time axis
+    parsed = {}
+    for column in df.columns:
+        series = df[column]
+        if not looks_like_dates(series):
+            continue
+        values = to_datetime(series)
+        if values.notna().sum() == series.notna().sum():
+            parsed[column] = values
+    return df.assign(**parsed) if parsed else df
+
+
+def column_roles(df: pd.DataFrame) -> Dict[str, List[str]]:
+    roles = {"time": [], "numeric": [], "category": []}
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            roles["time"].append(column)
+        elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            roles["numeric"].append(column)
+        else:
+            roles["category"].append(column)
+    return roles
+
+
+def downsample(df: pd.DataFrame, plot_type: str = "Auto", max_points: int = 5000, bins: int = 100,
+               series_method: str = "lttb", seed: int = 0) -> Tuple[pd.DataFrame, Optional[Dict[str, Any]]]:
+    """
+    Reduces `df` to roughly `max_points` rows for plotting, choosing the method from the plot type
+    and column roles: LTTB or min/max decimation along a time (or sorted numeric) axis for line and
+    area charts, stratified sampling on a category for bar and box plots, and grid aggregation for
+    scatter and bubble charts. "Auto" picks from the columns alone. Returns the frame unchanged and
+    None when it is already small enough, otherwise the reduced frame and a description of what was done.
+    """
+    if len(df) <= max_points:
+        return df, None
+
+    data = _parse_time_columns(df)
+    roles = column_roles(data)
+    # Only a low-cardinality column is stratified on; sampling on an ID-like column would keep every row
+    groups = [c for c in roles["category"] if data[c].nunique(dropna=False) <= MAX_GROUPS]
+    group = groups[0] if groups else None
+
+    if plot_type == "Auto":
+        if roles["time"] and roles["numeric"]:
+            plot_type = "Line Chart"
+        elif roles["category"]:
+            plot_type = "Bar Chart"
+        elif len(roles["numeric"]) >= 2:
+            plot_type = "Scatter Plot"
+
+    info = {"source_rows": int(len(df))}
+    if plot_type in LINE_PLOTS and roles["numeric"] and (roles["time"] or len(roles["numeric"]) >= 2):
+        x = roles["time"][0] if roles["time"] else roles["numeric"][0]
+        ys = [c for c in roles["numeric"] if c != x]
+        result = downsample_series(data, x, ys, max_points, series_method, group)
+        info.update(method=series_method, x=x, by=group)
+    elif plot_type in SCATTER_PLOTS and len(roles["numeric"]) >= 2:
+        x, y = roles["numeric"][:2]
+        size = roles["numeric"][2] if plot_type == "Bubble Chart" and len(roles["numeric"]) > 2 else None
+        # Keep the number of cells (per group) within the point budget
+        bins = min(bins, max(int(np.sqrt(max_points / (data[group].nunique(dropna=False) if group else 1))), 1))
+        result, count_column = binned_aggregate(data, x, y, bins, size, group)
+        info.update(method="binned", x=x, y=y, by=group, count_column=count_column)
+    else:
+        result = stratified_sample(data, group, max_points, seed)
+        info.update(method="stratified" if group else "random", by=group)
+
+    if len(result) > max_points * (1 + POINT_TOLERANCE):
+        # Many groups give every group its minimum share; the budget still holds
+        result = stratified_sample(result, group, max_points, seed)
+        info["capped"] = True
+    info["rows"] = int(len(result))
+    return result.reset_index(drop=True), {k: v for k, v in info.items() if v is not None}
@@ -1,102 +1,135 @@
 from typing import Dict, Tuple, List, Union
 import streamlit as st
 import pandas as pd
-import boto3
 import os
 import io
+import hashlib
 import re
 import json
+import threading
+from collections import OrderedDict
 from io import StringIO
 import mimetypes
 import plotly.express as px
-from botocore.config import Config
+import plotly.io as pio
+from .bedrock_gateway import get_bedrock_client
+from .chart_sandbox import get_chart_sandbox, ChartSandboxError, ChartTimeoutError
+from .data_profile import load_result_profile, format_profile
+from .downsampling import downsample
 from .common_utils import load_model_config, load_language_config
-from .prompts import get_data_filtering_prompt, get_code_generation_prompt
+from .config import load_config_section
+from .prompts import get_code_generation_prompt
 from .common_utils import process_uploaded_files, CustomUploadedFile
+from .tracing import tracer
 
 INIT_MESSAGE = {"role": "assistant", "content": ""}
 lang_config = {}
 
+# Generated chart code depends only on the shape of the result (the data is loaded at run time),
+# so it is reused across reruns and across results with the same columns
+_chart_code = OrderedDict()
+_chart_code_lock = threading.Lock()
+_chart_code_stats = {"hits": 0, "misses": 0, "evictions": 0}
+CHART_CODE_CACHE_SIZE = 256
+
+def chart_code_cache_metrics() -> Dict:
+    with _chart_code_lock:
+        lookups = _chart_code_stats["hits"] + _chart_code_stats["misses"]
+        return dict(_chart_code_stats, size=len(_chart_code), capacity=CHART_CODE_CACHE_SIZE,
+                    hit_rate=round(_chart_code_stats["hits"] / lookups, 4) if lookups else 0.0)
+
 def set_init_message(init_message: str) -> None:
     INIT_MESSAGE["content"] = init_message
 
 class Insight_Tools:
-    def __init__(self, model_info, language, dataframe):
+    def __init__(self, model_info, language, dataframe, data_file=None):
         self.model = model_info['model_id']
         self.region = model_info['region_name']
         self.language = language
         self.top_k = 5
         self.boto3_client = self.init_boto3_client(self.region)
-        self.sampling_method = 'uniform'
         self.dataframe = dataframe
+        self.source_file = data_file or self.save_dataframe(dataframe)
+        self.data_file = self.source_file
+        self.downsampling = None
 
     def init_boto3_client(self, region: str):
-        retry_config = Config(
-            region_name=region,
-            retries={"max_attempts": 10, "mode": "standard"}
-        )
-        return boto3.client("bedrock-runtime", region_name=region, config=retry_config)
-    
-    def preprocessing_dataframe(self):
-        rows, cols = self.dataframe.shape
-        if rows * cols > 200:
-            #data = self.sampling_data(self.dataframe, rows, cols)
-            self.datatype = "sampled_"
-        else:
-            self.datatype = "full_"
-
-    def formatting_code_frame(self, csv_string_escaped, code_block):
-        imports = "import pandas as pd\nimport plotly.express as px\n\n"
-        dataframe_code = f'dataframe = pd.read_csv(io.StringIO("{csv_string_escaped}"))\n\n'
+        return get_bedrock_client(region)
+
+    def save_dataframe(self, dataframe):
+        # The chart code loads the data from this file at run time instead of carrying it inline
+        csv_bytes = dataframe.to_csv(index=False).encode('utf-8')
+        folder_path = "./result_files"
+        os.makedirs(folder_path, exist_ok=True)
+        data_file = f"{folder_path}/insight_{hashlib.sha1(csv_bytes).hexdigest()[:16]}.csv"
+        if not os.path.exists(data_file):
+            with open(data_file, 'wb') as file:
+                file.write(csv_bytes)
+        return data_file
+
+    def prepare_data(self, plot_type):
+        # Large results are reduced to what the chart can show before the code ever runs
+        config = load_config_section('downsampling')
+        plot_data, self.downsampling = downsample(self.dataframe, plot_type, config.get('max_points', 5000),
+                                                  config.get('bins', 100), config.get('series_method', 'lttb'))
+        self.data_file = self.save_dataframe(plot_data) if self.downsampling else self.source_file
+
+    def formatting_code_frame(self, code_block):
+        imports = "import streamlit as st\nimport pandas as pd\nimport numpy as np\nimport plotly.express as px\n\n"
+        dataframe_code = "dataframe = load_dataframe()\n\n"
         plot_code = "\n\nst.plotly_chart(fig)"
         full_code_block = imports + dataframe_code + code_block + plot_code
         return full_code_block
 
+    def code_fingerprint(self, plot_type):
+        schema = [[str(column), str(dtype)] for column, dtype in self.dataframe.dtypes.items()]
+        method = (self.downsampling or {}).get('method')
+        key = json.dumps([self.model, self.language, plot_type, method, schema])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def forget_code(self, plot_type):
+        # Code that failed to render is not served again
+        with _chart_code_lock:
+            _chart_code.pop(self.code_fingerprint(plot_type), None)
+
     def code_generation(self, plot_type):
-        csv_string = self.dataframe.to_csv(index=False)
-        csv_string_escaped = csv_string.replace('\n', '\\n').replace('"', '\\"')
-        self.preprocessing_dataframe()
-        
-        sys_prompt, usr_prompt = get_code_generation_prompt(csv_string_escaped, self.datatype, plot_type)
+        self.prepare_data(plot_type)
+        fingerprint = self.code_fingerprint(plot_type)
+        with _chart_code_lock:
+            if fingerprint in _chart_code:
+                _chart_code.move_to_end(fingerprint)
+                _chart_code_stats["hits"] += 1
+                return _chart_code[fingerprint]
+            _chart_code_stats["misses"] += 1
+
+        with tracer.span("chart_code_generation", plot_type=plot_type):
+            full_code_block = self.generate_code(plot_type)
+        with _chart_code_lock:
+            _chart_code[fingerprint] = full_code_block
+            if len(_chart_code) > CHART_CODE_CACHE_SIZE:
+                _chart_code.popitem(last=False)
+                _chart_code_stats["evictions"] += 1
+        return full_code_block
+
+    def generate_code(self, plot_type):
+        # The prompt carries a fixed-size profile of the data, not the data itself
+        profile = dict(self.column_profile())
+        if self.downsampling:
+            profile["downsampling"] = self.downsampling
+        profile = format_profile(profile)
+        sys_prompt, usr_prompt = get_code_generation_prompt(profile, plot_type)
         response = self.boto3_client.converse(modelId=self.model, messages=usr_prompt, system=sys_prompt)
         code_block = response['output']['message']['content'][0]['text']
-        full_code_block = self.formatting_code_frame(csv_string_escaped, code_block)
+        full_code_block = self.formatting_code_frame(code_block)
         return full_code_block
 
-    def get_unique_column_values(self):
-        unique_values = {col: self.dataframe[col].unique().tolist() for col in self.dataframe}
-        
-    def sampling_data(self, data, rows, cols):
-        # filtering method selection
-        sys_prompt, usr_prompt = get_data_filtering_prompt(self.prompt, data.head().to_string(), data.tail().to_string(), rows-10)
-        response = self.client.converse(
-            modelId=self.model,
-            messages=usr_prompt,
-            system=sys_prompt
-        )
-        parsed_json = self.parse_json_format(response['output']['message']['content'][0]['text'])
-        sampling_method = parsed_json['sampling_method']
-
-        if sampling_method == 'uniform':
-            step = rows * cols // 200
-            sampled_data = data.iloc[::step, :]
-        
-        elif sampling_method == 'random':
-            sampled_data = data.sample(n=200 // cols, random_state=42)
-        
-        elif sampling_method == 'time_based':
-            data['Date'] = pd.to_datetime(data['Date'])
-            sampled_data = data.set_index('Date').resample('1D').first().dropna().reset_index()
-        
-        elif sampling_method == 'sliding_window':
-            window_size = rows // (200 // cols)
-            sampled_data = data.rolling(window=window_size).mean().dropna().iloc[::window_size, :]
-
-        return sampled_data
+    def column_profile(self):
+        # One sketch pass over the full result, cached next to the result file
+        return load_result_profile(self.source_file, self.dataframe)
 
 
 class Insight_Tool_Client:
-    def __init__(self, model_info, language, dataframe, plot_type):
+    def __init__(self, model_info, language, dataframe, plot_type, data_file=None):
         self.model = model_info['model_id']
         self.region = model_info['region_name']
         self.language = language
@@ -105,20 +138,22 @@ class Insight_Tool_Client:
         self.boto3_client = self.init_boto3_client(self.region)
         self.tokens = {'total_input_tokens': 0, 'total_output_tokens': 0, 'total_tokens': 0}
         self.plot_type = plot_type
-        self.insight_tools = Insight_Tools(model_info, language, dataframe)
+        self.insight_tools = Insight_Tools(model_info, language, dataframe, data_file)
 
     def init_boto3_client(self, region: str):
-        retry_config = Config(
-            region_name=region,
-            retries={"max_attempts": 10, "mode": "standard"}
-        )
-        return boto3.client("bedrock-runtime", region_name=region, config=retry_config)
+        return get_bedrock_client(region)
     
     def invoke(self):
         code = self.insight_tools.code_generation(self.plot_type)
+        # Generated code runs in the sandbox pool, never in the server process
         try:
-            exec(code)
-        except:
+            figure_json = get_chart_sandbox().run(code, self.insight_tools.data_file)
+            st.plotly_chart(pio.from_json(figure_json))
+        except ChartTimeoutError:
+            self.insight_tools.forget_code(self.plot_type)
+            st.write("The visualization took too long to render. Please try again.")
+        except ChartSandboxError:
+            self.insight_tools.forget_code(self.plot_type)
             st.write("An error occurred. Please try again.")
         
         return code
@@ -202,6 +237,10 @@ def analyze_main():
             insight_client = Insight_Tool_Client(model_info, st.session_state['language_select_insight'], input_dataframe, plot_type)
             with st.spinner(f"Generating a visualization"):
                 insight_client.invoke()
+            metrics = chart_code_cache_metrics()
+            st.sidebar.caption(f"Chart code cache: {metrics['hits']} hits, {metrics['misses']} misses "
+                               f"({metrics['hit_rate']:.0%}), {metrics['size']}/{metrics['capacity']} entries, "
+                               f"{metrics['evictions']} evicted")
         if st.session_state.file_content[0]['type'] == 'image':
             print("image_analyzer")
         else:
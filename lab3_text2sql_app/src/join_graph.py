@@ -0,0 +1,110 @@
+from collections import defaultdict, deque, namedtuple
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+
+JoinEdge = namedtuple('JoinEdge', ['source', 'target', 'columns'])
+
+
+class JoinGraph:
+    """
+    Undirected table graph built from reflected foreign keys.
+
+    Each edge keeps every column pair of the constraint, so composite keys are joined on all columns.
+    Used to close a table selection under the bridge tables needed to join it and to render join hints.
+    """
+    def __init__(self, edges: List[JoinEdge], tables: Optional[List[str]] = None):
+        self.edges = edges
+        self.tables = set(tables or [])
+        self.adjacency = defaultdict(dict)
+        for edge in edges:
+            self.tables.update((edge.source, edge.target))
+            if edge.source == edge.target:
+                continue
+            self.adjacency[edge.source].setdefault(edge.target, []).append(edge)
+            self.adjacency[edge.target].setdefault(edge.source, []).append(edge)
+
+    @classmethod
+    def from_engine(cls, engine: Engine, schema: Optional[str] = None):
+        inspector = inspect(engine)
+        table_names = inspector.get_table_names(schema=schema)
+        edges = []
+        for table_name in table_names:
+            for fk in inspector.get_foreign_keys(table_name, schema=schema):
+                if not fk.get('referred_table'):
+                    continue
+                edges.append(JoinEdge(
+                    table_name,
+                    fk['referred_table'],
+                    list(zip(fk['constrained_columns'], fk['referred_columns']))
+                ))
+        return cls(edges, table_names)
+
+    def neighbors(self, table: str) -> List[str]:
+        return sorted(self.adjacency.get(table, {}))
+
+    def _path_to_tree(self, tree: Set[str], target: str) -> List[str]:
+        # Multi-source BFS from every table already in the tree towards the target
+        previous = {table: None for table in tree}
+        queue = deque(sorted(tree))
+        while queue:
+            node = queue.popleft()
+            if node == target:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = previous[node]
+                return path[::-1]
+            for neighbor in self.neighbors(node):
+                if neighbor not in previous:
+                    previous[neighbor] = node
+                    queue.append(neighbor)
+        return []
+
+    def close(self, tables: List[str]) -> List[str]:
+        """
+        Returns the tables extended with the bridge tables needed to join them.
+        Terminals are attached one by one through their shortest path to the tables collected so far,
+        which approximates the smallest connecting tree. Unknown or unreachable tables are kept as-is.
+        """
+        ordered = []
+        for table in tables:
+            if table not in ordered:
+                ordered.append(table)
+        known = [t for t in ordered if t in self.tables]
+        if len(known) < 2:
+            return ordered
+
+        tree = {known[0]}
+        bridges = []
+        for table in known[1:]:
+            if table in tree:
+                continue
+            path = self._path_to_tree(tree, table)
+            for node in path:
+                if node not in tree and node not in ordered and node not in bridges:
+                    bridges.append(node)
+            tree.update(path or [table])
+        return ordered + bridges
+
+    def join_hints(self, tables: List[str]) -> List[str]:
+        selected = set(tables)
+        hints = []
+        for edge in self.edges:
+            if edge.source in selected and edge.target in selected:
+                condition = " AND ".join(f"{edge.source}.{src} = {edge.target}.{tgt}" for src, tgt in edge.columns)
+                if edge.source == edge.target:
+                    condition += " (self-join)"
+                hints.append(condition)
+        return hints
+
+    def join_columns(self, tables: List[str]) -> Dict[str, List[str]]:
+        selected = set(tables)
+        columns = defaultdict(list)
+        for edge in self.edges:
+            if edge.source in selected and edge.target in selected:
+                for src, tgt in edge.columns:
+                    columns[edge.source].append(src)
+                    columns[edge.target].append(tgt)
+        return dict(columns)
@@ -0,0 +1,206 @@
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class JSONParseError(ValueError):
+    """Base class for errors raised while extracting a JSON object from model output."""
+
+
+class NoJSONObjectError(JSONParseError):
+    """The model output does not contain a JSON object."""
+
+
+class IncompleteJSONError(JSONParseError):
+    """The model output ended before the JSON object was closed."""
+
+
+class InvalidJSONError(JSONParseError):
+    """A field of the JSON object could not be decoded."""
+
+
+class StreamingJSONExtractor:
+    """
+    Incrementally extracts the first top-level JSON object from streamed model output.
+
+    Text around the object (preamble, code fences, explanation) is ignored. Every top-level
+    field is decoded as soon as its value is complete, so callers can act on e.g. `final_query`
+    before the model has finished the remaining fields. Raw newlines inside strings are kept,
+    and triple-quoted values are accepted as plain strings.
+    """
+    def __init__(self):
+        self.fields = {}
+        self.buffer = ''
+        self.position = 0
+        self.started = False
+        self.finished = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.triple_quoted = False
+        self.key = None
+        self.token_start = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        completed = []
+        self.buffer += chunk
+        while self.position < len(self.buffer) and not self.finished:
+            if not self.step(completed):
+                break
+        return completed
+
+    def step(self, completed: List[Tuple[str, Any]]) -> bool:
+        buffer, i = self.buffer, self.position
+        char = buffer[i]
+
+        if not self.started:
+            if char == '{':
+                self.started = True
+                self.depth = 1
+                self.token_start = i + 1
+            self.position += 1
+            return True
+
+        if self.triple_quoted:
+            end = buffer.find('"""', i)
+            if end < 0:
+                # Keep the last two characters in case the closing quotes are split across chunks
+                self.position = max(i, len(buffer) - 2)
+                return False
+            self.triple_quoted = False
+            self.position = end + 3
+            return True
+
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+            elif char == '\\':
+                self.escape = True
+            elif char == '"':
+                self.in_string = False
+            self.position += 1
+            return True
+
+        if char == '"':
+            # A quote or two at the end of the chunk may be the start of a triple quote
+            if '"""'.startswith(buffer[i:]):
+                return False
+            if buffer.startswith('"""', i):
+                self.triple_quoted = True
+                self.position += 3
+                return True
+            self.in_string = True
+        elif char in '{[':
+            self.depth += 1
+        elif char in '}]':
+            self.depth -= 1
+            if self.depth == 0:
+                self.close_token(i, completed)
+                self.finished = True
+        elif char == ':' and self.depth == 1 and self.key is None:
+            self.key = self.decode(buffer[self.token_start:i])
+            self.token_start = i + 1
+        elif char == ',' and self.depth == 1:
+            self.close_token(i, completed)
+        self.position += 1
+        return True
+
+    def close_token(self, end: int, completed: List[Tuple[str, Any]]):
+        raw = self.buffer[self.token_start:end].strip()
+        self.token_start = end + 1
+        if self.key is None:
+            if raw:
+                raise InvalidJSONError(f"Dangling token without a key: {raw[:50]}")
+            return
+        key, self.key = self.key, None
+        value = self.decode(raw)
+        self.fields[key] = value
+        completed.append((key, value))
+
+    def decode(self, raw: str) -> Any:
+        raw = raw.strip()
+        if raw.startswith('"""') and raw.endswith('"""') and len(raw) >= 6:
+            return raw[3:-3].strip()
+        try:
+            return json.loads(raw, strict=False)
+        except json.JSONDecodeError as e:
+            raise InvalidJSONError(f"Invalid JSON value {raw[:50]!r}: {e}") from e
+
+    def result(self) -> Dict[str, Any]:
+        if not self.started:
+            raise NoJSONObjectError("No JSON object found in the model output.")
+        if not self.finished:
+            raise IncompleteJSONError("The JSON object in the model output is not closed.")
+        return self.fields
+
+
+def parse_json_format(json_string: str) -> Dict[str, Any]:
+    extractor = StreamingJSONExtractor()
+    extractor.feed(json_string)
+    return extractor.result()
+
+
+def converse_stream_json(client, model: str, messages: List[Dict], system: List[Dict], tokens: Dict,
+                         on_field: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Any]:
+    """
+    Streams a converse call and parses its JSON answer incrementally.
+    `on_field(key, value)` is called as soon as each top-level field is complete.
+    """
+    response = client.converse_stream(modelId=model, messages=messages, system=system)
+    extractor = StreamingJSONExtractor()
+    for chunk in response['stream']:
+        if 'contentBlockDelta' in chunk:
+            delta = chunk['contentBlockDelta']['delta']
+            if 'text' in delta:
+                for key, value in extractor.feed(delta['text']):
+                    if on_field:
+                        on_field(key, value)
+        elif 'metadata' in chunk:
+            tokens['total_input_tokens'] += chunk['metadata']['usage']['inputTokens']
+            tokens['total_output_tokens'] += chunk['metadata']['usage']['outputTokens']
+    return extractor.result()
+
+
+def stream_converse_messages(client, model, tool_config, messages, system, callback, tokens):
+    response = client.converse_stream(
+        modelId=model,
+        messages=messages,
+        system=system,
+        toolConfig=tool_config
+    )
+    
+    stop_reason = ""
+    message = {"content": []}
+    text = ''
+    tool_use = {}
+
+    for chunk in response['stream']:
+        if 'messageStart' in chunk:
+            message['role'] = chunk['messageStart']['role']
+        elif 'contentBlockStart' in chunk:
+            tool = chunk['contentBlockStart']['start']['toolUse']
+            tool_use['toolUseId'] = tool['toolUseId']
+            tool_use['name'] = tool['name']
+        elif 'contentBlockDelta' in chunk:
+            delta = chunk['contentBlockDelta']['delta']
+            if 'toolUse' in delta:
+                if 'input' not in tool_use:
+                    tool_use['input'] = ''
+                tool_use['input'] += delta['toolUse']['input']
+            elif 'text' in delta:
+                text += delta['text']
+                callback.on_llm_new_token(delta['text'])
+        elif 'contentBlockStop' in chunk:
+            if 'input' in tool_use:
+                tool_use['input'] = json.loads(tool_use['input'])
+                message['content'].append({'toolUse': tool_use})
+                tool_use = {}
+            else:
+                message['content'].append({'text': text})
+                text = ''
+        elif 'messageStop' in chunk:
+            stop_reason = chunk['messageStop']['stopReason']
+        elif 'metadata' in chunk:
+            tokens['total_input_tokens'] += chunk['metadata']['usage']['inputTokens']
+            tokens['total_output_tokens'] += chunk['metadata']['usage']['outputTokens']
+    callback.flush()
+    return stop_reason, message
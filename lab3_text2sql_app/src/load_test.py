@@ -0,0 +1,219 @@
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .benchmark import load_questions, percentiles
+from .callbacks import NullStreamHandler
+from .config import load_model_config
+from .transport import LIVE, RECORD, REPLAY, load_transport_config
+
+
+def rss_bytes() -> int:
+    """Current resident set size; falls back to the peak RSS where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ResourceSampler(threading.Thread):
+    """Samples process memory, connection pool usage and gateway queueing while the test runs."""
+    def __init__(self, engine, region: str, interval: float = 0.2):
+        super().__init__(daemon=True, name="load-test-sampler")
+        self.engine = engine
+        self.region = region
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.samples = []
+
+    def sample(self) -> Dict[str, Any]:
+        from .bedrock_gateway import get_gateway
+        from .db_utils import pool_status
+
+        pool = pool_status(self.engine)
+        limiters = get_gateway(self.region).metrics().values()
+        return {
+            "rss": rss_bytes(),
+            "checkedout": pool.get("checkedout", 0),
+            "capacity": pool.get("capacity"),
+            "in_flight": sum(limiter["in_flight"] for limiter in limiters),
+            "waiting": sum(limiter["waiting"] for limiter in limiters)
+        }
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.samples.append(self.sample())
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.samples.append(self.sample())
+
+
+class LoadTest:
+    """
+    Drives DB_Tool_Client with `sessions` concurrent simulated chat sessions. Each session asks
+    `requests_per_session` questions in turn, carrying its own chat history, and pauses for an
+    exponentially distributed think time between questions. Sessions start over `ramp_up` seconds.
+    """
+    def __init__(self, model_info: Dict, config: Dict, questions: List[Dict[str, str]], language: str = "English",
+                 think_time: float = 2.0, ramp_up: float = 0.0, seed: Optional[int] = None):
+        from .db_utils import get_engine
+        from .opensearch import get_opensearch_client
+
+        self.model_info = model_info
+        self.config = config
+        self.questions = questions
+        self.language = language
+        self.think_time = think_time
+        self.ramp_up = ramp_up
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.engine = get_engine(config['uri'])
+        region = model_info['region_name']
+        self.sql_os_client = get_opensearch_client(region, 'example_queries', 'mappings-sql', 'input_v', 'input', ["input", "query"])
+        self.schema_os_client = get_opensearch_client(region, 'schema_descriptions', 'mappings-detailed-schema', 'table_summary_v', 'table_summary', ["table_name", "table_summary"])
+
+    def pause(self):
+        if self.think_time > 0:
+            with self.random_lock:
+                seconds = self.random.expovariate(1 / self.think_time)
+            time.sleep(seconds)
+
+    def ask(self, session_id: int, question: str, history: str) -> Dict[str, Any]:
+        from .db_utils import DB_Tool_Client
+
+        request = {"session": session_id, "question": question, "started": time.perf_counter()}
+        try:
+            client = DB_Tool_Client(self.model_info, self.config, self.language, self.sql_os_client, self.schema_os_client, question, history)
+            response, tokens = client.invoke(NullStreamHandler())
+            request.update(ok=True, response=response, tokens=tokens['total_input_tokens'] + tokens['total_output_tokens'],
+                           success=client.db_tool.tool_state["success"] == "True")
+        except Exception as e:
+            logging.error(f"Load test session {session_id} failed: {str(e)}")
+            request.update(ok=False, error=type(e).__name__, message=str(e))
+        request["latency_ms"] = round((time.perf_counter() - request["started"]) * 1000, 1)
+        return request
+
+    def session(self, session_id: int, sessions: int, requests_per_session: int) -> List[Dict[str, Any]]:
+        if self.ramp_up > 0 and sessions > 1:
+            time.sleep(self.ramp_up * session_id / (sessions - 1))
+        messages, requests = [], []
+        for turn in range(requests_per_session):
+            question = self.questions[(session_id * requests_per_session + turn) % len(self.questions)]['question']
+            history = "".join(f"{message['role']}: {message['content']}\n" for message in messages[-3:])
+            request = self.ask(session_id, question, history)
+            requests.append(request)
+            messages.append({"role": "user", "content": question})
+            messages.append({"role": "assistant", "content": request.get("response", "")})
+            if turn < requests_per_session - 1:
+                self.pause()
+        return requests
+
+    def run(self, sessions: int, requests_per_session: int) -> Dict[str, Any]:
+        from .bedrock_gateway import get_gateway
+        from .db_utils import _engines, pool_status
+        from .opensearch import _os_clients
+
+        baseline_rss = rss_bytes()
+        sampler = ResourceSampler(self.engine, self.model_info['region_name'])
+        sampler.start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions, thread_name_prefix="session") as executor:
+            futures = [executor.submit(self.session, i, sessions, requests_per_session) for i in range(sessions)]
+            requests = [request for future in futures for request in future.result()]
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+
+        completed = [r for r in requests if r['ok']]
+        samples = sampler.samples
+        capacity = pool_status(self.engine).get("capacity")
+        peak_rss = max([s["rss"] for s in samples] or [baseline_rss])
+        return {
+            "sessions": sessions,
+            "requests": len(requests),
+            "completed": len(completed),
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(len(completed) / elapsed, 3) if elapsed else 0.0,
+            "error_rate": round(1 - len(completed) / len(requests), 4) if requests else 0.0,
+            "errors": dict(Counter(r['error'] for r in requests if not r['ok'])),
+            "unsuccessful_queries": sum(1 for r in completed if not r['success']),
+            "latency": percentiles([r['latency_ms'] for r in completed]),
+            "tokens_per_request": round(sum(r['tokens'] for r in completed) / len(completed), 1) if completed else 0.0,
+            "pool": {
+                **pool_status(self.engine),
+                "max_checkedout": max([s["checkedout"] for s in samples] or [0]),
+                "saturated_fraction": round(sum(1 for s in samples if capacity and s["checkedout"] >= capacity) / len(samples), 4) if samples else 0.0
+            },
+            "gateway": {
+                "max_in_flight": max([s["in_flight"] for s in samples] or [0]),
+                "max_waiting": max([s["waiting"] for s in samples] or [0]),
+                "models": get_gateway(self.model_info['region_name']).metrics()
+            },
+            "memory": {
+                "baseline_rss_mb": round(baseline_rss / 2 ** 20, 1),
+                "peak_rss_mb": round(peak_rss / 2 ** 20, 1),
+                "per_session_mb": round(max(peak_rss - baseline_rss, 0) / 2 ** 20 / sessions, 2)
+            },
+            "shared_clients": {"engines": len(_engines), "opensearch_clients": len(_os_clients)}
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent chat-session load test for DB_Tool_Client. Run from the app directory.")
+    parser.add_argument("--questions", default="../db_metadata/example_queries.jsonl")
+    parser.add_argument("--model", default="Claude 3.5 Sonnet v2", help="Model name from config.yml")
+    parser.add_argument("--region", default=os.getenv("AWS_REGION", "us-west-2"))
+    parser.add_argument("--uri", default="sqlite:///Chinook.db")
+    parser.add_argument("--dialect", default="SQLite")
+    parser.add_argument("--language", default="English")
+    parser.add_argument("--transport", choices=[LIVE, RECORD, REPLAY], help="Overrides transport.mode in config.yml")
+    parser.add_argument("--sessions", default="10", help="Concurrent sessions; a comma-separated list runs a sweep, e.g. 1,5,10,25")
+    parser.add_argument("--requests-per-session", type=int, default=3)
+    parser.add_argument("--think-time", type=float, default=2.0, help="Mean seconds between questions in a session")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds over which sessions start")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="Report path (default ./benchmarks/load_<timestamp>.json)")
+    args = parser.parse_args()
+
+    if args.transport:
+        os.environ['TEXT2SQL_TRANSPORT'] = args.transport
+
+    model_info = dict(load_model_config()[args.model], region_name=args.region)
+    config = {"dialect": args.dialect, "uri": args.uri}
+    load_test = LoadTest(model_info, config, load_questions(args.questions), args.language, args.think_time, args.ramp_up, args.seed)
+
+    runs = []
+    for sessions in [int(n) for n in args.sessions.split(',')]:
+        run = load_test.run(sessions, args.requests_per_session)
+        runs.append(run)
+        print(json.dumps({k: run[k] for k in ("sessions", "throughput_rps", "error_rate", "latency", "pool", "memory")}, default=str))
+
+    report = {
+        "started_at": datetime.now().isoformat(),
+        "model_id": model_info['model_id'],
+        "uri": args.uri,
+        "transport": load_transport_config()['mode'],
+        "think_time": args.think_time,
+        "requests_per_session": args.requests_per_session,
+        "runs": runs
+    }
+    output = args.output or os.path.join("./benchmarks", f"load_{datetime.now().strftime('%Y%m%d%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, ensure_ascii=False, default=str)
+    print(f"Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,25 +2,43 @@ import os
 import json
 import yaml
 import boto3
+import threading
 import time
-import streamlit as st
 from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
-from .common_utils import sample_query_indexing, schema_desc_indexing
-from collections import namedtuple
+from .bedrock_gateway import get_bedrock_client
+from .tracing import tracer
+from .transport import make_opensearch_connection
+from collections import namedtuple, OrderedDict
 from dotenv import load_dotenv
 
 Document = namedtuple('Document', ['page_content', 'metadata'])
 
+_os_clients = {}
+_os_clients_lock = threading.Lock()
+
+# The same question is embedded for the sample and table-summary searches, and repeats across runs
+_embeddings = OrderedDict()
+_embeddings_lock = threading.Lock()
+EMBEDDING_CACHE_SIZE = 2048
+
+def load_opensearch_config():
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.abspath(os.path.join(current_dir, '..', '..'))
+    dotenv_path = os.path.join(project_root, '.env')
+    load_dotenv(dotenv_path)
+
+    config_path = os.path.join(current_dir, "opensearch.yml")
+    with open(config_path, 'r', encoding='utf-8') as file:
+        config = yaml.safe_load(file)
+    
+    config['COLLECTION_ENDPOINT'] = os.getenv('COLLECTION_ENDPOINT')
+    return config
+
+
 class OpenSearchClient:
     def __init__(self, region_name, index_name, mapping_name, vector, text, output):
         config = self.load_opensearch_config()
 
-        credentials = boto3.Session().get_credentials()
-        auth = AWSV4SignerAuth(credentials, region_name, 'aoss')
-
-        collection_endpoint = config['COLLECTION_ENDPOINT']
-        host = collection_endpoint.replace("https://", "").split(':')[0]
-
         self.index_name = index_name
         self.config = config
         self.vector = vector
@@ -28,7 +46,16 @@ class OpenSearchClient:
         self.output = output
 
         self.mapping = {"settings": config['settings'], "mappings": config[mapping_name]}
-        self.conn = OpenSearch(
+        self.conn = make_opensearch_connection(lambda: self.connect(region_name))
+
+    def connect(self, region_name):
+        credentials = boto3.Session().get_credentials()
+        auth = AWSV4SignerAuth(credentials, region_name, 'aoss')
+
+        collection_endpoint = self.config['COLLECTION_ENDPOINT']
+        host = collection_endpoint.replace("https://", "").split(':')[0]
+
+        return OpenSearch(
             hosts=[{'host': host, 'port': 443}],
             http_auth=auth,
             use_ssl=True,
@@ -38,17 +65,7 @@ class OpenSearchClient:
         )
         
     def load_opensearch_config(self):
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.abspath(os.path.join(current_dir, '..', '..'))
-        dotenv_path = os.path.join(project_root, '.env')
-        load_dotenv(dotenv_path)
-
-        config_path = os.path.join(current_dir, "opensearch.yml")
-        with open(config_path, 'r', encoding='utf-8') as file:
-            config = yaml.safe_load(file)
-        
-        config['COLLECTION_ENDPOINT'] = os.getenv('COLLECTION_ENDPOINT')
-        return config        
+        return load_opensearch_config()
 
 
     def create_index(self):
@@ -69,75 +86,66 @@ class OpenSearchVectorRetriever:
         self.k = k
 
     def _embedding(self, input_text):
-        boto3_client = boto3.client("bedrock-runtime", region_name=self.region)
-        response = boto3_client.invoke_model(
-                modelId=self.emb_model,
-                body=json.dumps({"inputText": input_text})
-            )
-
-        return json.loads(response['body'].read())['embedding']
+        key = (self.emb_model, input_text)
+        with _embeddings_lock:
+            if key in _embeddings:
+                _embeddings.move_to_end(key)
+                return _embeddings[key]
+
+        with tracer.span("embedding", model=self.emb_model):
+            response = get_bedrock_client(self.region).invoke_model(
+                    modelId=self.emb_model,
+                    body=json.dumps({"inputText": input_text})
+                )
+            embedding = json.loads(response['body'].read())['embedding']
+
+        with _embeddings_lock:
+            _embeddings[key] = embedding
+            if len(_embeddings) > EMBEDDING_CACHE_SIZE:
+                _embeddings.popitem(last=False)
+        return embedding
 
     def vector_search(self, input_text, index_name):
         embedding = self._embedding(input_text)
-        semantic_query = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {
-                            "knn": {
-                                self.os_client.vector: {
-                                    "vector": embedding,
-                                    "k": self.k,
-                                }
+        semantic_query = knn_query(self.os_client.vector, embedding, self.k)
+        with tracer.span("knn", index=index_name, k=self.k) as span:
+            result = self.os_client.conn.search(index=index_name, body=semantic_query)
+            span.set(hits=len(result['hits']['hits']))
+        return to_documents(result, self.os_client.output)
+
+
+def knn_query(vector_field, embedding, k):
+    return {
+        "query": {
+            "bool": {
+                "must": [
+                    {
+                        "knn": {
+                            vector_field: {
+                                "vector": embedding,
+                                "k": k,
                             }
-                        },
-                    ]
-                }
-            },
-            "size": self.k
-        }
-        
-        result = self.os_client.conn.search(index=index_name, body=semantic_query)
-
-        documents = []
-        for hit in result['hits']['hits']:
-            source = hit['_source']
-            page_content = {k: source[k] for k in self.os_client.output if k in source}
-            documents.append(Document(page_content=json.dumps(page_content), metadata={}))
-
-        return documents
-    
-def initialize_os_client(client_params, indexing_function, lang_config):
-    client = OpenSearchClient(**client_params)
-    #indexing_function(client, lang_config)
-    return client
-
-def init_opensearch(region_name, lang_config):
-    with st.sidebar:
-        sql_os_client = initialize_os_client(
-            {
-                "region_name": region_name,
-                "index_name": 'example_queries',
-                "mapping_name": 'mappings-sql',
-                "vector": "input_v",
-                "text": "input",
-                "output": ["input", "query"]
-            },
-            sample_query_indexing,
-            lang_config
-        )
-
-        schema_os_client = initialize_os_client(
-            {
-                "region_name": region_name,
-                "index_name": 'schema_descriptions',
-                "mapping_name": 'mappings-detailed-schema',
-                "vector": "table_summary_v",
-                "text": "table_summary",
-                "output": ["table_name", "table_summary"]
-            },
-            schema_desc_indexing,
-            lang_config
-        )
-
-    return sql_os_client, schema_os_client
\ No newline at end of file
+                        }
+                    },
+                ]
+            }
+        },
+        "size": k
+    }
+
+
+def to_documents(result, output):
+    documents = []
+    for hit in result['hits']['hits']:
+        source = hit['_source']
+        page_content = {k: source[k] for k in output if k in source}
+        documents.append(Document(page_content=json.dumps(page_content), metadata={}))
+    return documents
+
+def get_opensearch_client(region_name, index_name, mapping_name, vector, text, output):
+    # Reused across Streamlit reruns and sessions instead of opening a new connection pool each time
+    key = (region_name, index_name, mapping_name, vector, text, tuple(output))
+    with _os_clients_lock:
+        if key not in _os_clients:
+            _os_clients[key] = OpenSearchClient(region_name, index_name, mapping_name, vector, text, output)
+        return _os_clients[key]
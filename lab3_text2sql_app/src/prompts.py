@@ -33,6 +33,8 @@ Your response should ONLY be based on the given context and follow the response
 - Please generate a valid query without any explanations. 
 - For complex questions, do not generate multiple queries, but utilize a compound query as possible.
 - Please refer to the samples and schemas to utilize the most relevant table(s).
+- Join tables using the conditions in the join hints when they apply.
+- When filtering on a literal mentioned in the question, use the exact stored value from the value hints.
 </instruction>
 
 <response_format>
@@ -52,6 +54,14 @@ _QUERY_GENERATION_USER_PROMPT = """
 {table_schemas}
 </schemas>
 
+<join_hints>
+{join_hints}
+</join_hints>
+
+<value_hints>
+{value_hints}
+</value_hints>
+
 Previous Known Error: {error_log}
 Question: {question}
 """
@@ -114,6 +124,7 @@ Please provide the answer using only the provided context. The response should i
 \n\n--Final Answer--\n
 SQL Query: Display the SQL query in a Markdown code block.
 Dataframe: Show the resulting dataframe in a table format within a code block. Mention if the result is partial.
+  When the result is partial, rely on `result_profile` (row count, null ratios, distinct counts, min/max, quantiles and frequent values over the full result) for statements about the whole result.
 Filenames: Include the paths to the result CSV and SQL files in the following format:
   - DataFile\n
   ```./result_files/query_result_....csv```
@@ -162,28 +173,6 @@ _DB_TOOL_USER_PROMPT = """
 Question: {question}
 """
 
-_DATA_FILTERING_SYS_PROMPT = """
-You are a skilled assistant specializing in data visualization.
-You have been given a large CSV file. Based on the patterns of this data, you need to sample a portion of it to write effective visualization code.
-Choose the most appropriate data sampling method based on the given data pattern. The available sampling methods are 'uniform', 'random', 'time_based', and 'sliding_window'.
-
-<response_format>
-{{
-    "sampling_method": "your choice"
-}}
-</response_format>
-"""
-
-_DATA_FILTERING_USER_PROMPT = """
-<data_pattern>
-{head}
-... ({rows} rows) ...
-{tails}
-</data_pattern>
-
-User's Request: {question}
-"""
-
 _PROMPT_REFINEMENT_SYS_PROMPT = """
 You are an expert prompt engineer. Your task:
 1. Refine the given prompt in for an LLM chatbot.
@@ -213,23 +202,27 @@ user's prompt: {question}
 
 _CODE_GENERATION_SYS_PROMPT = """
 You are a skilled data visualization engineer specializing in plotly python code. Your task:
-1. Analyze the given {datatype} dataframe within the script.
+1. Analyze the dataframe described in <data_profile>: its row count, columns with dtypes, null counts, distinct counts, min/max, frequent values and a few sample rows.
 2. Determine the plot type: Try with {plot_type} as possible.
 3. Write the visualization code using plotly that:
   - Correctly represents the data 
   - Is aesthetically pleasing and easy to interpret
   - Includes appropriate labels, titles, and legends
-  - Ensure your code will function correctly with the complete dataset provided in the script.
+  - Ensure your code will function correctly with the complete dataset, which is loaded into `dataframe` at run time. Use only the columns listed in the profile; aggregate or limit categories when there are many rows or distinct values.
+  - If the profile has a `downsampling` entry, `dataframe` holds that reduced version of the data: the same columns, `rows` rows, and for the binned method one row per grid cell with its point count in `count_column`.
 4. Skip any preamble and provide only the code to replace '# Your code here'. Do not include the #--- markers or any other text in your response.
 
+<data_profile>
+{profile}
+</data_profile>
+
 <visualize.py>
 import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
-from io import StringIO
 
-dataframe = pd.read_csv(io.StringIO("{dataset}"))
+dataframe = load_dataframe()
 #---
 #Your code here
 #---
@@ -262,7 +255,7 @@ def get_table_selection_prompt(table_summaries, question, samples, error_log):
         error_log=error_log
     )
 
-def get_query_generation_prompt(samples, dialect, table_schemas, language, question, error_log):
+def get_query_generation_prompt(samples, dialect, table_schemas, join_hints, value_hints, language, question, error_log):
     return create_prompt(
         _QUERY_GENERATION_SYS_PROMPT,
         _QUERY_GENERATION_USER_PROMPT,
@@ -270,6 +263,8 @@ def get_query_generation_prompt(samples, dialect, table_schemas, language, quest
         dialect=dialect,
         language=language,
         table_schemas=table_schemas,
+        join_hints=join_hints,
+        value_hints=value_hints,
         question=question,
         error_log=error_log
     )
@@ -321,21 +316,10 @@ def get_answer_generation_prompt(language, context, question):
         question=question
     )
 
-def get_data_filtering_prompt(question, head, tail, rows):
-    return create_prompt(
-        _DATA_FILTERING_SYS_PROMPT,
-        _DATA_FILTERING_USER_PROMPT,
-        question=question,
-        head=head,
-        tail=tail,
-        rows=rows
-    )
-
-def get_code_generation_prompt(dataset, datatype, plot_type):
+def get_code_generation_prompt(profile, plot_type):
     return create_prompt(
         _CODE_GENERATION_SYS_PROMPT,
         _CODE_GENERATION_USER_PROMPT,
-        dataset=dataset,
-        datatype=datatype,
+        profile=profile,
         plot_type=plot_type
     )
\ No newline at end of file
@@ -0,0 +1,137 @@
+import math
+import re
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+from sqlalchemy import Table
+
+from .schema_linker import tokenize, split_identifier, STOPWORDS
+
+SchemaContext = namedtuple('SchemaContext', ['text', 'tokens', 'full_tokens', 'tokens_saved', 'kept_columns'])
+
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Local approximation of the model tokenizer: words are split into ~4 character pieces
+    and every punctuation character counts as one token.
+    """
+    if not text:
+        return 0
+    return sum(math.ceil(len(piece) / 4) if piece[0].isalnum() or piece[0] == '_' else 1
+               for piece in _TOKEN_PIECES.findall(text))
+
+
+class SchemaContextBuilder:
+    """
+    Builds the table schema section of the generation prompt within a token budget.
+
+    Columns are ranked by lexical relevance to the question. Primary keys, foreign keys and join
+    columns are always kept, together with the top-k ranked columns. With a database profile,
+    precomputed column statistics take the place of sample rows. When the rendered context exceeds
+    the budget, sample rows (or statistics), column descriptions and then ranked columns are dropped.
+    """
+    MAX_OMITTED_NAMES = 20
+
+    def __init__(self, token_budget: int = 2000, top_k_columns: int = 12, sample_rows: int = 3):
+        self.token_budget = token_budget
+        self.top_k_columns = top_k_columns
+        self.sample_rows = sample_rows
+
+    def rank_columns(self, question: str, table: Table, col_descs: Dict[str, str]) -> List[str]:
+        question_tokens = {t for t in tokenize(question) if t not in STOPWORDS}
+        table_tokens = set(split_identifier(table.name))
+        scores = {}
+        for position, column in enumerate(table.columns):
+            name_tokens = set(split_identifier(column.name)) - table_tokens - {'id'}
+            desc_tokens = set(tokenize(col_descs.get(column.name, ''))) - STOPWORDS - table_tokens
+            score = 2 * len(question_tokens & name_tokens) + len(question_tokens & desc_tokens)
+            scores[column.name] = (-score, position)
+        return sorted(scores, key=scores.get)
+
+    def key_columns(self, table: Table, join_columns: Optional[List[str]] = None) -> List[str]:
+        keys = [c.name for c in table.columns if c.primary_key or c.foreign_keys]
+        for column in join_columns or []:
+            if column in table.columns and column not in keys:
+                keys.append(column)
+        return keys
+
+    def render_table(self, table: Table, columns: List[str], col_descs: Dict[str, str],
+                     sample_rows: List[Dict], dialect, with_descs: bool = True, with_samples: bool = True,
+                     profile=None) -> str:
+        stats = profile.column_summaries(table.name) if profile is not None and with_samples else {}
+        lines = []
+        for column in table.columns:
+            if column.name not in columns:
+                continue
+            try:
+                col_type = column.type.compile(dialect=dialect)
+            except Exception:
+                col_type = str(column.type)
+            line = f'\t"{column.name}" {col_type}' + ("" if column.nullable else " NOT NULL")
+            desc = col_descs.get(column.name)
+            if with_descs and desc:
+                line += f" -- {desc}"
+            if stats.get(column.name):
+                line += (" " if with_descs and desc else " -- ") + f"[{stats[column.name]}]"
+            lines.append(line)
+
+        pk_columns = [c.name for c in table.primary_key.columns]
+        if pk_columns:
+            lines.append("\tPRIMARY KEY (" + ", ".join(f'"{c}"' for c in pk_columns) + ")")
+        for fk in table.foreign_key_constraints:
+            local = ", ".join(f'"{c}"' for c in fk.column_keys)
+            remote = ", ".join(f'"{e.column.name}"' for e in fk.elements) if fk.referred_table is not None else ""
+            lines.append(f'\tFOREIGN KEY({local}) REFERENCES "{fk.referred_table.name}" ({remote})')
+
+        text = f'CREATE TABLE "{table.name}" (\n' + ",\n".join(lines) + "\n)"
+        omitted = [c.name for c in table.columns if c.name not in columns]
+        if omitted:
+            names = ', '.join(omitted[:self.MAX_OMITTED_NAMES]) + (", ..." if len(omitted) > self.MAX_OMITTED_NAMES else "")
+            text += f"\n/* {len(omitted)} columns omitted: {names} */"
+        if stats:
+            text += f"\n/* {profile.row_count_note(table.name)} */"
+        elif with_samples and sample_rows:
+            rows = "\n".join(str({k: v for k, v in row.items() if k in columns}) for row in sample_rows[:self.sample_rows])
+            text += f"\n/*\n{min(len(sample_rows), self.sample_rows)} rows from {table.name} table:\n{rows}\n*/"
+        return text
+
+    def build(self, question: str, tables: List[Table], col_descs: Dict[str, Dict[str, str]],
+              sample_rows: Dict[str, List[Dict]], dialect, join_columns: Optional[Dict[str, List[str]]] = None,
+              profile=None) -> SchemaContext:
+        join_columns = join_columns or {}
+        ranked = {t.name: self.rank_columns(question, t, col_descs.get(t.name, {})) for t in tables}
+        keys = {t.name: self.key_columns(t, join_columns.get(t.name)) for t in tables}
+
+        def render(top_k, with_descs, with_samples):
+            kept = {}
+            blocks = []
+            for table in tables:
+                columns = list(keys[table.name])
+                for column in ranked[table.name]:
+                    if len(columns) >= len(keys[table.name]) + top_k:
+                        break
+                    if column not in columns:
+                        columns.append(column)
+                kept[table.name] = columns
+                blocks.append(self.render_table(table, columns, col_descs.get(table.name, {}),
+                                                sample_rows.get(table.name, []), dialect, with_descs, with_samples, profile))
+            return "\n\n".join(blocks), kept
+
+        full_text, _ = render(max((len(t.columns) for t in tables), default=0), True, True)
+        full_tokens = estimate_tokens(full_text)
+
+        # Degrade in order: samples or statistics, descriptions, then ranked columns
+        top_k = self.top_k_columns
+        attempts = [(top_k, True, True), (top_k, True, False), (top_k, False, False)]
+        while top_k > 0:
+            top_k //= 2
+            attempts.append((top_k, False, False))
+
+        for attempt in attempts:
+            text, kept = render(*attempt)
+            tokens = estimate_tokens(text)
+            if tokens <= self.token_budget:
+                break
+        return SchemaContext(text, tokens, full_tokens, max(full_tokens - tokens, 0), kept)
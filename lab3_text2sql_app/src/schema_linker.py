@@ -0,0 +1,278 @@
+import argparse
+import json
+import math
+import re
+import unicodedata
+from collections import defaultdict, namedtuple
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.engine import Engine
+
+from .join_graph import JoinGraph
+
+LinkResult = namedtuple('LinkResult', ['tables', 'confidence', 'evidence', 'skip_llm'])
+
+STOPWORDS = {
+    'a', 'about', 'all', 'an', 'and', 'any', 'are', 'as', 'at', 'be', 'by', 'can', 'data', 'database',
+    'detail', 'each', 'every', 'find', 'for', 'from', 'get', 'give', 'has', 'have', 'how', 'i', 'in',
+    'information', 'is', 'it', 'its', 'list', 'many', 'me', 'most', 'much', 'my', 'of', 'on', 'only',
+    'or', 'our', 'per', 'please', 'record', 'show', 'showing', 'system', 'than', 'that', 'the', 'their',
+    'them', 'there', 'these', 'this', 'those', 'to', 'top', 'total', 'number', 'was', 'we', 'were',
+    'what', 'which', 'who', 'whose', 'with', 'without', 'you', 'your', 'id', 'tell', 'want', 'know',
+}
+
+_IDENTIFIER_SPLIT = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+_WORD = re.compile(r'[A-Za-z0-9]+')
+_GOLD_TABLES = re.compile(r'\b(?:FROM|JOIN)\s+[`"\[]?(\w+)[`"\]]?', re.IGNORECASE)
+
+
+def normalize_token(token: str) -> str:
+    token = token.lower()
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 4 and token.endswith('sses'):
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def split_identifier(name: str) -> List[str]:
+    return [normalize_token(part) for part in _IDENTIFIER_SPLIT.findall(name)]
+
+
+def fold_accents(text: str) -> str:
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for word in _WORD.findall(fold_accents(text or '')):
+        tokens.extend(split_identifier(word) if not word.islower() and not word.isupper() else [normalize_token(word)])
+    return tokens
+
+
+def ngrams(tokens: List[str], max_n: int = 4) -> Set[str]:
+    grams = set()
+    for n in range(1, max_n + 1):
+        for i in range(len(tokens) - n + 1):
+            grams.add(' '.join(tokens[i:i + n]))
+    return grams
+
+
+def extract_tables_from_sql(sql: str) -> Set[str]:
+    return set(_GOLD_TABLES.findall(sql))
+
+
+class SchemaLinker:
+    """
+    Links a natural language question to candidate tables without calling a model.
+
+    Evidence comes from table names, column names, table/column descriptions and stored
+    categorical values. Seed tables are closed over the join graph with the bridge tables
+    needed to join them. The confidence score decides whether the LLM table selection can be skipped.
+    """
+    TABLE_WEIGHT = 1.0
+    COLUMN_WEIGHT = 0.4
+    VALUE_WEIGHT = 0.9
+    DESC_WEIGHT = 0.25
+    DESC_CAP = 0.5
+    SEED_THRESHOLD = 0.5
+
+    def __init__(self, tables: Dict[str, Dict], join_graph: Optional[JoinGraph] = None,
+                 categorical_values: Optional[Dict[str, Dict[str, List[str]]]] = None,
+                 skip_threshold: float = 0.8, max_tables: int = 5):
+        self.tables = tables
+        self.skip_threshold = skip_threshold
+        self.max_tables = max_tables
+        self.join_graph = join_graph or JoinGraph([], list(tables))
+        self.build_index(categorical_values or {})
+
+    @classmethod
+    def from_database(cls, engine: Engine, descriptions: Optional[Dict[str, Dict]] = None,
+                      join_graph: Optional[JoinGraph] = None,
+                      categorical_values: Optional[Dict[str, Dict[str, List[str]]]] = None, **kwargs):
+        inspector = inspect(engine)
+        descriptions = descriptions or {}
+        join_graph = join_graph or JoinGraph.from_engine(engine)
+        tables = {}
+        for table_name in inspector.get_table_names():
+            table_desc = descriptions.get(table_name, {})
+            col_descs = table_desc.get('cols', {})
+            tables[table_name] = {
+                'desc': table_desc.get('desc', ''),
+                'cols': {col['name']: col_descs.get(col['name'], '') for col in inspector.get_columns(table_name)}
+            }
+        return cls(tables, join_graph, categorical_values, **kwargs)
+
+    @staticmethod
+    def descriptions_from_schema_file(schema_file: str) -> Dict[str, Dict]:
+        with open(schema_file, 'r', encoding='utf-8') as file:
+            schema_data = json.load(file)
+        descriptions = {}
+        for table in schema_data:
+            for table_name, table_info in table.items():
+                descriptions[table_name] = {
+                    'desc': table_info.get('table_desc', ''),
+                    'cols': {col['col']: col['col_desc'] for col in table_info.get('cols', [])}
+                }
+        return descriptions
+
+    def build_index(self, categorical_values: Dict[str, Dict[str, List[str]]]):
+        self.table_tokens = {}
+        self.column_tokens = defaultdict(list)
+        column_owners = defaultdict(set)
+        self.desc_tokens = {}
+        for table_name, info in self.tables.items():
+            self.table_tokens[table_name] = split_identifier(table_name)
+            desc_tokens = set(tokenize(info.get('desc', '')))
+            for col_name, col_desc in info.get('cols', {}).items():
+                tokens = [t for t in split_identifier(col_name) if t != 'id']
+                if tokens:
+                    self.column_tokens[table_name].append((col_name, tokens))
+                    column_owners[' '.join(tokens)].add(table_name)
+                desc_tokens.update(tokenize(col_desc))
+            self.desc_tokens[table_name] = desc_tokens - STOPWORDS
+        self.column_owners = {key: len(owners) for key, owners in column_owners.items()}
+
+        # Tokens that only name tables are handled by table evidence, not descriptions
+        self.name_tokens = {t for tokens in self.table_tokens.values() for t in tokens}
+        doc_freq = defaultdict(int)
+        for tokens in self.desc_tokens.values():
+            for token in tokens:
+                doc_freq[token] += 1
+        total = max(len(self.tables), 1)
+        self.idf = {token: math.log(1 + total / df) / math.log(1 + total) for token, df in doc_freq.items()}
+
+        # Single-word values that the schema itself uses descriptively (e.g. 'Music') are ambiguous
+        vocabulary = self.name_tokens | set(doc_freq)
+        self.values = defaultdict(set)
+        for table_name, columns in categorical_values.items():
+            for col_name, values in columns.items():
+                for value in values:
+                    key = ' '.join(tokenize(value))
+                    if not key or key in STOPWORDS or key in vocabulary:
+                        continue
+                    self.values[key].add((table_name, col_name))
+
+    def link(self, question: str) -> LinkResult:
+        tokens = tokenize(question)
+        token_set = set(tokens)
+        content = {t for t in token_set if t not in STOPWORDS and not t.isdigit()}
+        scores = defaultdict(float)
+        evidence = defaultdict(list)
+        strong, weak = set(), set()
+
+        for table_name, name_tokens in self.table_tokens.items():
+            if all(t in token_set for t in name_tokens):
+                scores[table_name] += self.TABLE_WEIGHT
+                evidence[table_name].append(f"table:{table_name}")
+                strong.update(name_tokens)
+
+        for table_name, columns in self.column_tokens.items():
+            for col_name, col_tokens in columns:
+                if all(t in token_set for t in col_tokens) and not set(col_tokens) <= self.name_tokens:
+                    owners = self.column_owners.get(' '.join(col_tokens), 1)
+                    scores[table_name] += self.COLUMN_WEIGHT / owners
+                    evidence[table_name].append(f"column:{table_name}.{col_name}")
+                    strong.update(col_tokens)
+
+        for gram in ngrams(tokens):
+            owners = self.values.get(gram)
+            if not owners:
+                continue
+            owner_tables = {table_name for table_name, _ in owners}
+            for table_name, col_name in owners:
+                scores[table_name] += self.VALUE_WEIGHT / len(owner_tables)
+                evidence[table_name].append(f"value:{table_name}.{col_name}='{gram}'")
+            strong.update(gram.split())
+
+        for table_name, desc_tokens in self.desc_tokens.items():
+            matched = (content & desc_tokens) - self.name_tokens
+            if not matched:
+                continue
+            desc_score = sum(self.DESC_WEIGHT * self.idf.get(t, 0) for t in matched)
+            scores[table_name] += min(desc_score, self.DESC_CAP)
+            weak.update(matched)
+
+        seeds = {t for t, score in scores.items() if score >= self.SEED_THRESHOLD}
+        if not seeds:
+            return LinkResult([], 0.0, {}, False)
+
+        candidates = self.expand_with_bridges(seeds)
+        explained = sum(1.0 if t in strong else 0.5 if t in weak else 0.0 for t in content)
+        coverage = explained / len(content) if content else 0.0
+        strength = min(min(scores[t], 1.0) for t in seeds)
+        confidence = round(coverage * strength, 3)
+        if len(candidates) > self.max_tables:
+            confidence = 0.0
+
+        ordered = sorted(candidates, key=lambda t: (-scores.get(t, 0.0), t))
+        return LinkResult(ordered, confidence, dict(evidence), confidence >= self.skip_threshold)
+
+    def expand_with_bridges(self, seeds: Set[str]) -> Set[str]:
+        return set(self.join_graph.close(sorted(seeds)))
+
+
+def evaluate(linker: SchemaLinker, samples: List[Dict]) -> Dict:
+    """
+    Measures linking accuracy and the LLM skip rate on sample (input, query) pairs.
+    A prediction is counted as correct when it covers every table used by the gold query.
+    """
+    known_tables = set(linker.tables)
+    results = []
+    for sample in samples:
+        gold = extract_tables_from_sql(sample['query']) & known_tables
+        link = linker.link(sample['input'])
+        predicted = set(link.tables)
+        results.append({
+            "input": sample['input'],
+            "gold": sorted(gold),
+            "predicted": link.tables,
+            "confidence": link.confidence,
+            "skip_llm": link.skip_llm,
+            "covered": gold <= predicted,
+            "exact": gold == predicted
+        })
+
+    total = len(results) or 1
+    skipped = [r for r in results if r['skip_llm']]
+    return {
+        "samples": len(results),
+        "skip_rate": round(len(skipped) / total, 3),
+        "skipped_accuracy": round(sum(r['covered'] for r in skipped) / len(skipped), 3) if skipped else None,
+        "coverage_accuracy": round(sum(r['covered'] for r in results) / total, 3),
+        "exact_accuracy": round(sum(r['exact'] for r in results) / total, 3),
+        "details": results
+    }
+
+
+def load_samples(sample_file: str) -> List[Dict]:
+    samples = []
+    with open(sample_file, 'r', encoding='utf-8') as file:
+        for line in file:
+            data = json.loads(line)
+            if 'input' in data and 'query' in data:
+                samples.append({"input": data['input'], "query": data['query']})
+    return samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the lexical schema linker on sample queries.")
+    parser.add_argument("--uri", default="sqlite:///Chinook.db")
+    parser.add_argument("--schema-file", default="../db_metadata/chinook_detailed_schema.json")
+    parser.add_argument("--sample-file", default="../db_metadata/example_queries.jsonl")
+    parser.add_argument("--skip-threshold", type=float, default=0.8)
+    args = parser.parse_args()
+
+    from .value_index import CategoricalValueIndex
+
+    engine = create_engine(args.uri)
+    linker = SchemaLinker.from_database(
+        engine,
+        SchemaLinker.descriptions_from_schema_file(args.schema_file),
+        categorical_values=CategoricalValueIndex.build(engine).categorical_values(),
+        skip_threshold=args.skip_threshold
+    )
+    print(json.dumps(evaluate(linker, load_samples(args.sample_file)), indent=2, ensure_ascii=False))
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager, AsyncExitStack
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from .async_db_utils import AsyncBedrockClients, AsyncOpenSearchClient, AsyncDB_Tool_Client
+from .bedrock_gateway import get_gateway
+from .callbacks import EventQueueCallbacks, NullStreamHandler
+from .config import load_config_section, load_model_config
+
+
+def load_server_config():
+    config = load_config_section('server')
+    config['region'] = os.getenv('AWS_REGION', config.get('region', 'us-west-2'))
+    return config
+
+
+class QueryRequest(BaseModel):
+    question: str
+    model: Optional[str] = None
+    language: Optional[str] = None
+
+
+class PipelineService:
+    """
+    Clients shared by every request of one server process: the aiobotocore Bedrock clients
+    (behind the rate-limited gateway), the OpenSearch connection pools and, through the
+    pipeline modules, the database engines, schema linkers and join graphs.
+    """
+    def __init__(self, config: Dict):
+        self.config = config
+        self.region = config['region']
+        self.models = load_model_config()
+        self.database = config.get('database', {"dialect": "SQLite", "uri": "sqlite:///Chinook.db"})
+        self.semaphore = asyncio.Semaphore(config.get('max_concurrency', 100))
+        self.stack = AsyncExitStack()
+
+    async def start(self):
+        self.clients = await self.stack.enter_async_context(AsyncBedrockClients(self.region, "interactive"))
+        self.sql_os_client = AsyncOpenSearchClient(self.region, 'example_queries', 'input_v', ["input", "query"])
+        self.schema_os_client = AsyncOpenSearchClient(self.region, 'schema_descriptions', 'table_summary_v', ["table_name", "table_summary"])
+        self.stack.push_async_callback(self.sql_os_client.close)
+        self.stack.push_async_callback(self.schema_os_client.close)
+
+    async def stop(self):
+        await self.stack.aclose()
+
+    def create_client(self, request: QueryRequest) -> AsyncDB_Tool_Client:
+        model = request.model or self.config.get('model', 'Claude 3.5 Sonnet v2')
+        if model not in self.models:
+            raise HTTPException(status_code=400, detail=f"Unknown model '{model}'. Available: {', '.join(self.models)}")
+        model_info = dict(self.models[model], region_name=self.region)
+        language = request.language or self.config.get('language', 'English')
+        return AsyncDB_Tool_Client(self.clients, model_info, self.database, language, self.sql_os_client, self.schema_os_client, request.question)
+
+    async def invoke(self, client: AsyncDB_Tool_Client, callbacks) -> Dict[str, Any]:
+        async with self.semaphore:
+            response, tokens = await client.invoke(callbacks)
+        return result_payload(client, response, tokens)
+
+
+def result_payload(client: AsyncDB_Tool_Client, response: str, tokens: Dict) -> Dict[str, Any]:
+    tool_state = client.db_tool.tool_state
+    return {
+        "response": response,
+        "success": tool_state["success"] == "True",
+        "sql": tool_state["final_query"] if tool_state["final_query"] != "None" else None,
+        "rows": tool_state.get("full_result", tool_state.get("partial_result")),
+        "truncated": "partial_result" in tool_state,
+        "result_csv_file": tool_state["result_csv_file"],
+        "tokens": tokens,
+        "trace_id": tool_state.get("trace_id")
+    }
+
+
+def sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    service = PipelineService(load_server_config())
+    await service.start()
+    app.state.service = service
+    try:
+        yield
+    finally:
+        await service.stop()
+
+
+app = FastAPI(title="Text-to-SQL API", lifespan=lifespan)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/v1/metrics")
+async def metrics():
+    return get_gateway(app.state.service.region).metrics()
+
+
+@app.post("/v1/query")
+async def query(request: QueryRequest):
+    service = app.state.service
+    client = service.create_client(request)
+    try:
+        return await service.invoke(client, NullStreamHandler())
+    except Exception as e:
+        logging.error(f"Query failed '{request.question}': {str(e)}")
+        raise HTTPException(status_code=500, detail=f"{type(e).__name__}: {str(e)}")
+
+
+@app.post("/v1/query/stream")
+async def query_stream(request: QueryRequest):
+    """
+    Server-sent events: `stage`, `samples`, `token` and `tool_result` while the pipeline runs,
+    then a single `result` (response, SQL, rows, tokens) or `error` event.
+    """
+    service = app.state.service
+    client = service.create_client(request)
+    queue = asyncio.Queue()
+    callbacks = EventQueueCallbacks(asyncio.get_running_loop(), queue)
+
+    async def events():
+        task = asyncio.create_task(service.invoke(client, callbacks))
+        try:
+            while True:
+                next_event = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({next_event, task}, return_when=asyncio.FIRST_COMPLETED)
+                if next_event in done:
+                    yield sse(*next_event.result())
+                    continue
+                next_event.cancel()
+                break
+            while not queue.empty():
+                yield sse(*queue.get_nowait())
+            if task.exception() is not None:
+                error = task.exception()
+                logging.error(f"Query failed '{request.question}': {str(error)}")
+                yield sse("error", {"error": f"{type(error).__name__}: {str(error)}"})
+            else:
+                yield sse("result", task.result())
+        finally:
+            # The client disconnected: stop the pipeline instead of finishing an answer nobody reads
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    config = load_server_config()
+    uvicorn.run("src.server:app", host=config.get('host', '0.0.0.0'), port=config.get('port', 8000), workers=config.get('workers', 1))
@@ -0,0 +1,246 @@
+import argparse
+import contextvars
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from .config import load_config_section
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class TraceRecord:
+    def __init__(self):
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def add(self, span):
+        with self.lock:
+            self.spans.append(span)
+
+
+class Span:
+    """
+    One timed stage of a request. When `tokens` is given, the input/output token counts
+    accumulated in that dict while the span was open are recorded on the span.
+    """
+    def __init__(self, name: str, trace: TraceRecord, parent_id: Optional[str], attributes: Dict, tokens: Optional[Dict] = None):
+        self.name = name
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.tokens = tokens
+        self.tokens_start = (tokens.get('total_input_tokens', 0), tokens.get('total_output_tokens', 0)) if tokens is not None else None
+        self.start_time = time.time()
+        self.start_perf = time.perf_counter()
+        self.duration_ms = None
+        self.status = "ok"
+        self.error = None
+        self.context_token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, message: str):
+        self.status = "error"
+        self.error = message
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.duration_ms = round((time.perf_counter() - self.start_perf) * 1000, 3)
+        if error is not None:
+            self.fail(f"{type(error).__name__}: {error}")
+        if self.tokens is not None:
+            self.attributes['input_tokens'] = self.tokens.get('total_input_tokens', 0) - self.tokens_start[0]
+            self.attributes['output_tokens'] = self.tokens.get('total_output_tokens', 0) - self.tokens_start[1]
+        self.trace.add(self)
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+
+class JSONLExporter:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def export(self, spans: List[Span]):
+        lines = "".join(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n" for span in spans)
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(lines)
+
+
+class OTLPExporter:
+    """Sends finished traces to an OTLP/HTTP collector (JSON encoding) from a background thread."""
+    def __init__(self, endpoint: str, service_name: str = "text2sql", headers: Optional[Dict] = None, timeout: float = 5.0):
+        import requests
+        self.session = requests.Session()
+        self.endpoint = endpoint.rstrip('/') + ("" if endpoint.rstrip('/').endswith('/v1/traces') else "/v1/traces")
+        self.service_name = service_name
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="otlp-export")
+
+    @staticmethod
+    def attribute(key, value):
+        if isinstance(value, bool):
+            encoded = {"boolValue": value}
+        elif isinstance(value, int):
+            encoded = {"intValue": str(value)}
+        elif isinstance(value, float):
+            encoded = {"doubleValue": value}
+        else:
+            encoded = {"stringValue": value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)}
+        return {"key": key, "value": encoded}
+
+    def encode(self, spans: List[Span]) -> Dict:
+        encoded = []
+        for span in spans:
+            start_ns = int(span.start_time * 1e9)
+            data = {
+                "traceId": span.trace.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(start_ns),
+                "endTimeUnixNano": str(start_ns + int((span.duration_ms or 0) * 1e6)),
+                "attributes": [self.attribute(k, v) for k, v in span.attributes.items() if v is not None],
+                "status": {"code": 2, "message": span.error or ""} if span.status == "error" else {"code": 1}
+            }
+            if span.parent_id:
+                data["parentSpanId"] = span.parent_id
+            encoded.append(data)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [self.attribute("service.name", self.service_name)]},
+                "scopeSpans": [{"scope": {"name": "text2sql.tracing"}, "spans": encoded}]
+            }]
+        }
+
+    def send(self, payload: Dict):
+        try:
+            response = self.session.post(self.endpoint, data=json.dumps(payload), headers=self.headers, timeout=self.timeout)
+            response.raise_for_status()
+        except Exception as e:
+            logging.warning(f"OTLP export failed: {str(e)}")
+
+    def export(self, spans: List[Span]):
+        self.executor.submit(self.send, self.encode(spans))
+
+
+class Tracer:
+    """
+    Span tracer with the current span held in a context variable, so nested stages in the same
+    thread or asyncio task are parented automatically. A trace is exported once its root span ends.
+    """
+    def __init__(self, exporters: Optional[List] = None):
+        self.exporters = exporters
+
+    def get_exporters(self) -> List:
+        if self.exporters is None:
+            self.exporters = []
+            try:
+                config = load_config_section('tracing')
+            except Exception as e:
+                logging.warning(f"Tracing config unavailable: {str(e)}")
+                config = {}
+            if config.get('enabled', True):
+                if config.get('jsonl_path', './traces/spans.jsonl'):
+                    self.exporters.append(JSONLExporter(config.get('jsonl_path', './traces/spans.jsonl')))
+                endpoint = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT') or config.get('otlp_endpoint')
+                if endpoint:
+                    self.exporters.append(OTLPExporter(endpoint, config.get('service_name', 'text2sql')))
+        return self.exporters
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def start_span(self, name: str, tokens: Optional[Dict] = None, **attributes) -> Span:
+        parent = _current_span.get()
+        trace = parent.trace if parent is not None else TraceRecord()
+        span = Span(name, trace, parent.span_id if parent is not None else None, attributes, tokens)
+        span.context_token = _current_span.set(span)
+        return span
+
+    def end_span(self, span: Span, error: Optional[BaseException] = None):
+        span.finish(error)
+        try:
+            _current_span.reset(span.context_token)
+        except ValueError:
+            # Ended from another context (e.g. the root span of a client created elsewhere)
+            pass
+        if span.parent_id is None:
+            self.export(span.trace)
+
+    @contextmanager
+    def span(self, name: str, tokens: Optional[Dict] = None, **attributes):
+        span = self.start_span(name, tokens, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, e)
+            raise
+        self.end_span(span)
+
+    def export(self, trace: TraceRecord):
+        for exporter in self.get_exporters():
+            try:
+                exporter.export(trace.spans)
+            except Exception as e:
+                logging.warning(f"Trace export failed: {str(e)}")
+
+
+tracer = Tracer()
+
+
+def summarize(path: str) -> Dict[str, Dict]:
+    """Latency percentiles and error counts per span name from a JSONL trace file."""
+    durations = defaultdict(list)
+    errors = defaultdict(int)
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            span = json.loads(line)
+            durations[span['name']].append(span['duration_ms'])
+            errors[span['name']] += span['status'] == "error"
+
+    def percentile(values, q):
+        return round(values[min(int(len(values) * q), len(values) - 1)], 1)
+
+    summary = {}
+    for name, values in sorted(durations.items()):
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "errors": errors[name],
+            "p50_ms": percentile(values, 0.5),
+            "p95_ms": percentile(values, 0.95),
+            "max_ms": round(values[-1], 1)
+        }
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize per-stage latency from a JSONL trace file.")
+    parser.add_argument("path", nargs="?", default="./traces/spans.jsonl")
+    args = parser.parse_args()
+    print(json.dumps(summarize(args.path), indent=2))
@@ -0,0 +1,407 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .config import load_config_section
+
+LIVE, RECORD, REPLAY = "live", "record", "replay"
+
+# Values that change between runs of the same question (result file names, timestamps)
+_VOLATILE = [
+    (re.compile(r'\d{14}_[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'), '<run-id>'),
+    (re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?'), '<timestamp>'),
+    (re.compile(r'"trace_id": "[0-9a-f]{32}"'), '"trace_id": "<trace-id>"'),
+]
+
+
+class FixtureNotFoundError(KeyError):
+    """Replay mode found no recorded response for a request."""
+
+
+def load_transport_config():
+    config = load_config_section('transport')
+
+    # Environment variables take precedence so CI can switch modes without editing the config
+    config['mode'] = os.getenv('TEXT2SQL_TRANSPORT', config.get('mode', LIVE)).lower()
+    config['fixture_dir'] = os.getenv('TEXT2SQL_FIXTURE_DIR', config.get('fixture_dir', './fixtures'))
+    if os.getenv('TEXT2SQL_REPLAY_LATENCY_SCALE'):
+        config['latency_scale'] = float(os.getenv('TEXT2SQL_REPLAY_LATENCY_SCALE'))
+    return config
+
+
+def transport_mode() -> str:
+    return load_transport_config()['mode']
+
+
+def request_key(service: str, operation: str, request: Dict) -> str:
+    text = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+    for pattern, replacement in _VOLATILE:
+        text = pattern.sub(replacement, text)
+    return hashlib.sha1(f"{service}.{operation}:{text}".encode('utf-8')).hexdigest()[:20]
+
+
+class FixtureStore:
+    """One JSON file per request under `<fixture_dir>/<service>.<operation>/<key>.json`."""
+    def __init__(self, fixture_dir: str):
+        self.fixture_dir = fixture_dir
+        self.lock = threading.Lock()
+
+    def path(self, service: str, operation: str, key: str) -> str:
+        return os.path.join(self.fixture_dir, f"{service}.{operation}", f"{key}.json")
+
+    def save(self, service: str, operation: str, request: Dict, fixture: Dict):
+        key = request_key(service, operation, request)
+        path = self.path(service, operation, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fixture = {"request": request, **fixture}
+        with self.lock:
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(fixture, file, ensure_ascii=False, indent=1, default=str)
+
+    def load(self, service: str, operation: str, request: Dict) -> Dict:
+        key = request_key(service, operation, request)
+        path = self.path(service, operation, key)
+        if not os.path.exists(path):
+            raise FixtureNotFoundError(f"No recorded {service}.{operation} response for request {key} ({path})")
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+
+class LatencyModel:
+    """
+    Synthetic latency for replayed calls. `recorded` replays the measured timings, `fixed` uses
+    the configured per-operation seconds. Both are multiplied by `scale`; 0 replays instantly.
+    """
+    def __init__(self, mode: str = "recorded", scale: float = 1.0, fixed: Optional[Dict[str, float]] = None):
+        self.mode = mode
+        self.scale = scale
+        self.fixed = fixed or {}
+
+    @classmethod
+    def from_config(cls, config: Dict):
+        return cls(config.get('latency', 'recorded'), config.get('latency_scale', 1.0), config.get('fixed_latency', {}))
+
+    def delay(self, operation: str, recorded: float) -> float:
+        seconds = self.fixed.get(operation, recorded) if self.mode == "fixed" else recorded
+        return max(seconds, 0.0) * self.scale
+
+    def sleep(self, operation: str, recorded: float):
+        seconds = self.delay(operation, recorded)
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class ReplayBody:
+    def __init__(self, text: str):
+        self.data = io.BytesIO(text.encode('utf-8'))
+
+    def read(self, *args):
+        return self.data.read(*args)
+
+    def close(self):
+        self.data.close()
+
+
+class AsyncReplayBody(ReplayBody):
+    """Stand-in for an aiobotocore StreamingBody, read as `async with response['body'] as body`."""
+    async def read(self, *args):
+        return self.data.read(*args)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class RecordingStream:
+    def __init__(self, stream, on_complete: Callable[[List, List[float]], None], start: float):
+        self.stream = stream
+        self.on_complete = on_complete
+        self.start = start
+        self.events = []
+        self.offsets = []
+
+    def __iter__(self):
+        for event in self.stream:
+            self.events.append(event)
+            self.offsets.append(round(time.perf_counter() - self.start, 4))
+            yield event
+        self.on_complete(self.events, self.offsets)
+
+    def close(self):
+        close = getattr(self.stream, 'close', None)
+        if close is not None:
+            return close()
+
+
+class AsyncRecordingStream(RecordingStream):
+    async def __aiter__(self):
+        async for event in self.stream:
+            self.events.append(event)
+            self.offsets.append(round(time.perf_counter() - self.start, 4))
+            yield event
+        self.on_complete(self.events, self.offsets)
+
+
+class ReplayStream:
+    def __init__(self, events: List, offsets: List[float], latency: LatencyModel, start: float):
+        self.events = events
+        self.offsets = offsets
+        self.latency = latency
+        self.start = start
+
+    def __iter__(self):
+        for event, offset in zip(self.events, self.offsets):
+            wait = self.start + self.latency.delay("converse_stream_event", offset) - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            yield event
+
+    def close(self):
+        pass
+
+
+class AsyncReplayStream(ReplayStream):
+    async def __aiter__(self):
+        for event, offset in zip(self.events, self.offsets):
+            wait = self.start + self.latency.delay("converse_stream_event", offset) - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield event
+
+
+class RecordingClient:
+    """Calls the real client and stores every response (with its timing) as a fixture."""
+    STREAMING = {"converse_stream"}
+    STREAM = RecordingStream
+    BODY = ReplayBody
+
+    def __init__(self, client, service: str, store: FixtureStore):
+        self.client = client
+        self.service = service
+        self.store = store
+        self.meta = getattr(client, 'meta', None)
+
+    def __getattr__(self, operation):
+        method = getattr(self.client, operation)
+        if not callable(method):
+            return method
+
+        def call(**kwargs):
+            start = time.perf_counter()
+            response = method(**kwargs)
+            elapsed = round(time.perf_counter() - start, 4)
+            body = None
+            if operation not in self.STREAMING and 'body' in response and hasattr(response['body'], 'read'):
+                body = response['body'].read().decode('utf-8')
+            return self.record(operation, kwargs, response, elapsed, start, body)
+        return call
+
+    def record(self, operation: str, kwargs: Dict, response: Dict, elapsed: float, start: float, body: Optional[str] = None):
+        if operation in self.STREAMING:
+            def save(events, offsets):
+                self.store.save(self.service, operation, kwargs, {
+                    "elapsed": elapsed,
+                    "response": {k: v for k, v in response.items() if k != 'stream'},
+                    "events": events,
+                    "offsets": offsets
+                })
+            response['stream'] = self.STREAM(response['stream'], save, start)
+            return response
+        if body is not None:
+            response['body'] = self.BODY(body)
+            self.store.save(self.service, operation, kwargs, {"elapsed": elapsed, "response": {**response, "body": body}, "body": True})
+            return response
+        self.store.save(self.service, operation, kwargs, {"elapsed": elapsed, "response": response})
+        return response
+
+
+class AsyncRecordingClient(RecordingClient):
+    """RecordingClient for aiobotocore clients; fixtures are shared with the sync client."""
+    STREAM = AsyncRecordingStream
+    BODY = AsyncReplayBody
+
+    def __getattr__(self, operation):
+        method = getattr(self.client, operation)
+        if not callable(method):
+            return method
+
+        async def call(**kwargs):
+            start = time.perf_counter()
+            response = await method(**kwargs)
+            elapsed = round(time.perf_counter() - start, 4)
+            body = None
+            if operation not in self.STREAMING and 'body' in response and hasattr(response['body'], 'read'):
+                async with response['body'] as stream:
+                    body = (await stream.read()).decode('utf-8')
+            return self.record(operation, kwargs, response, elapsed, start, body)
+        return call
+
+
+class ReplayClient:
+    """Serves recorded responses for boto3-style `operation(**kwargs)` calls without network access."""
+    STREAM = ReplayStream
+    BODY = ReplayBody
+
+    def __init__(self, service: str, store: FixtureStore, latency: LatencyModel, region: Optional[str] = None):
+        self.service = service
+        self.store = store
+        self.latency = latency
+        self.meta = type('ReplayMeta', (), {'region_name': region})()
+
+    def __getattr__(self, operation):
+        if operation.startswith('_'):
+            raise AttributeError(operation)
+
+        def call(**kwargs):
+            start = time.perf_counter()
+            response, fixture = self.replay(operation, kwargs, start)
+            self.latency.sleep(operation, fixture['elapsed'])
+            return response
+        return call
+
+    def replay(self, operation: str, kwargs: Dict, start: float):
+        fixture = self.store.load(self.service, operation, kwargs)
+        response = fixture['response']
+        if 'events' in fixture:
+            response['stream'] = self.STREAM(fixture['events'], fixture['offsets'], self.latency, start)
+        elif fixture.get('body'):
+            response['body'] = self.BODY(response['body'])
+        return response, fixture
+
+
+class AsyncReplayClient(ReplayClient):
+    STREAM = AsyncReplayStream
+    BODY = AsyncReplayBody
+
+    def __getattr__(self, operation):
+        if operation.startswith('_'):
+            raise AttributeError(operation)
+
+        async def call(**kwargs):
+            start = time.perf_counter()
+            response, fixture = self.replay(operation, kwargs, start)
+            seconds = self.latency.delay(operation, fixture['elapsed'])
+            if seconds > 0:
+                await asyncio.sleep(seconds)
+            return response
+        return call
+
+
+class ReplayIndices:
+    def exists(self, index, **kwargs):
+        return True
+
+    def create(self, index, body=None, **kwargs):
+        return {"acknowledged": True, "index": index}
+
+    def delete(self, index, **kwargs):
+        return {"acknowledged": True}
+
+
+class RecordingOpenSearch:
+    def __init__(self, conn, store: FixtureStore):
+        self.conn = conn
+        self.store = store
+
+    def search(self, index=None, body=None, **kwargs):
+        start = time.perf_counter()
+        response = self.conn.search(index=index, body=body, **kwargs)
+        self.store.save("opensearch", "search", {"index": index, "body": body},
+                        {"elapsed": round(time.perf_counter() - start, 4), "response": response})
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+class ReplayOpenSearch:
+    def __init__(self, store: FixtureStore, latency: LatencyModel):
+        self.store = store
+        self.latency = latency
+        self.indices = ReplayIndices()
+
+    def search(self, index=None, body=None, **kwargs):
+        fixture = self.store.load("opensearch", "search", {"index": index, "body": body})
+        self.latency.sleep("search", fixture['elapsed'])
+        return fixture['response']
+
+    def bulk(self, body=None, **kwargs):
+        return {"errors": False, "items": []}
+
+
+class AsyncRecordingOpenSearch(RecordingOpenSearch):
+    async def search(self, index=None, body=None, **kwargs):
+        start = time.perf_counter()
+        response = await self.conn.search(index=index, body=body, **kwargs)
+        self.store.save("opensearch", "search", {"index": index, "body": body},
+                        {"elapsed": round(time.perf_counter() - start, 4), "response": response})
+        return response
+
+
+class AsyncReplayOpenSearch(ReplayOpenSearch):
+    async def search(self, index=None, body=None, **kwargs):
+        fixture = self.store.load("opensearch", "search", {"index": index, "body": body})
+        seconds = self.latency.delay("search", fixture['elapsed'])
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+        return fixture['response']
+
+    async def close(self):
+        pass
+
+
+def make_bedrock_client(service: str, region: str, factory: Callable[[], Any]):
+    """
+    Returns the client for `service` according to the transport mode: the real client built by
+    `factory` (live), the real client wrapped to record fixtures (record) or a replay stand-in.
+    """
+    config = load_transport_config()
+    mode = config['mode']
+    if mode == REPLAY:
+        return ReplayClient(service, FixtureStore(config['fixture_dir']), LatencyModel.from_config(config), region)
+    client = factory()
+    if mode == RECORD:
+        return RecordingClient(client, service, FixtureStore(config['fixture_dir']))
+    return client
+
+
+def make_opensearch_connection(factory: Callable[[], Any]):
+    config = load_transport_config()
+    mode = config['mode']
+    if mode == REPLAY:
+        return ReplayOpenSearch(FixtureStore(config['fixture_dir']), LatencyModel.from_config(config))
+    conn = factory()
+    if mode == RECORD:
+        return RecordingOpenSearch(conn, FixtureStore(config['fixture_dir']))
+    return conn
+
+
+async def make_async_bedrock_client(service: str, region: str, factory: Callable[[], Awaitable[Any]]):
+    """make_bedrock_client for aiobotocore clients; `factory` is awaited only when a real client is needed."""
+    config = load_transport_config()
+    mode = config['mode']
+    if mode == REPLAY:
+        return AsyncReplayClient(service, FixtureStore(config['fixture_dir']), LatencyModel.from_config(config), region)
+    client = await factory()
+    if mode == RECORD:
+        return AsyncRecordingClient(client, service, FixtureStore(config['fixture_dir']))
+    return client
+
+
+def make_async_opensearch_connection(factory: Callable[[], Any]):
+    config = load_transport_config()
+    mode = config['mode']
+    if mode == REPLAY:
+        return AsyncReplayOpenSearch(FixtureStore(config['fixture_dir']), LatencyModel.from_config(config))
+    conn = factory()
+    if mode == RECORD:
+        return AsyncRecordingOpenSearch(conn, FixtureStore(config['fixture_dir']))
+    return conn
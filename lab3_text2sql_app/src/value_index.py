@@ -0,0 +1,214 @@
+import json
+import os
+import time
+from collections import defaultdict, namedtuple
+from typing import Dict, List, Optional, Union
+
+from sqlalchemy import inspect, select, func, String, Table, MetaData
+from sqlalchemy.engine import Engine, Connection
+
+from .schema_linker import tokenize, STOPWORDS
+
+ValueMatch = namedtuple('ValueMatch', ['mention', 'table', 'column', 'value', 'score'])
+
+
+def normalize_value(value: str) -> str:
+    return ' '.join(tokenize(value))
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CategoricalValueIndex:
+    """
+    Compact local index of distinct values stored in low-cardinality text columns.
+
+    Values are sampled per column at build time and indexed by character trigrams, so literals
+    mentioned in a question can be mapped to the exact stored spelling and case. Each column keeps
+    the table's row count and a signature of its own content (distinct count, min, max and total
+    length) from when it was sampled, so `refresh` re-samples only columns that changed, including
+    most in-place updates.
+    """
+    def __init__(self, columns: Optional[Dict[str, Dict]] = None, max_distinct: int = 300,
+                 sample_rows: int = 100000, min_similarity: float = 0.55):
+        self.columns = columns or {}
+        self.max_distinct = max_distinct
+        self.sample_rows = sample_rows
+        self.min_similarity = min_similarity
+        self.built_at = 0.0
+        self.rebuild_grams()
+
+    def rebuild_grams(self):
+        self.entries = []
+        self.exact = defaultdict(list)
+        self.grams = defaultdict(set)
+        for key, column in self.columns.items():
+            table_name, col_name = key.split('.', 1)
+            for value in column['values']:
+                normalized = normalize_value(value)
+                if not normalized or normalized in STOPWORDS or normalized.isdigit():
+                    continue
+                entry_id = len(self.entries)
+                self.entries.append((table_name, col_name, value, normalized))
+                self.exact[normalized].append(entry_id)
+                for gram in trigrams(normalized):
+                    self.grams[gram].add(entry_id)
+
+    @classmethod
+    def build(cls, bind: Union[Engine, Connection], **kwargs):
+        index = cls(**kwargs)
+        index.refresh(bind)
+        return index
+
+    def refresh(self, bind: Union[Engine, Connection]) -> List[str]:
+        """
+        Re-samples columns whose row count or content signature changed, adds new text columns
+        and drops columns that no longer exist. Returns the refreshed column keys.
+        """
+        if isinstance(bind, Engine):
+            with bind.connect() as conn:
+                return self.refresh(conn)
+
+        conn = bind
+        inspector = inspect(conn)
+        metadata = MetaData()
+        seen, refreshed = set(), []
+        for table_name in inspector.get_table_names():
+            text_columns = [c['name'] for c in inspector.get_columns(table_name) if isinstance(c['type'], String)]
+            if not text_columns:
+                continue
+            table = Table(table_name, metadata, autoload_with=conn)
+            # One aggregate scan per table: counts alone miss updates that keep the row count
+            aggregates = [func.count()]
+            for col_name in text_columns:
+                column = table.c[col_name]
+                aggregates += [func.count(func.distinct(column)), func.min(column), func.max(column),
+                               func.sum(func.char_length(column))]
+            row = conn.execute(select(*aggregates).select_from(table)).one()
+            row_count = row[0]
+            for i, col_name in enumerate(text_columns):
+                key = f"{table_name}.{col_name}"
+                seen.add(key)
+                signature = [None if value is None else str(value) for value in row[1 + 4 * i:5 + 4 * i]]
+                cached = self.columns.get(key)
+                if cached is not None and cached['row_count'] == row_count and cached.get('signature') == signature:
+                    continue
+                values = self.sample_distinct_values(conn, table, col_name)
+                self.columns[key] = {"row_count": row_count, "signature": signature, "values": values}
+                refreshed.append(key)
+
+        for key in list(self.columns):
+            if key not in seen:
+                del self.columns[key]
+                refreshed.append(key)
+        if refreshed:
+            self.rebuild_grams()
+        self.built_at = time.time()
+        return refreshed
+
+    def sample_distinct_values(self, conn, table: Table, col_name: str) -> List[str]:
+        sample = select(table.c[col_name].label('value')).where(table.c[col_name].isnot(None)).limit(self.sample_rows).subquery()
+        distinct = conn.execute(select(func.count(func.distinct(sample.c.value)))).scalar()
+        if not distinct or distinct > self.max_distinct:
+            return []
+        return sorted(str(v) for v in conn.execute(select(sample.c.value).distinct()).scalars().all())
+
+    def categorical_values(self) -> Dict[str, Dict[str, List[str]]]:
+        values = defaultdict(dict)
+        for key, column in self.columns.items():
+            if column['values']:
+                table_name, col_name = key.split('.', 1)
+                values[table_name][col_name] = column['values']
+        return dict(values)
+
+    def lookup(self, question: str, limit: int = 10) -> List[ValueMatch]:
+        tokens = tokenize(question)
+        spans = []
+        for n in range(4, 0, -1):
+            for i in range(len(tokens) - n + 1):
+                words = tokens[i:i + n]
+                if words[0] in STOPWORDS or words[-1] in STOPWORDS:
+                    continue
+                mention = ' '.join(words)
+                if len(mention) >= 3 and not mention.isdigit():
+                    spans.append((i, i + n, mention))
+
+        # Exact matches win over fuzzy ones, and longer spans over the shorter spans inside them
+        matches, covered = [], set()
+        for start, end, mention in spans:
+            if covered & set(range(start, end)) or mention not in self.exact:
+                continue
+            covered.update(range(start, end))
+            matches.extend(self.to_matches(mention, [(entry_id, 1.0) for entry_id in self.exact[mention]]))
+
+        fuzzy = []
+        for start, end, mention in spans:
+            if len(mention) >= 4 and not covered & set(range(start, end)):
+                found = self.fuzzy_candidates(mention)
+                if found:
+                    fuzzy.append((found[0][1], end - start, start, end, mention, found))
+        for score, _, start, end, mention, found in sorted(fuzzy, key=lambda f: (-f[0], -f[1])):
+            if covered & set(range(start, end)):
+                continue
+            covered.update(range(start, end))
+            matches.extend(self.to_matches(mention, found))
+
+        matches.sort(key=lambda m: -m.score)
+        return matches[:limit]
+
+    def to_matches(self, mention: str, found: List[tuple]) -> List[ValueMatch]:
+        matches = []
+        for entry_id, score in found:
+            table_name, col_name, value, _ = self.entries[entry_id]
+            matches.append(ValueMatch(mention, table_name, col_name, value, round(score, 3)))
+        return matches
+
+    def fuzzy_candidates(self, mention: str, max_values: int = 3) -> List[tuple]:
+        mention_grams = trigrams(mention)
+        overlap = defaultdict(int)
+        for gram in mention_grams:
+            for entry_id in self.grams.get(gram, ()):
+                overlap[entry_id] += 1
+        scored = []
+        for entry_id, shared in overlap.items():
+            score = 2 * shared / (len(mention_grams) + len(trigrams(self.entries[entry_id][3])))
+            if score >= self.min_similarity:
+                scored.append((entry_id, score))
+        scored.sort(key=lambda c: (-c[1], c[0]))
+
+        # Keep every column holding one of the best few distinct values
+        values, found = [], []
+        for entry_id, score in scored:
+            normalized = self.entries[entry_id][3]
+            if normalized not in values:
+                if len(values) >= max_values:
+                    break
+                values.append(normalized)
+            found.append((entry_id, score))
+        return found
+
+    def format_hints(self, matches: List[ValueMatch]) -> str:
+        return "\n".join(f"{m.table}.{m.column} = '{m.value}' (mentioned as \"{m.mention}\")" for m in matches)
+
+    def save(self, file_path: str):
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        data = {
+            "built_at": self.built_at,
+            "max_distinct": self.max_distinct,
+            "sample_rows": self.sample_rows,
+            "columns": self.columns
+        }
+        with open(file_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, file_path: str, **kwargs):
+        with open(file_path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        kwargs.setdefault('max_distinct', data.get('max_distinct', 300))
+        kwargs.setdefault('sample_rows', data.get('sample_rows', 100000))
+        index = cls(data.get('columns', {}), **kwargs)
+        index.built_at = data.get('built_at', 0.0)
+        return index
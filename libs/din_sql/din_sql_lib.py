@@ -39,6 +39,9 @@ class DIN_SQL:
         self.db_connection = None
         self.db_engine_obj = None
         self.sql_dialect = None
+        # Catalog introspected once per connection, and rendered prompt strings per db_name
+        self.catalog = None
+        self.rendered = {}
         self.model_id = bedrock_model_id # "anthropic.claude-v2"
         self.max_tokens_to_sample = 8000
         self.token_summary = {
@@ -78,6 +81,7 @@ class DIN_SQL:
             athena_engine = sa.create_engine(athena_connection_str) 
             self.db_connection = athena_engine.connect()
             self.sql_dialect = 'presto'
+            self.refresh_catalog()
             logger.info("connected to database successfully.")
         except sa.exc.SQLAlchemyError as e:
             logger.error(f"SQLAlchemy error: {e}")
@@ -98,6 +102,7 @@ class DIN_SQL:
                 url=database_uri
             )
             self.db_connection = db_engine_obj.connect()
+            self.refresh_catalog()
             logger.info("connected to database successfully.")
         except sa.exc.SQLAlchemyError as e:
             logger.error(f"SQLAlchemy error: {e}")
@@ -288,34 +293,82 @@ class DIN_SQL:
         return prompt
 
 
+    def refresh_catalog(self):
+        """
+        Drops the cached catalog and rendered strings, so the next prompt re-inspects the database.
+        Call it after the schema changes.
+        """
+        self.catalog = None
+        self.rendered = {}
+
+
+    def load_catalog(self):
+        """
+        Inspects every schema once: columns, primary keys and foreign keys of all tables.
+        Uses the batched get_multi_* calls where the dialect provides them.
+        :return: {schema: {table: {"columns": [...], "primary_key": [...], "foreign_keys": [...]}}}
+        """
+        if self.catalog is not None:
+            return self.catalog
+
+        inspector = sa.inspect(self.db_connection)
+        catalog = {}
+        for schema in inspector.get_schema_names():
+            if schema == 'information_schema':
+                continue
+            tables = inspector.get_table_names(schema=schema)
+            if hasattr(inspector, 'get_multi_columns'):
+                columns = {table: cols for (_, table), cols in inspector.get_multi_columns(schema=schema).items()}
+                pks = {table: pk for (_, table), pk in inspector.get_multi_pk_constraint(schema=schema).items()}
+                fks = {table: fk for (_, table), fk in inspector.get_multi_foreign_keys(schema=schema).items()}
+            else:
+                columns = {table: inspector.get_columns(table, schema=schema) for table in tables}
+                pks = {table: inspector.get_pk_constraint(table, schema=schema) for table in tables}
+                fks = {table: inspector.get_foreign_keys(table, schema=schema) for table in tables}
+            catalog[schema] = {
+                table: {
+                    "columns": [column['name'] for column in columns.get(table, [])],
+                    "primary_key": (pks.get(table) or {}).get('constrained_columns') or [],
+                    "foreign_keys": fks.get(table, [])
+                } for table in tables
+            }
+        logger.info(f"loaded catalog of {sum(len(tables) for tables in catalog.values())} tables in schemas {list(catalog)}")
+        self.catalog = catalog
+        return catalog
+
+
+    def catalog_tables(self, db_name=None):
+        """
+        The tables of `db_name`, or of every schema if it is not given or not found.
+        :return: A list of (table_name, table_info) pairs.
+        """
+        catalog = self.load_catalog()
+        if db_name and db_name in catalog:
+            return list(catalog[db_name].items())
+        logger.info(f"No database specified or not found in schemas {list(catalog)}. Using every schema.")
+        return [item for tables in catalog.values() for item in tables.items()]
+
+
+    def render(self, kind, db_name, make):
+        key = (kind, db_name)
+        if key not in self.rendered:
+            self.rendered[key] = make(self.catalog_tables(db_name))
+        return self.rendered[key]
+
+
     def find_foreign_keys(self, db_name):
         """
         Finds the foreign keys of a given database.
         :param db_name: The name of the database.
         :return: A string of the foreign keys.
         """
-        inspector = sa.inspect(self.db_connection)
-        schemas = inspector.get_schema_names()
-        output = "["
-        if db_name and db_name in schemas:
-            for table_name in inspector.get_table_names(schema=db_name):
-                for fk in inspector.get_foreign_keys(table_name):
-
-                    output += (
-                        f"{table_name}.{fk['constrained_columns'][0]} = {fk['referred_table']}.{fk['referred_columns'][0]},"
-                    )
-        else:
-            for schema in schemas:
-                if schema != 'information_schema':
-                    for table_name in inspector.get_table_names(schema=schema):
-                        for fk in inspector.get_foreign_keys(table_name):
-
-                            output += (
-                                f"{table_name}.{fk['constrained_columns'][0]} = {fk['referred_table']}.{fk['referred_columns'][0]},"
-                            )
-        
-        output = output[:-1] + "]"
-        return output if len(output) > 2 else "[]"
+        def make(tables):
+            links = [f"{table_name}.{constrained} = {fk['referred_table']}.{referred}"
+                     for table_name, table in tables
+                     for fk in table['foreign_keys']
+                     for constrained, referred in zip(fk['constrained_columns'], fk['referred_columns'])]
+            return "[" + ",".join(links) + "]"
+        return self.render('foreign_keys', db_name, make)
 
 
     def find_fields(self, db_name=None):
@@ -324,32 +377,10 @@ class DIN_SQL:
         :param db_name: The name of the database. 
         :return: A string of the fields.
         """
-        inspector = sa.inspect(self.db_connection)
-        schemas = inspector.get_schema_names()
-        output = ""
-        if db_name and db_name in schemas:
-            logger.info(f"database name specified and found, inspecting only '{db_name}'")
-            tables = inspector.get_table_names(schema=db_name)
-            for table_name in tables:
-                output += f"Table {table_name}, columns = ["
-                for column in inspector.get_columns(table_name, schema=db_name):
-                    output += f"{column['name']},"
-                output = output[:-1]
-                output += "]\n"
-        else:
-            logger.info(f"No database specified or not found in schemas {schemas}. Inspecting everything.")
-            for schema in schemas:
-                if schema != 'information_schema':
-                    tables = inspector.get_table_names(schema=schema)
-                    print(f"Tables:\n{tables}")
-                    for table_name in tables:
-                        print(f"Processing table:\n{table_name}")
-                        output += f"Table {table_name}, columns = ["
-                        for column in inspector.get_columns(table_name, schema=schema):
-                            output += f"{column['name']},"
-                        output = output[:-1]
-                        output += "]\n"
-        return output if len(output) > 2 else "[]"
+        def make(tables):
+            output = "".join(f"Table {table_name}, columns = [{','.join(table['columns'])}]\n" for table_name, table in tables)
+            return output if len(output) > 2 else "[]"
+        return self.render('fields', db_name, make)
 
 
     def find_primary_keys(self, db_name=None, verbose=False):
@@ -358,30 +389,11 @@ class DIN_SQL:
         :param db_name: The name of the database.
         :return: A string of the primary keys.
         """
-        inspector = sa.inspect(self.db_connection)
-        schemas = inspector.get_schema_names()
-        output = ""
-        if db_name and db_name in schemas:
-            logger.info(f"database name specified and found, inspecting PKs only in '{db_name}'")
-            tables = inspector.get_table_names(schema=db_name)
-            for table_name in tables:
-                #logger.info(f"getting PKs for table {table_name}")
-                for pk in inspector.get_pk_constraint(table_name, schema=db_name):
-                    if type(pk) == dict and 'constrained_columns' in pk.keys():
-                        output += f"{table_name}.{pk['constrained_columns'][0]},"
-            output = output[:-1]
-            output += "]\n"
-        else:
-            for schema in schemas:
-                if schema != 'information_schema':
-                    for table_name in inspector.get_table_names(schema=schema):
-                        #logger.info(f"getting PKs for table {table_name}")
-                        for pk in inspector.get_pk_constraint(table_name, schema=schema):
-                            if type(pk) == dict and 'constrained_columns' in pk.keys():
-                                output += f"{table_name}.{pk['constrained_columns'][0]},"
-            output = output[:-1]
-            output += "]\n"
-        return output if len(output) > 2 else "[]"
+        def make(tables):
+            # Every column of a composite key, not just the first
+            keys = [f"{table_name}.{column}" for table_name, table in tables for column in table['primary_key']]
+            return "[" + ",".join(keys) + "]\n" if keys else "[]"
+        return self.render('primary_keys', db_name, make)
 
 
     def debugger(self, test_sample_text, database, sql, sql_tag_start='```sql', sql_tag_end='```',sql_dialect='MySQL'):
@@ -627,28 +639,8 @@ class DIN_SQL:
         return SQL
     
     def find_tables(self,db_name): 
-       
-        inspector = sa.inspect(self.db_connection)
-        schemas = inspector.get_schema_names()
-        output = []
-
-        for schema in schemas:
-            if schema == db_name:
-                for table_name in inspector.get_table_names(schema=schema):
-                    output.append(table_name)
-        return output  
+        return list(self.load_catalog().get(db_name, {}))
 
     def get_schema(self,db_name,input_table_name): 
-       
-        inspector = sa.inspect(self.db_connection)
-        schemas = inspector.get_schema_names()
-        output = ""
-
-        for schema in schemas:
-            if schema == db_name:
-                for table_name in inspector.get_table_names(schema=schema):
-                    if  table_name ==  input_table_name :
-                        for column in inspector.get_columns(table_name, schema=schema):    
-                            output += f"{column['name']}" + "|"                  
-          
-        return output
+        table = self.load_catalog().get(db_name, {}).get(input_table_name)
+        return "".join(f"{column}|" for column in table['columns']) if table else ""